@@ -1,34 +1,37 @@
 import os
 import sys
+import contextlib
 import logging
-from datetime import datetime
-import subprocess
+import time
+from array import array
 # PyQt6 Imports
 from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
-                             QLabel, QPushButton, QFileDialog, QTreeWidget, QTreeWidgetItem,
+                             QLabel, QPushButton, QFileDialog, QTreeView,
                              QSplitter, QFrame, QTextEdit, QGroupBox, QHeaderView, QMenu,
-                             QMessageBox, QToolTip, QScrollArea, QSizePolicy, QLineEdit,
-                             QTreeWidgetItemIterator, QStyle)
-from PyQt6.QtCore import (Qt, QSize, pyqtSignal, QThread, QPoint, QTimer, QUrl, 
-                          QStandardPaths)
-from PyQt6.QtGui import (QIcon, QFont, QColor, QBrush, QDragEnterEvent, QDropEvent, 
-                          QAction, QMouseEvent)
+                             QMessageBox, QSizePolicy, QLineEdit, QPlainTextEdit,
+                             QStyle, QSpinBox, QCheckBox, QComboBox, QDialog)
+from PyQt6.QtCore import (Qt, pyqtSignal, QThread, QPoint, QTimer,
+                          QStandardPaths, QFileSystemWatcher, QAbstractItemModel, QModelIndex,
+                          QObject, QRunnable, QThreadPool)
+from PyQt6.QtGui import (QIcon, QFont, QColor, QDragEnterEvent, QDropEvent,
+                          QAction)
+# Qt-free core (scanning, selection, formatting), shared with the command line
+from folder_mapper_core import (DEFAULT_SCAN_WORKERS, MAX_SCAN_WORKERS, PREFETCH_DEPTH,
+                                TREE_BRANCH, TREE_LAST, TREE_PIPE, TREE_SPACE, join_nested,
+                                ProgressSnapshot, format_progress, scan_directory, ScanIndex,
+                                ListingCache, DirectoryPrefetcher, SEL_EXCLUDE, SELECTION_GLYPHS,
+                                SelectionTrie, StructureMapper, LOG_JSON_ENV, LOG_LEVEL_ENV,
+                                hot_log, parse_log_level, setup_logging, format_size, format_totals,
+                                MAP_FORMAT_TEXT, available_compressions, IgnoreRules,
+                                Instrumentation, ProfileCapture, format_diagnostics,
+                                NodeStore, NameIndex, ROOT_NODE, FLAG_DIR, FLAG_LOADED, FLAG_HIDDEN,
+                                FLAG_MESSAGE, FLAG_REMOVED)
 
 
 # ─────────────────────────────────────────────────────────────────────────────
 # Constantes y Configuración Global
 # ─────────────────────────────────────────────────────────────────────────────
 
-# Configuración del logging: se registran eventos en un archivo y en la salida estándar
-logging.basicConfig(
-    level=logging.DEBUG, # Cambiado a DEBUG para ver el mensaje de diagnóstico
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('mapper.log', encoding='utf-8'),
-        logging.StreamHandler()
-    ]
-)
-
 # Colores y estilos
 COLOR_PRIMARY = "#2B579A"
 COLOR_SECONDARY = "#1C3D6B"
@@ -45,13 +48,54 @@ COLOR_SELECTED_BACKGROUND = "#E0E0E0" # Nuevo color para fondo de ítems selecci
 MIN_CONTROL_PANEL_WIDTH = 280
 FOLDER_PATH_DISPLAY_HEIGHT = 35
 
+# Carga del árbol
+LOADER_THREADS = 4 # Carpetas que se listan a la vez al expandir el árbol
+
+# Cancelación y cierre
+SHUTDOWN_WAIT_MS = 5000 # Espera máxima al cerrar para que el mapeo en curso se detenga
+
+# Precarga especulativa (opcional)
+PREFETCH_TICK_MS = 25 # Intervalo de los pasos de precarga mientras la interfaz está ociosa
+PREFETCH_FRESH_SECONDS = 30 # Antigüedad máxima de un listado en caché para adjuntarlo al expandir sin volver a listar
+
+# Observación de cambios en disco
+WATCH_DEBOUNCE_MS = 300 # Espera para agrupar ráfagas de cambios antes de aplicarlos
+WATCH_MAX_DIRECTORIES = 4096 # Límite de carpetas observadas (los observadores del sistema son finitos)
+
+# Árbol virtual
+COLUMN_NAME, COLUMN_TYPE, COLUMN_INCLUDE, COLUMN_TOTAL = 0, 1, 2, 3
+TREE_HEADERS = ["Estructura", "Tipo", "Incluir", "Total"]
+TOTAL_HEADER_TOOLTIP = "Tamaño de todo el contenido incluido de cada carpeta, según el último mapa generado"
+FETCH_BATCH_SIZE = 1000 # Filas que el modelo expone a la vista en cada fetchMore
+INSERT_FIRST_CHUNK = 200 # Elementos de un listado que se adjuntan de inmediato (la primera pantalla)
+INSERT_CHUNK_SIZE = 500 # Elementos por tramo al adjuntar el resto de un listado grande
+INSERT_FRAME_BUDGET_MS = 8 # Tiempo máximo por pasada del bucle de eventos para adjuntar tramos
+
+# Formatos de salida (etiqueta, formato del núcleo)
+OUTPUT_FORMAT_LABELS = [("Texto (.txt)", MAP_FORMAT_TEXT), ("NDJSON (.ndjson)", "ndjson"),
+                        ("CSV (.csv)", "csv"), ("JSON anidado (.json)", "json")]
+
+# Registro de eventos
+LOG_FILE = "mapper.log" # En la carpeta de trabajo
+
+# Filtro
+FILTER_DEBOUNCE_MS = 200 # Pausa de escritura antes de aplicar el filtro
+
+# Reglas de exclusión
+IGNORE_PATTERNS_HEIGHT = 70 # Alto del cuadro de patrones (unas cuatro líneas)
+IGNORE_PATTERNS_PLACEHOLDER = "node_modules/\n.git/\n__pycache__/\n*.pyc"
+
+# Diagnóstico
+DIAGNOSTICS_DIALOG_SIZE = (820, 560) # Ancho y alto iniciales del informe
+DIAGNOSTICS_FILE = "folder_mapper-diagnostico.json" # Nombre propuesto al exportar
+
 # Mensajes de estado
 STATUS_READY = "Estado: Listo"
 STATUS_FOLDER_LOADED = "Carpeta cargada exitosamente"
 STATUS_FILE_GENERATED = "Archivo generado: {}"
 STATUS_ERROR_PREFIX = "Error: {}"
-STATUS_PROCESSING_ITEM = "Procesando: {}" # Nuevo mensaje de estado para ítems
 STATUS_LOADING_DIRECTORY = "Cargando directorio: {}" # Nuevo mensaje de estado para carga de árbol
+STATUS_RULES_APPLIED = "Reglas de exclusión aplicadas"
 
 # Estilos CSS consolidados (No change needed for PyQt6)
 APP_STYLESHEET = f"""
@@ -102,11 +146,11 @@ APP_STYLESHEET = f"""
         font-size: 16pt;
         font-weight: bold;
     }}
-    QTreeWidget {{
+    QTreeView {{
         font-size: 9pt;
         border: 1px solid {COLOR_BORDER};
     }}
-    QTreeWidget::item:selected {{
+    QTreeView::item:selected {{
         /* Style for the item with focus, not the logical selection for mapping */
         background-color: {COLOR_PRIMARY};
         color: white;
@@ -135,52 +179,55 @@ def get_resource_path(relative_path):
 
     return os.path.join(base_path, "recursos", relative_path)
 
-# Función auxiliar para formatear el tamaño de archivo - No change needed
-def format_size(size_in_bytes):
-    """Convierte el tamaño en bytes a un formato legible (B, KB, MB, GB)."""
-    if size_in_bytes is None:
-        return "N/A"
-    if size_in_bytes < 1024:
-        return f"{size_in_bytes} B"
-    elif size_in_bytes < 1024 * 1024:
-        return f"{size_in_bytes / 1024:.2f} KB"
-    elif size_in_bytes < 1024 * 1024 * 1024:
-        return f"{size_in_bytes / (1024 * 1024):.2f} MB"
-    else:
-        return f"{size_in_bytes / (1024 * 1024 * 1024):.2f} GB"
+# Configuración del logging: se registran eventos en un archivo y en la salida estándar
+def configure_logging():
+    """
+    Sets up logging for the application; called by the entry point, not at import.
+    The level comes from FOLDER_MAPPER_LOG_LEVEL (INFO by default) and
+    FOLDER_MAPPER_LOG_JSON adds a JSON log; writes run on a background thread.
+    """
+    return setup_logging(parse_log_level(os.environ.get(LOG_LEVEL_ENV)), log_file=LOG_FILE,
+                         json_file=os.environ.get(LOG_JSON_ENV))
+
 
 # ─────────────────────────────────────────────────────────────────────────────
 # Clase para operaciones asíncronas en un hilo separado (Mapeo de Estructura)
 # ─────────────────────────────────────────────────────────────────────────────
 
 class MappingWorker(QThread):
-    # Signals remain the same
+    """Runs a StructureMapper (folder_mapper_core) off the GUI thread and reports through signals."""
     finished = pyqtSignal(str, bool)
+    cancelled = pyqtSignal(str) # Path of the partial map, or "" when it was discarded
     status_update = pyqtSignal(str, str)
+    progress = pyqtSignal(object) # ProgressSnapshot, throttled to PROGRESS_UPDATE_INTERVAL
 
-    def __init__(self, root_path, tree_data):
+    def __init__(self, root_path, selection=None, workers=1, lister=scan_directory, record_totals=None,
+                 fmt=MAP_FORMAT_TEXT, compression=None, rules=None, instrumentation=None, profile=False):
         super().__init__()
         self.root_path = root_path
-        self.tree_data = tree_data # Diccionario con paths como claves
+        self.fmt = fmt
+        self.compression = compression
+        self.capture = ProfileCapture() if profile else None # Its report is read once the worker finishes
+        self.mapper = StructureMapper(root_path, selection, workers, lister, on_progress=self.progress.emit,
+                                      record_totals=record_totals, rules=rules, instrumentation=instrumentation)
+
+    def cancel(self, keep_partial=True):
+        """Asks the traversal to stop after the current entry. Safe to call from any thread."""
+        self.mapper.cancel(keep_partial)
 
     def run(self):
         """Ejecuta el mapeo en el hilo de trabajo."""
         try:
-            # Generate structure using logic that traverses FS and checks tree_data (with paths)
-            estructura = self.mapear_estructura(self.root_path)
-
-            # Determine output path
-            output_name = f"{os.path.basename(self.root_path)}-estructura.txt"
-            output_path = os.path.join(self.root_path, output_name)
-
-            # Write output file
-            with open(output_path, "w", encoding="utf-8") as f:
-                f.write(f"ESTRUCTURA DE CARPETAS\n{'='*25}\n")
-                f.write(f"Ruta: {self.root_path}\n")
-                f.write(f"Fecha: {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}\n\n")
-                f.write(estructura)
+            with self.capture or contextlib.nullcontext(): # cProfile follows this thread, where the traversal runs
+                output_path = self.mapper.write(fmt=self.fmt, compression=self.compression)
+            if self.mapper.truncated:
+                self._finish_cancelled(output_path)
+                return
 
-            logging.info(f"Archivo de estructura generado: {output_path}")
+            logging.info("Archivo de estructura generado: %s", output_path,
+                         extra={"fields": {"event": "map_written", "path": output_path,
+                                           "totals": self.mapper.root_totals._asdict(),
+                                           **self.mapper.progress.snapshot()._asdict()}})
             # Emit final success status
             self.status_update.emit(STATUS_FILE_GENERATED.format(output_path), COLOR_SUCCESS)
             self.finished.emit(output_path, True)
@@ -196,150 +243,411 @@ class MappingWorker(QThread):
             self.status_update.emit(STATUS_ERROR_PREFIX.format(str(e)), COLOR_ERROR)
             self.finished.emit(str(e), False)
 
-    def mapear_estructura(self, dir_path, prefix=""):
-        """Recursive function to map the directory structure respecting selections."""
-        try:
-            items = []
-            # Added error handling for os.listdir
-            try:
-                dir_contents = os.listdir(dir_path)
-            except PermissionError:
-                logging.warning(f"Permiso denegado para listar contenido en: {dir_path}")
-                return f"{prefix}└── [Acceso denegado]"
-            except Exception as e:
-                logging.warning(f"Error al listar contenido de {dir_path}: {e}")
-                return f"{prefix}└── [Error al listar: {str(e)}]"
-
-            # Sort items (directories first, then alphabetically)
-            sorted_contents = sorted(dir_contents, key=lambda x: (not os.path.isdir(os.path.join(dir_path, x)), x.lower()))
-
-            for item_name in sorted_contents:
-                full_path = os.path.join(dir_path, item_name)
-
-                # Emit status update for the current item
-                self.status_update.emit(STATUS_PROCESSING_ITEM.format(item_name), COLOR_PRIMARY) # Emit intermediate status
-
-                # Check selection status directly using path as key in tree_data
-                item_data = self.tree_data.get(full_path)
-
-                # If item not in tree_data (e.g., not dynamically loaded), assume selected by default
-                # If in tree_data, use its 'selected' status
-                selected = item_data.get("selected", True) if item_data else True
-
-                if not selected:
-                    continue
-
-                # Safely check if the element is a directory
-                is_dir = False
-                try:
-                    is_dir = os.path.isdir(full_path)
-                except Exception as e:
-                    logging.warning(f"Error checking if path is directory {full_path}: {e}")
-                    is_dir = False # Treat as file on error
-
-                items.append((item_name, is_dir, full_path)) # Store full_path too
-
-            result = []
-            for index, (name, is_dir, full_item_path) in enumerate(items): # Use full_path from items
-                is_last = index == len(items) - 1
-                line = "└── " if is_last else "├── "
-                next_prefix = "    " if is_last else "│   " # Adjusted spacing
-
-                details = ""
-                try:
-                    if is_dir:
-                        # Add item count for directories
-                        try:
-                            num_items = len(os.listdir(full_item_path))
-                            details = f" ({num_items} items)"
-                        except PermissionError:
-                            details = " [Acceso denegado]"
-                        except Exception as e:
-                            details = f" [Error al contar: {str(e)}]"
-                            logging.warning(f"Could not count items in {full_item_path}: {e}")
-                    else:
-                        # Add size for files
-                        try:
-                            size_bytes = os.path.getsize(full_item_path)
-                            details = f" ({format_size(size_bytes)})"
-                        except PermissionError:
-                            details = " [Acceso denegado]"
-                        except Exception as e:
-                            details = f" [Error al obtener tamaño: {str(e)}]"
-                            logging.warning(f"Could not get size for {full_item_path}: {e}")
-                except Exception as e:
-                    details = f" [Error detalles: {str(e)}]"
-                    logging.warning(f"Unexpected error getting details for {full_item_path}: {e}")
-
-                result.append(f"{prefix}{line}{'📁 ' if is_dir else '📄 '}{name}{details}") # Add details to line
-
-                if is_dir:
-                    # Add explicit check before recursive call
-                    try:
-                        if os.path.isdir(full_item_path): # Use full_item_path
-                            sub_result = self.mapear_estructura(full_item_path, prefix + next_prefix) # Use full_item_path
-                            if sub_result:
-                                result.append(sub_result)
-                        else:
-                            logging.warning(f"Skipping recursive call for non-directory (check failed): {full_item_path}")
-                    except Exception as e:
-                        logging.warning(f"Error checking directory before recursive call {full_item_path}: {e}")
-                        # result.append(f"{prefix}{next_prefix}└── [Error al verificar directorio: {str(e)}]")
-
-            return "\n".join(result)
-        except PermissionError:
-            # Catches PermissionError if it occurs when listing the main directory (dir_path)
-            logging.warning(f"Permiso denegado para mapear estructura en: {dir_path}")
-            return f"{prefix}└── [Acceso denegado]"
-        except Exception as e:
-            logging.exception(f"Error inesperado en mapear_estructura para {dir_path}:")
-            return f"{prefix}└── [Error: {str(e)}]"
+    def _finish_cancelled(self, output_path):
+        """Reports the cancellation (the mapper already kept or removed the partial map)."""
+        entries = self.mapper.progress.entries
+        if self.mapper.keep_partial:
+            logging.info(f"Mapeo cancelado tras {entries} elementos; mapa parcial en {output_path}")
+            self.status_update.emit(f"Mapeo cancelado: mapa parcial ({entries} elementos) en {output_path}", COLOR_ERROR)
+            self.cancelled.emit(output_path)
+            return
+        logging.info(f"Mapeo cancelado tras {entries} elementos; mapa parcial descartado")
+        self.status_update.emit("Mapeo cancelado", COLOR_ERROR)
+        self.cancelled.emit("")
 
 
 # ─────────────────────────────────────────────────────────────────────────────
-# Clase para la carga asíncrona de directorios al expandir el árbol
+# Carga asíncrona de directorios al expandir el árbol (pool priorizado y cancelable)
 # ─────────────────────────────────────────────────────────────────────────────
 
-class DirectoryLoaderWorker(QThread):
-    # Signal definition needs adjustment for PyQt6? No, list is fine.
-    finished = pyqtSignal(QTreeWidgetItem, list, str) # parent item, list of (name, is_dir, full_path), error message
-    status_update = pyqtSignal(str, str) # For updating GUI status
+class _DirectoryLoadTask(QRunnable):
+    """Lists one directory on a pool thread and reports back through its DirectoryLoaderPool."""
 
-    def __init__(self, parent_item, dir_path):
+    def __init__(self, pool, node, dir_path, lister):
         super().__init__()
-        self.parent_item = parent_item
+        self.setAutoDelete(False) # Owned by the pool so queued tasks can be taken back
+        self.pool = pool
+        self.node = node
         self.dir_path = dir_path
+        self.lister = lister
+        self.cancelled = False # Set from the GUI thread when the load is no longer wanted
+        self.queued_at = time.perf_counter()
+        self.finished_at = None
 
     def run(self):
-        """Loads directory content in a separate thread."""
-        loaded_items_data = []
+        entries = []
         error_message = ""
-        try:
-            self.status_update.emit(STATUS_LOADING_DIRECTORY.format(os.path.basename(self.dir_path)), COLOR_PRIMARY) # Update status
+        instrumentation = self.pool.instrumentation
+        if instrumentation:
+            started_at = time.perf_counter()
+            instrumentation.add("load.wait", started_at - self.queued_at)
+        if not self.cancelled: # Cancelled while waiting: skip the listing, still report back
+            try:
+                entries = self.lister(self.dir_path) # Sorted entries, one stat per item
+            except PermissionError:
+                hot_log.warning("Permiso denegado para cargar directorio en worker: %s", self.dir_path)
+                error_message = f"[Acceso denegado al cargar: {os.path.basename(self.dir_path)}]"
+            except Exception as e:
+                logging.exception("Error inesperado al cargar directorio en worker %s:", self.dir_path)
+                error_message = f"[Error al cargar: {str(e)}]"
+        if instrumentation:
+            self.finished_at = time.perf_counter()
+            instrumentation.add("load.list", self.finished_at - started_at)
+        self.pool._task_done.emit(self, entries, error_message) # Queued to the GUI thread
+
+
+class DirectoryLoaderPool(QObject):
+    """
+    Loads directories for the tree on a persistent QThreadPool.
+
+    Several listings run at once; queued requests start by priority, which by
+    default favours the most recent request (the folder the user just expanded).
+    Loads can be cancelled per node: queued ones are taken back from the pool and
+    the results of running ones are dropped. At most one load per node is pending.
+    """
+    finished = pyqtSignal(object, str, list, str) # node id, path, list of ScanEntry, error message
+    _task_done = pyqtSignal(object, list, str) # Task, entries, error message (emitted from pool threads)
+
+    def __init__(self, lister=scan_directory, max_threads=LOADER_THREADS, parent=None):
+        super().__init__(parent)
+        self.lister = lister
+        self.instrumentation = None # Instrumentation timing the loads (wait, list, delivery); None when off
+        self._pool = QThreadPool(self)
+        self._pool.setMaxThreadCount(max_threads)
+        self._tasks = {} # node -> its pending task (queued or running)
+        self._alive = set() # Tasks handed to the pool and not yet reported back
+        self._sequence = 0
+        self._task_done.connect(self._on_task_done)
+
+    def request(self, node, dir_path, priority=None) -> bool:
+        """
+        Queues the load of node (dir_path). Returns False when it is already running.
+        Without priority the request goes ahead of every earlier one; a node already
+        queued is moved to its new priority.
+        """
+        self._sequence += 1
+        task = self._tasks.get(node)
+        if task is not None:
+            if not self._pool.tryTake(task):
+                return False # Running; its result is on the way
+            self._alive.discard(task)
+        task = _DirectoryLoadTask(self, node, dir_path, self.lister)
+        self._tasks[node] = task
+        self._alive.add(task)
+        self._pool.start(task, self._sequence if priority is None else priority)
+        return True
+
+    def is_pending(self, node) -> bool:
+        return node in self._tasks
+
+    def pending_nodes(self):
+        return list(self._tasks)
+
+    def cancel(self, nodes):
+        """Cancels the pending loads of nodes; their results are never emitted."""
+        for node in nodes:
+            task = self._tasks.pop(node, None)
+            if task is None:
+                continue
+            if self._pool.tryTake(task):
+                self._alive.discard(task)
+            else:
+                task.cancelled = True # Running (or just starting): drop its result on arrival
 
-            dir_contents = os.listdir(self.dir_path)
-            sorted_contents = sorted(dir_contents, key=lambda x: (not os.path.isdir(os.path.join(self.dir_path, x)), x.lower()))
+    def cancel_all(self):
+        self.cancel(self.pending_nodes())
 
-            for item_name in sorted_contents:
-                full_path = os.path.join(self.dir_path, item_name)
-                is_dir = False
-                try:
-                    is_dir = os.path.isdir(full_path)
-                except Exception as e:
-                    logging.warning(f"Error checking if path is directory in worker {full_path}: {e}")
-                    is_dir = False # Treat as file on error
+    def shutdown(self, timeout_ms=1000):
+        """Cancels everything and waits up to timeout_ms for running listings."""
+        self.cancel_all()
+        return self._pool.waitForDone(timeout_ms)
 
-                loaded_items_data.append((item_name, is_dir, full_path))
+    def _on_task_done(self, task, entries, error_message):
+        if self.instrumentation and task.finished_at is not None:
+            self.instrumentation.add("load.deliver", time.perf_counter() - task.finished_at) # Event loop latency
+        self._alive.discard(task)
+        if self._tasks.get(task.node) is task: # Otherwise cancelled or superseded
+            del self._tasks[task.node]
+            self.finished.emit(task.node, task.dir_path, entries, error_message)
 
-        except PermissionError:
-            logging.warning(f"Permiso denegado para cargar directorio en worker: {self.dir_path}")
-            error_message = f"[Acceso denegado al cargar: {os.path.basename(self.dir_path)}]"
-        except Exception as e:
-            logging.exception(f"Error inesperado al cargar directorio en worker {self.dir_path}:")
-            error_message = f"[Error al cargar: {str(e)}]"
 
-        # Emit signal upon completion, passing loaded data or error message
-        self.finished.emit(self.parent_item, loaded_items_data, error_message)
+# ─────────────────────────────────────────────────────────────────────────────
+# Modelo virtual del árbol (QAbstractItemModel sobre el NodeStore del núcleo)
+# ─────────────────────────────────────────────────────────────────────────────
+
+class FolderTreeModel(QAbstractItemModel):
+    """
+    Lazy model over a NodeStore for the tree columns.
+
+    Loaded directory contents are attached with set_children() and exposed to the
+    view FETCH_BATCH_SIZE rows at a time through canFetchMore()/fetchMore(), so a
+    huge directory only creates the rows being looked at. The internal pointer of
+    an index is the child array of its parent node (one object per directory),
+    so no Python object is kept per row. Display data is computed on demand.
+    Directory totals from the last map are kept per node in totals.
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.store = NodeStore()
+        self.selection = SelectionTrie()
+        self.name_index = NameIndex()
+        self.totals = {} # Directory node -> DirectoryTotals of the last map
+        self._color_selected = QColor(Qt.GlobalColor.black)
+        self._color_deselected = QColor(Qt.GlobalColor.gray)
+        self._color_error = QColor(COLOR_ERROR)
+
+    def reset(self, root_path=None):
+        """Drops every node and starts a new tree for root_path."""
+        self.beginResetModel()
+        self.store = NodeStore(root_path)
+        self.selection = SelectionTrie(root_path)
+        self.name_index = NameIndex()
+        self.totals = {}
+        self.endResetModel()
+
+    def node_from_index(self, index: QModelIndex) -> int:
+        return index.internalPointer()[index.row()] if index.isValid() else ROOT_NODE
+
+    def selection_state(self, node: int) -> int:
+        """SEL_* state of node, resolved against the selection trie (O(depth))."""
+        return self.selection.state(self.store.name_chain(node))
+
+    def is_exposed(self, node: int) -> bool:
+        """True when the view already has the row of node (every ancestor row fetched)."""
+        store = self.store
+        while node != ROOT_NODE:
+            parent_node = store.parents[node]
+            if store.rows[node] >= store.fetched[parent_node]:
+                return False
+            node = parent_node
+        return True
+
+    def index_for_node(self, node: int, column: int = COLUMN_NAME) -> QModelIndex:
+        if node == ROOT_NODE:
+            return QModelIndex()
+        store = self.store
+        return self.createIndex(store.rows[node], column, store.children[store.parents[node]])
+
+    # --- QAbstractItemModel interface ---
+    def index(self, row, column, parent=QModelIndex()):
+        parent_node = self.node_from_index(parent)
+        if 0 <= row < self.store.fetched[parent_node] and 0 <= column < len(TREE_HEADERS):
+            return self.createIndex(row, column, self.store.children[parent_node])
+        return QModelIndex()
+
+    def parent(self, index):
+        if not index.isValid():
+            return QModelIndex()
+        return self.index_for_node(self.store.parents[self.node_from_index(index)])
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.column() > 0:
+            return 0
+        return self.store.fetched[self.node_from_index(parent)]
+
+    def columnCount(self, parent=QModelIndex()):
+        return len(TREE_HEADERS)
+
+    def hasChildren(self, parent=QModelIndex()):
+        node = self.node_from_index(parent)
+        if self.store.has(node, FLAG_LOADED):
+            return len(self.store.children[node]) > 0
+        return self.store.has(node, FLAG_DIR) # Expandable until loaded
+
+    def canFetchMore(self, parent):
+        node = self.node_from_index(parent)
+        return self.store.has(node, FLAG_LOADED) and self.store.fetched[node] < len(self.store.children[node])
+
+    def fetchMore(self, parent):
+        node = self.node_from_index(parent)
+        fetched = self.store.fetched[node]
+        count = min(FETCH_BATCH_SIZE, len(self.store.children[node]) - fetched)
+        if count <= 0:
+            return
+        self.beginInsertRows(parent, fetched, fetched + count - 1)
+        self.store.fetched[node] = fetched + count
+        self.endInsertRows()
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        store = self.store
+        node = self.node_from_index(index)
+        flags = store.flags[node]
+        column = index.column()
+        if role == Qt.ItemDataRole.DisplayRole:
+            if column == COLUMN_NAME:
+                return store.names[node]
+            if flags & FLAG_MESSAGE:
+                return None
+            if column == COLUMN_TYPE:
+                return "📁 Directorio" if flags & FLAG_DIR else "📄 Archivo"
+            if column == COLUMN_INCLUDE:
+                return SELECTION_GLYPHS[self.selection_state(node)] # Checked/unchecked/partial box
+            if column == COLUMN_TOTAL and node in self.totals:
+                return format_size(self.totals[node].bytes)
+        elif role == Qt.ItemDataRole.ToolTipRole and column == COLUMN_TOTAL and node in self.totals:
+            return format_totals(self.totals[node])
+        elif role == Qt.ItemDataRole.ForegroundRole and column == COLUMN_NAME:
+            if flags & FLAG_MESSAGE:
+                return self._color_error
+            # Dimmed text color for deselected items
+            excluded = self.selection_state(node) == SEL_EXCLUDE
+            return self._color_deselected if excluded else self._color_selected
+        elif role == Qt.ItemDataRole.UserRole and column == COLUMN_NAME:
+            return store.path(node)
+        return None
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if orientation == Qt.Orientation.Horizontal and role == Qt.ItemDataRole.DisplayRole:
+            return TREE_HEADERS[section]
+        if orientation == Qt.Orientation.Horizontal and role == Qt.ItemDataRole.ToolTipRole and section == COLUMN_TOTAL:
+            return TOTAL_HEADER_TOOLTIP
+        return None
+
+    def invalidate_totals(self, node: int):
+        """Drops the totals of node and its ancestors (their content changed on disk)."""
+        while True:
+            self.totals.pop(node, None)
+            if node == ROOT_NODE:
+                break
+            node = self.store.parents[node]
+
+    def flags(self, index):
+        if not index.isValid():
+            return Qt.ItemFlag.NoItemFlags
+        return Qt.ItemFlag.ItemIsEnabled | Qt.ItemFlag.ItemIsSelectable
+
+    # --- Structure changes ---
+    def set_children(self, node: int, children):
+        """Attaches the loaded child ids of node and exposes the first batch."""
+        store = self.store
+        parent_index = self.index_for_node(node)
+        child_array = store.children[node]
+        if store.fetched[node]:
+            self.beginRemoveRows(parent_index, 0, store.fetched[node] - 1)
+            del child_array[:]
+            store.fetched[node] = 0
+            self.endRemoveRows()
+        child_array[:] = array("i", children) # Same object: indexes keep pointing at it
+        for row, child in enumerate(child_array):
+            store.rows[child] = row
+        store.set_flag(node, FLAG_LOADED)
+        if self.is_exposed(node): # Otherwise the view fetches them once it reaches node
+            self.fetchMore(parent_index)
+
+    def append_children(self, node: int, children):
+        """Appends more child ids to a loaded node (the next chunk of a large listing)."""
+        store = self.store
+        child_array = store.children[node]
+        start = len(child_array)
+        child_array.extend(children)
+        for row in range(start, len(child_array)):
+            store.rows[child_array[row]] = row
+        # While the view holds less than a batch it has no reason to fetch again: expose them
+        if store.fetched[node] == start < FETCH_BATCH_SIZE and self.is_exposed(node):
+            self.fetchMore(self.index_for_node(node))
+
+    def insert_child(self, parent_node: int, position: int, child: int):
+        """Inserts child at position; the view only hears about it inside the exposed range."""
+        store = self.store
+        child_array = store.children[parent_node]
+        fetched = store.fetched[parent_node]
+        exposed = (position < fetched or fetched == len(child_array)) and self.is_exposed(parent_node)
+        if exposed:
+            self.beginInsertRows(self.index_for_node(parent_node), position, position)
+        child_array.insert(position, child)
+        self._renumber(parent_node, position)
+        if exposed:
+            store.fetched[parent_node] = fetched + 1
+            self.endInsertRows()
+
+    def remove_child(self, child: int):
+        store = self.store
+        parent_node, row = store.parents[child], store.rows[child]
+        exposed = row < store.fetched[parent_node]
+        if exposed:
+            self.beginRemoveRows(self.index_for_node(parent_node), row, row)
+        del store.children[parent_node][row]
+        self._renumber(parent_node, row)
+        if exposed:
+            store.fetched[parent_node] -= 1
+            self.endRemoveRows()
+
+    def _renumber(self, parent_node, start):
+        child_array, rows = self.store.children[parent_node], self.store.rows
+        for row in range(start, len(child_array)):
+            rows[child_array[row]] = row
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Panel de diagnóstico (tiempos por fase, carpetas más lentas y perfil)
+# ─────────────────────────────────────────────────────────────────────────────
+
+class DiagnosticsDialog(QDialog):
+    """Shows the window's Instrumentation report (and the last profile) and exports it as JSON."""
+
+    def __init__(self, window):
+        super().__init__(window)
+        self.main_window = window
+        self.setWindowTitle("Diagnóstico de rendimiento")
+        self.resize(*DIAGNOSTICS_DIALOG_SIZE)
+        layout = QVBoxLayout(self)
+
+        self.report_text = QTextEdit()
+        self.report_text.setReadOnly(True)
+        self.report_text.setFont(QFont("Courier New", 9))
+        self.report_text.setLineWrapMode(QTextEdit.LineWrapMode.NoWrap)
+        layout.addWidget(self.report_text)
+
+        buttons_layout = QHBoxLayout()
+        for label, tooltip, slot in (
+                ("Actualizar", "Volver a leer las mediciones", self.refresh),
+                ("Exportar JSON…", "Guardar el informe completo en un archivo JSON", self.export_json),
+                ("Reiniciar mediciones", "Poner a cero los tiempos y la lista de carpetas lentas", self.reset),
+                ("Cerrar", None, self.accept)):
+            button = QPushButton(label)
+            if tooltip:
+                button.setToolTip(tooltip)
+            button.clicked.connect(slot)
+            buttons_layout.addWidget(button)
+        layout.addLayout(buttons_layout)
+        self.refresh()
+
+    def refresh(self):
+        diagnostics = self.main_window.diagnostics()
+        if diagnostics is None:
+            self.report_text.setPlainText("Sin mediciones: active «Medir tiempos por fase» o «Perfilar el mapa» "
+                                          "y use la aplicación (cargar carpetas, vista previa, generar el mapa).")
+            return
+        lines = format_diagnostics(diagnostics["instrumentation"], diagnostics["profile"])
+        cache = diagnostics["listing_cache"]
+        lines += ["", f"Caché de listados: {cache['hits']} aciertos, {cache['misses']} fallos, "
+                      f"{cache['evictions']} desalojos, {cache['listings']} carpetas en memoria"]
+        self.report_text.setPlainText("\n".join(lines))
+
+    def export_json(self):
+        diagnostics = self.main_window.diagnostics()
+        if diagnostics is None:
+            return
+        start_dir = QStandardPaths.standardLocations(QStandardPaths.StandardLocation.DocumentsLocation)[0]
+        path, _ = QFileDialog.getSaveFileName(self, "Exportar diagnóstico", os.path.join(start_dir, DIAGNOSTICS_FILE),
+                                              "JSON (*.json)")
+        if not path:
+            return
+        import json
+        try:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(diagnostics, f, indent=2)
+            logging.info(f"Diagnóstico exportado a {path}")
+        except OSError as e:
+            logging.error(f"No se pudo exportar el diagnóstico a {path}: {e}")
+            QMessageBox.critical(self, "Error al exportar", f"No se pudo guardar el diagnóstico:\n{path}\n\nError: {e}")
+
+    def reset(self):
+        self.main_window.reset_diagnostics()
+        self.refresh()
 
 
 # ─────────────────────────────────────────────────────────────────────────────
@@ -349,13 +657,49 @@ class DirectoryLoaderWorker(QThread):
 class EnhancedFolderMapper(QMainWindow):
     def __init__(self):
         super().__init__()
-        # Dictionary storing: {full_path: {"selected": state, "loaded": bool, "item": QTreeWidgetItem}}
-        self.tree_data = {}
         self.mapping_worker = None # For MappingWorker
-        self.loader_worker = None # For DirectoryLoaderWorker
+        self._status_color = None # Last color applied to the status label
+        self.scan_index = None # ScanIndex for the current root when the persistent index is enabled
+        self.listing_cache = ListingCache() # Shared by the tree, the preview and the workers
+        self.ignore_rules = None # IgnoreRules of the current root, applied to every listing; None when empty
+        self.instrumentation = None # Instrumentation while phase timing is on (see _on_instrumentation_toggled)
+        self._measurements = None # Last Instrumentation created; kept for the report after timing is turned off
+        self._profile_report = None # ProfileCapture report of the last profiled map
+        self._loader_pool = None # DirectoryLoaderPool, created with the first expansion (see loader_pool)
+        self._prefetcher = None # DirectoryPrefetcher, created when background prefetch is enabled
+        self._prefetch_timer = None
+        self._prefetch_dirty = False # Visible directories changed since the last schedule
+        self.fs_watcher = None # QFileSystemWatcher, created when watch mode is enabled
+        self._watched_dirs = {} # Watched path -> node id
+        self._changed_dirs = set() # Directories with pending change notifications
+        self._watch_timer = None
+        self._filter_text = "" # Last applied filter (lowercase)
+        self._filter_names = None # Lowercase names matching it, reused when the query is refined
+        self._visible_nodes = None # Matches plus their ancestors; None when no filter is active
+        self._filter_timer = None
+        self._preview_cache = {} # Directory node -> (prefix, selection context, rendered block)
+        self._pending_inserts = {} # Directory node -> [entries, next position] still to attach
+        self._insert_timer = None
+        self._totals_targets = None # (NodeStore, {directory path: node}) whose totals the running map reports
         self.init_ui()
         self.setAcceptDrops(True) # Enable drag and drop for the main window
 
+    # Optional subsystems are built on first use so the first window paints sooner
+    @property
+    def loader_pool(self):
+        """Thread pool listing directories for tree expansions."""
+        if self._loader_pool is None:
+            self._loader_pool = DirectoryLoaderPool(self._list_directory, parent=self)
+            self._loader_pool.instrumentation = self.instrumentation
+            self._loader_pool.finished.connect(self._on_directory_load_finished)
+        return self._loader_pool
+
+    @property
+    def prefetcher(self):
+        """Idle-time prefetcher of the directories around the viewport."""
+        if self._prefetcher is None:
+            self._prefetcher = DirectoryPrefetcher(self.listing_cache, lister=self._list_directory)
+        return self._prefetcher
 
     def init_ui(self):
         """Initializes the user interface."""
@@ -452,6 +796,11 @@ class EnhancedFolderMapper(QMainWindow):
         browse_btn.clicked.connect(lambda: self.select_folder(None))
         browse_btn.setToolTip("Seleccionar carpeta raíz para análisis")
         folder_layout.addWidget(browse_btn)
+
+        self.index_checkbox = QCheckBox("Índice persistente")
+        self.index_checkbox.setToolTip("Guardar los listados en disco y volver a listar solo las carpetas modificadas")
+        self.index_checkbox.toggled.connect(self._on_index_toggled)
+        folder_layout.addWidget(self.index_checkbox)
         control_layout.addWidget(folder_group)
 
         # View management section
@@ -471,6 +820,16 @@ class EnhancedFolderMapper(QMainWindow):
         view_buttons_layout.addWidget(expand_btn)
         view_buttons_layout.addWidget(collapse_btn)
         view_layout.addLayout(view_buttons_layout)
+
+        self.watch_checkbox = QCheckBox("Observar cambios en disco")
+        self.watch_checkbox.setToolTip("Actualizar el árbol y la vista previa cuando se crean, borran o renombran elementos en las carpetas cargadas")
+        self.watch_checkbox.toggled.connect(self._on_watch_toggled)
+        view_layout.addWidget(self.watch_checkbox)
+
+        self.prefetch_checkbox = QCheckBox("Precarga en segundo plano")
+        self.prefetch_checkbox.setToolTip(f"Listar por adelantado hasta {PREFETCH_DEPTH} niveles por debajo de las carpetas visibles mientras la interfaz está ociosa")
+        self.prefetch_checkbox.toggled.connect(self._on_prefetch_toggled)
+        view_layout.addWidget(self.prefetch_checkbox)
         control_layout.addWidget(view_group)
 
         # Selection section
@@ -498,11 +857,95 @@ class EnhancedFolderMapper(QMainWindow):
         self.filter_input = QLineEdit()
         self.filter_input.setPlaceholderText("Filtrar por nombre...")
         self.filter_input.setToolTip("Escriba para filtrar elementos por nombre")
-        self.filter_input.textChanged.connect(self._apply_filter) # Connect textChanged signal
+        # Debounced: the filter runs once typing pauses for FILTER_DEBOUNCE_MS
+        self._filter_timer = QTimer(self)
+        self._filter_timer.setSingleShot(True)
+        self._filter_timer.timeout.connect(lambda: self._apply_filter(self.filter_input.text()))
+        self.filter_input.textChanged.connect(lambda: self._filter_timer.start(FILTER_DEBOUNCE_MS))
 
         filter_layout.addWidget(self.filter_input)
         control_layout.addWidget(filter_group)
 
+        # Ignore rules section (applied to every listing: tree, preview and map)
+        ignore_group = QGroupBox("EXCLUSIONES")
+        ignore_group.setSizePolicy(QSizePolicy.Policy.Preferred, QSizePolicy.Policy.Minimum)
+        ignore_layout = QVBoxLayout(ignore_group)
+
+        self.ignore_input = QPlainTextEdit()
+        self.ignore_input.setPlaceholderText(IGNORE_PATTERNS_PLACEHOLDER)
+        self.ignore_input.setFixedHeight(IGNORE_PATTERNS_HEIGHT)
+        self.ignore_input.setToolTip("Patrones a ignorar, uno por línea, con la sintaxis de .gitignore ('!' vuelve a incluir).\n"
+                                     "Las carpetas ignoradas no se listan ni se recorren.")
+        ignore_layout.addWidget(self.ignore_input)
+
+        ignore_options_layout = QHBoxLayout()
+        self.gitignore_checkbox = QCheckBox("Respetar .gitignore")
+        self.gitignore_checkbox.setToolTip("Aplicar también los archivos .gitignore que haya en el árbol")
+        ignore_options_layout.addWidget(self.gitignore_checkbox)
+        apply_rules_btn = QPushButton("Aplicar")
+        apply_rules_btn.setToolTip("Volver a cargar el árbol con las reglas (la selección se conserva)")
+        apply_rules_btn.clicked.connect(self._apply_ignore_rules)
+        ignore_options_layout.addWidget(apply_rules_btn)
+        ignore_layout.addLayout(ignore_options_layout)
+        control_layout.addWidget(ignore_group)
+
+        # Mapping options section
+        mapping_group = QGroupBox("GENERACIÓN")
+        mapping_group.setSizePolicy(QSizePolicy.Policy.Preferred, QSizePolicy.Policy.Minimum)
+        mapping_layout = QVBoxLayout(mapping_group)
+
+        workers_layout = QHBoxLayout()
+        workers_layout.addWidget(QLabel("Hilos de escaneo:"))
+        self.workers_spin = QSpinBox()
+        self.workers_spin.setRange(1, MAX_SCAN_WORKERS)
+        self.workers_spin.setValue(DEFAULT_SCAN_WORKERS)
+        self.workers_spin.setToolTip("Número de hilos que listan subcarpetas en paralelo al generar el mapa (1 = secuencial)")
+        workers_layout.addWidget(self.workers_spin)
+        mapping_layout.addLayout(workers_layout)
+
+        format_layout = QHBoxLayout()
+        format_layout.addWidget(QLabel("Formato:"))
+        self.format_combo = QComboBox()
+        for label, fmt in OUTPUT_FORMAT_LABELS:
+            self.format_combo.addItem(label, fmt)
+        self.format_combo.setToolTip("Mapa de texto legible, o registros para otras herramientas (ruta, tipo, tamaño, fecha, nivel)")
+        format_layout.addWidget(self.format_combo)
+        self.compression_combo = QComboBox()
+        self.compression_combo.addItem("Sin comprimir", None)
+        for compression in available_compressions():
+            self.compression_combo.addItem(compression, compression)
+        self.compression_combo.setToolTip("Comprimir el archivo mientras se escribe")
+        format_layout.addWidget(self.compression_combo)
+        mapping_layout.addLayout(format_layout)
+
+        self.partial_checkbox = QCheckBox("Conservar mapa parcial al cancelar")
+        self.partial_checkbox.setToolTip("Al cancelar, guardar lo escrito hasta ese momento con una marca de mapa incompleto")
+        self.partial_checkbox.setChecked(True)
+        mapping_layout.addWidget(self.partial_checkbox)
+        control_layout.addWidget(mapping_group)
+
+        # Diagnostics section (phase timings, slowest folders and an optional profile)
+        diagnostics_group = QGroupBox("DIAGNÓSTICO")
+        diagnostics_group.setSizePolicy(QSizePolicy.Policy.Preferred, QSizePolicy.Policy.Minimum)
+        diagnostics_layout = QVBoxLayout(diagnostics_group)
+
+        self.instrumentation_checkbox = QCheckBox("Medir tiempos por fase")
+        self.instrumentation_checkbox.setToolTip("Medir el listado, la carga del árbol, la vista previa y cada fase del mapa, "
+                                                 "y registrar las carpetas más lentas de listar")
+        self.instrumentation_checkbox.toggled.connect(self._on_instrumentation_toggled)
+        diagnostics_layout.addWidget(self.instrumentation_checkbox)
+
+        diagnostics_options_layout = QHBoxLayout()
+        self.profile_checkbox = QCheckBox("Perfilar el mapa")
+        self.profile_checkbox.setToolTip("Ejecutar la generación del mapa con cProfile y tracemalloc (más lenta)")
+        diagnostics_options_layout.addWidget(self.profile_checkbox)
+        diagnostics_btn = QPushButton("Ver informe")
+        diagnostics_btn.setToolTip("Mostrar las mediciones y exportarlas como JSON")
+        diagnostics_btn.clicked.connect(lambda: DiagnosticsDialog(self).exec())
+        diagnostics_options_layout.addWidget(diagnostics_btn)
+        diagnostics_layout.addLayout(diagnostics_options_layout)
+        control_layout.addWidget(diagnostics_group)
+
         control_layout.addStretch(1) # Push generate button and status to bottom
 
         # Generate map button
@@ -510,7 +953,18 @@ class EnhancedFolderMapper(QMainWindow):
         self.generate_btn.setToolTip("Generar el archivo de texto con la estructura seleccionada")
         self.generate_btn.clicked.connect(self.start_mapping)
         self.generate_btn.setSizePolicy(QSizePolicy.Policy.Preferred, QSizePolicy.Policy.Fixed) # Fixed height
-        control_layout.addWidget(self.generate_btn)
+
+        # Cancel button (enabled while a map is being generated)
+        self.cancel_btn = QPushButton("Cancelar")
+        self.cancel_btn.setToolTip("Detener la generación del mapa en curso")
+        self.cancel_btn.clicked.connect(self.cancel_mapping)
+        self.cancel_btn.setSizePolicy(QSizePolicy.Policy.Preferred, QSizePolicy.Policy.Fixed)
+        self.cancel_btn.setEnabled(False)
+
+        generate_layout = QHBoxLayout()
+        generate_layout.addWidget(self.generate_btn, 2)
+        generate_layout.addWidget(self.cancel_btn, 1)
+        control_layout.addLayout(generate_layout)
 
         # Status label
         self.status_label = QLabel(STATUS_READY)
@@ -523,23 +977,32 @@ class EnhancedFolderMapper(QMainWindow):
         right_splitter = QSplitter(Qt.Orientation.Vertical) # PyQt6 Enum
 
         # TreeView for file structure
-        self.tree = QTreeWidget()
-        self.tree.setColumnCount(3)
-        self.tree.setHeaderLabels(["Estructura", "Tipo", "Incluir"])
+        # Virtual view: rows are created by the model on demand, in batches
+        self.tree_model = FolderTreeModel(self)
+        self.tree = QTreeView()
+        self.tree.setModel(self.tree_model)
+        self.tree.setUniformRowHeights(True) # Lets the view skip measuring every row
         header = self.tree.header()
         # PyQt6 Enum for ResizeMode
         header.setSectionResizeMode(0, QHeaderView.ResizeMode.Stretch)
         header.setSectionResizeMode(1, QHeaderView.ResizeMode.Interactive)
         header.setSectionResizeMode(2, QHeaderView.ResizeMode.Interactive)
+        header.setSectionResizeMode(3, QHeaderView.ResizeMode.Interactive)
         header.resizeSection(1, 100)
         header.resizeSection(2, 80)
+        header.resizeSection(3, 90)
         header.setMinimumSectionSize(20)
         # header.setVisible(True) # Header is visible by default
         header.setStretchLastSection(False) # Still valid
 
-        self.tree.itemDoubleClicked.connect(self.on_item_expanded_or_load) # Connect to unified handler
-        self.tree.itemExpanded.connect(self.on_item_expanded_or_load)     # Connect expansion too
-        self.tree.itemClicked.connect(self.on_item_click)
+        self.tree.expanded.connect(self.on_item_expanded_or_load) # Double-click expands too
+        self.tree.collapsed.connect(self._on_item_collapsed)
+        self.tree.clicked.connect(self.on_item_click)
+        self.tree_model.rowsInserted.connect(self._on_rows_inserted)
+        # Visible directories change with scrolling, expansion and new rows
+        self.tree.expanded.connect(self._request_prefetch)
+        self.tree_model.rowsInserted.connect(self._request_prefetch)
+        self.tree.verticalScrollBar().valueChanged.connect(self._request_prefetch)
         # PyQt6 Enum for ContextMenuPolicy
         self.tree.setContextMenuPolicy(Qt.ContextMenuPolicy.CustomContextMenu)
         self.tree.customContextMenuRequested.connect(self.show_context_menu)
@@ -603,10 +1066,12 @@ class EnhancedFolderMapper(QMainWindow):
             f"--- **Funcionalidades Principales** ---\n"
             f"* 📂 Mapeo completo de estructuras de directorios.\n" # Use Markdown list
             f"* 🔍 Selección inteligente y detallada de elementos.\n"
-            f"* 📄 Generación de informes estructurados en formato TXT.\n"
+            f"* 📄 Generación de informes estructurados en TXT, NDJSON, CSV o JSON (con compresión opcional).\n"
             f"* 🖱️ Arrastrar y Soltar carpetas.\n"
             f"* ⚡ Carga dinámica de directorios.\n"
-            f"* ⚖️ Filtrado de elementos.\n\n"
+            f"* ⚖️ Filtrado de elementos.\n"
+            f"* 🚫 Exclusiones con patrones estilo .gitignore.\n"
+            f"* ⏱️ Diagnóstico de rendimiento por fases, con perfil opcional.\n\n"
             f"--- **Derechos de Autor** ---\n"
             f"©️ 2025 Todos los derechos reservados."
         )
@@ -619,8 +1084,12 @@ class EnhancedFolderMapper(QMainWindow):
         msg_box.exec()
 
 
-    def select_folder(self, folder_path=None):
-        """Selects a folder and loads its structure."""
+    def select_folder(self, folder_path=None, keep_selection=False):
+        """Selects a folder and loads its structure (keeping the current selection marks when asked)."""
+        if self.mapping_worker:
+            # The running map lists through the scan index of the current root: it cannot be swapped now
+            QMessageBox.information(self, "Proceso en curso", "Espere a que termine el mapeo para cambiar de carpeta.")
+            return
         if folder_path is None:
             # Use QFileDialog static method
             # Define starting directory (e.g., home or last used)
@@ -633,10 +1102,22 @@ class EnhancedFolderMapper(QMainWindow):
         if folder: # Proceed only if a folder was selected or provided
             try:
                 self.folder_path_display.setText(folder)
-                self.tree.clear()
-                self.tree_data.clear() # Clear the data dictionary
+                self._open_scan_index(folder)
+                self._unwatch_all()
+                if self._loader_pool:
+                    self._loader_pool.cancel_all() # Node ids of the previous root are about to be reused
+                if self._prefetcher:
+                    self._prefetcher.reset()
+                self._pending_inserts.clear()
+                selection = self.tree_model.selection if keep_selection else None
+                self.tree_model.reset(folder) # Starts a new node store for the root
+                if selection:
+                    self.tree_model.selection = selection
+                self.ignore_rules = self._build_ignore_rules(folder)
+                self._filter_text, self._filter_names, self._visible_nodes = "", None, None
+                self._preview_cache.clear()
                 # Load only the first level initially
-                self._populate_tree_level(None, folder) # Pass None as parent item for root
+                self._populate_tree_level(ROOT_NODE, folder)
                 self._update_status(STATUS_FOLDER_LOADED, COLOR_SUCCESS)
                 # Apply the current filter after loading the structure
                 self._apply_filter(self.filter_input.text())
@@ -647,163 +1128,435 @@ class EnhancedFolderMapper(QMainWindow):
                 QMessageBox.critical(self, "Error de Carga", f"No se pudo cargar la carpeta:\n{folder}\n\nError: {e}")
 
 
-    def _populate_tree_level(self, parent_item, path, items_data=None):
+    def _open_scan_index(self, root_path):
+        """Opens the persistent index of root_path (closing the previous one) when enabled."""
+        self._close_scan_index()
+        if self.index_checkbox.isChecked() and root_path:
+            try:
+                self.scan_index = ScanIndex(root_path)
+                self.listing_cache.lister = self._disk_lister()
+                logging.info(f"Índice persistente: {self.scan_index.index_path}")
+            except Exception as e:
+                logging.warning(f"No se pudo abrir el índice persistente para {root_path}: {e}")
+
+
+    def _close_scan_index(self):
+        if self.scan_index:
+            logging.info(f"Índice persistente: {self.scan_index.hits} aciertos, {self.scan_index.misses} listados nuevos")
+            self.scan_index.close()
+            self.scan_index = None
+        self.listing_cache.lister = self._disk_lister()
+
+
+    def _disk_lister(self):
+        """What the listing cache calls on a miss: the persistent index, the instrumented scan or scan_directory."""
+        if self.scan_index:
+            return self.scan_index.scan
+        return self.instrumentation.scan if self.instrumentation else scan_directory
+
+
+    def _on_index_toggled(self, checked: bool):
+        if self.mapping_worker:
+            # Closing or opening the index would swap the lister under the running map
+            self.index_checkbox.blockSignals(True)
+            self.index_checkbox.setChecked(not checked)
+            self.index_checkbox.blockSignals(False)
+            QMessageBox.information(self, "Proceso en curso", "Espere a que termine el mapeo para cambiar el índice.")
+            return
+        root_path = self.folder_path_display.toPlainText()
+        if checked and os.path.isdir(root_path):
+            self._open_scan_index(root_path)
+        elif not checked:
+            self._close_scan_index()
+
+
+    def _on_instrumentation_toggled(self, checked: bool):
+        """Starts (or resumes) timing the phases; turning it off keeps the measurements for the report."""
+        if checked and self._measurements is None:
+            self._measurements = Instrumentation()
+        self.instrumentation = self._measurements if checked else None
+        self.listing_cache.lister = self._disk_lister()
+        if self._loader_pool:
+            self._loader_pool.instrumentation = self.instrumentation
+
+
+    def diagnostics(self):
+        """JSON-ready measurements for the diagnostics panel, or None when nothing was measured."""
+        if self._measurements is None and self._profile_report is None:
+            return None
+        report = self._measurements.report() if self._measurements else Instrumentation().report()
+        return {"instrumentation": report, "profile": self._profile_report,
+                "listing_cache": self.listing_cache.stats()}
+
+
+    def reset_diagnostics(self):
+        if self._measurements:
+            self._measurements.reset()
+        self._profile_report = None
+
+
+    def _list_directory(self, dir_path):
         """
-        Populates one level of the tree with provided data.
-        If items_data is None, lists the content of path.
+        Lists dir_path through the listing cache (and the persistent index when enabled),
+        without the entries the ignore rules exclude. Called from the loader threads too.
         """
+        entries = self.listing_cache.scan(dir_path)
+        rules = self.ignore_rules
+        return rules.filter(dir_path, entries) if rules else entries
+
+
+    def _build_ignore_rules(self, root_path):
+        """IgnoreRules for root_path from the patterns box and the .gitignore option, or None when empty."""
+        rules = IgnoreRules(root_path, self.ignore_input.toPlainText().splitlines(),
+                            self.gitignore_checkbox.isChecked())
+        return rules if rules else None
+
+
+    def _apply_ignore_rules(self):
+        """Reloads the tree of the current root with the rules as they are now written."""
+        root_path = self.folder_path_display.toPlainText()
+        if not os.path.isdir(root_path):
+            return
+        if self.mapping_worker:
+            QMessageBox.information(self, "Proceso en curso", "Espere a que termine el mapeo para cambiar las reglas.")
+            return
+        self.select_folder(root_path, keep_selection=True)
+        if self.ignore_rules:
+            logging.info(f"Reglas de exclusión: {len(self.ignore_rules.patterns)} patrones"
+                         f"{', respetando .gitignore' if self.ignore_rules.use_gitignore else ''}")
+        self._update_status(STATUS_RULES_APPLIED, COLOR_SUCCESS)
+
+
+    def _lister(self):
+        """Listing callable handed to the worker threads."""
+        return self.listing_cache.scan
+
+
+    def _populate_tree_level(self, parent_node: int, path, items_data=None):
+        """
+        Populates one level of the tree with provided data (a list of ScanEntry).
+        If items_data is None, lists the content of path. Only the first screenful
+        is attached here; the rest follows in time-sliced chunks.
+        """
+        store = self.tree_model.store
         try:
             if items_data is None:
                 # List content if data not provided (for initial load)
-                dir_contents = os.listdir(path)
-                sorted_contents = sorted(dir_contents, key=lambda x: (not os.path.isdir(os.path.join(path, x)), x.lower()))
-                items_data = []
-                for item_name in sorted_contents:
-                    full_path = os.path.join(path, item_name)
-                    is_dir = False
-                    try:
-                        is_dir = os.path.isdir(full_path)
-                    except Exception as e:
-                        logging.warning(f"Error checking if path is directory in _populate_tree_level {full_path}: {e}")
-                        is_dir = False # Treat as file on error
-                    items_data.append((item_name, is_dir, full_path))
-
-            target_node = parent_item if parent_item else self.tree # Add to tree root if parent_item is None
-
-            for item_name, is_dir, full_path in items_data:
-                # Check if item already exists (less likely with path-based keys, but good practice)
-                if full_path in self.tree_data:
-                     logging.warning(f"Item path {full_path} already exists in tree_data. Skipping add.")
-                     continue # Avoid adding duplicates
-
-                # Determine parent's selection state for inheritance (default to True if no parent)
-                parent_selected = True
-                if parent_item:
-                    parent_path = parent_item.data(0, Qt.ItemDataRole.UserRole) # PyQt6 Enum
-                    if parent_path and parent_path in self.tree_data:
-                        parent_selected = self.tree_data[parent_path].get("selected", True)
-
-                # Create tree item
-                tree_item = QTreeWidgetItem(target_node)
-
-                tree_item.setText(0, item_name)
-                tree_item.setText(1, "📁 Directorio" if is_dir else "📄 Archivo")
-                # Store the full path in the item's data using UserRole
-                tree_item.setData(0, Qt.ItemDataRole.UserRole, full_path) # PyQt6 Enum
-
-                # Store associated data in tree_data using path as key
-                current_selected_state = parent_selected # Inherit selection state
-                self.tree_data[full_path] = {"selected": current_selected_state, "loaded": False, "item": tree_item}
-
-                # Apply visual style based on selection state
-                self._update_item_style(tree_item, current_selected_state)
-
-                if is_dir:
-                    # Add placeholder for dynamic loading if not already loaded
-                    if not self.tree_data[full_path].get("loaded", False):
-                        placeholder = QTreeWidgetItem(tree_item)
-                        placeholder.setText(0, "...")
-                        # Do not associate placeholder with a path in tree_data
-                        # Placeholder has no data set for UserRole
-
-            # Mark parent node as loaded if it's not the initial root load
-            if parent_item is not None:
-                parent_path = parent_item.data(0, Qt.ItemDataRole.UserRole) # PyQt6 Enum
-                if parent_path in self.tree_data:
-                    self.tree_data[parent_path]["loaded"] = True
+                items_data = self._list_directory(path)
+
+            # Attach the first chunk at once; the model exposes it to the view right away
+            self.tree_model.set_children(parent_node, self._add_nodes(parent_node, items_data[:INSERT_FIRST_CHUNK]))
+            self._invalidate_preview(parent_node)
+            self._watch_directory(parent_node, path)
+            if len(items_data) > INSERT_FIRST_CHUNK:
+                self._pending_inserts[parent_node] = [items_data, INSERT_FIRST_CHUNK]
+                if self._insert_timer is None:
+                    self._insert_timer = QTimer(self)
+                    self._insert_timer.setInterval(0) # Runs between event loop passes
+                    self._insert_timer.timeout.connect(self._insert_pending_chunks)
+                self._insert_timer.start()
 
         except PermissionError:
-            logging.warning(f"Permiso denegado para poblar nivel del árbol en: {path}")
-            error_item = QTreeWidgetItem(target_node) # Add error item to parent or root
-            error_item.setText(0, "[Acceso denegado]")
-            error_item.setForeground(0, QColor(COLOR_ERROR)) # Use QColor directly
-            # Do not associate with path in tree_data
+            hot_log.warning("Permiso denegado para poblar nivel del árbol en: %s", path)
+            self.tree_model.set_children(parent_node, [store.add_message(parent_node, "[Acceso denegado]")])
+            self._invalidate_preview(parent_node)
         except Exception as e:
             logging.exception(f"Error inesperado al poblar nivel del árbol en {path}:")
-            error_item = QTreeWidgetItem(target_node)
-            error_item.setText(0, f"[Error: {str(e)}]")
-            error_item.setForeground(0, QColor(COLOR_ERROR))
-            # Do not associate with path in tree_data
-
+            self.tree_model.set_children(parent_node, [store.add_message(parent_node, f"[Error: {str(e)}]")])
+            self._invalidate_preview(parent_node)
+
+
+    def _add_nodes(self, parent_node: int, entries):
+        """Creates the nodes of entries under parent_node with their filter state; returns their ids."""
+        store = self.tree_model.store
+        # Selection needs nothing per child: it is inherited through the trie
+        children = [store.add(parent_node, entry.name, entry.is_dir) for entry in entries]
+        self._filter_new_nodes(children) # Only the new nodes; before their rows reach the view
+        return children
+
+
+    def _insert_pending_chunks(self):
+        """Attaches pending chunks of large listings until the frame budget is spent."""
+        deadline = time.perf_counter() + INSERT_FRAME_BUDGET_MS / 1000
+        completed = []
+        while self._pending_inserts and time.perf_counter() < deadline:
+            for node in list(self._pending_inserts): # Round robin between directories
+                if self._insert_chunk(node):
+                    completed.append(node)
+                if time.perf_counter() >= deadline:
+                    break
+        if not self._pending_inserts:
+            self._insert_timer.stop()
+        if completed:
+            # The preview text is rebuilt as a whole, so it follows once per completed level
+            for node in completed:
+                if self.tree_model.store.is_alive(node):
+                    self._invalidate_preview(node)
+            self._update_preview()
 
-    # Combined handler for item expansion and double-click to trigger loading
-    def on_item_expanded_or_load(self, item: QTreeWidgetItem, column: int = -1):
-        """Handles item expansion or double-click to load directory contents asynchronously."""
-        if item is None: return
 
-        item_path = item.data(0, Qt.ItemDataRole.UserRole) # PyQt6 Enum
-        if not item_path: # If no path (e.g., placeholder or error item), do nothing
+    def _insert_chunk(self, node: int, size=INSERT_CHUNK_SIZE) -> bool:
+        """Attaches the next chunk of node's pending listing. Returns True once the listing is complete."""
+        entries, position = self._pending_inserts[node]
+        if not self.tree_model.store.is_alive(node):
+            del self._pending_inserts[node] # Removed meanwhile
+            return False
+        chunk = entries[position:position + size]
+        self.tree_model.append_children(node, self._add_nodes(node, chunk))
+        position += len(chunk)
+        if position < len(entries):
+            self._pending_inserts[node][1] = position
+            return False
+        del self._pending_inserts[node]
+        hot_log.debug("Nivel completo: %d elementos en %s", len(entries), self.tree_model.store.path(node))
+        return True
+
+
+    # --- Watch mode (incremental updates from disk changes) ---
+    def _on_watch_toggled(self, checked: bool):
+        """Starts or stops watching the root and every loaded directory."""
+        if not checked:
+            self._unwatch_all()
+            return
+        if self.fs_watcher is None:
+            self.fs_watcher = QFileSystemWatcher(self)
+            self.fs_watcher.directoryChanged.connect(self._on_directory_changed)
+            self._watch_timer = QTimer(self)
+            self._watch_timer.setSingleShot(True)
+            self._watch_timer.timeout.connect(self._apply_directory_changes)
+        store = self.tree_model.store
+        if store.root_path and os.path.isdir(store.root_path):
+            for node in store.loaded_dirs(): # The root and every loaded directory
+                self._watch_directory(node, store.path(node))
+
+
+    def _watch_directory(self, node, dir_path):
+        if not self.watch_checkbox.isChecked() or self.fs_watcher is None or dir_path in self._watched_dirs:
             return
+        if len(self._watched_dirs) >= WATCH_MAX_DIRECTORIES:
+            hot_log.debug("Límite de carpetas observadas alcanzado; no se observa %s", dir_path)
+            return
+        if self.fs_watcher.addPath(dir_path):
+            self._watched_dirs[dir_path] = node
+
+
+    def _unwatch_directory(self, dir_path):
+        if self._watched_dirs.pop(dir_path, None) is not None:
+            self.fs_watcher.removePath(dir_path)
+
+
+    def _unwatch_all(self):
+        if self.fs_watcher is not None and self._watched_dirs:
+            self.fs_watcher.removePaths(list(self._watched_dirs))
+        self._watched_dirs.clear()
+        self._changed_dirs.clear()
+
+
+    def _on_directory_changed(self, dir_path: str):
+        """Collects change notifications; bursts are applied together after WATCH_DEBOUNCE_MS."""
+        self._changed_dirs.add(dir_path)
+        self._watch_timer.start(WATCH_DEBOUNCE_MS)
 
-        data = self.tree_data.get(item_path)
 
-        # Check if it's a directory, present in tree_data, and not yet loaded
-        if data and os.path.isdir(item_path) and not data.get("loaded", False):
-            # Only proceed if not already loading (basic check)
-            if self.loader_worker and self.loader_worker.isRunning():
-                 logging.debug("Loader worker is already running.")
-                 # Optionally, you could queue requests or provide feedback
-                 return
+    def _apply_directory_changes(self):
+        """Applies pending additions/removals to the affected tree levels only."""
+        changed_dirs, self._changed_dirs = self._changed_dirs, set()
+        changed = False
+        for dir_path in sorted(changed_dirs): # Parents before children
+            changed = self._refresh_tree_level(dir_path) or changed
+        if changed:
+            self._update_preview()
+
 
-            # Remove placeholder(s) if they exist
-            placeholders_to_remove = []
-            for i in range(item.childCount()):
-                child = item.child(i)
-                # Identify placeholder by lack of UserRole data
-                if child.data(0, Qt.ItemDataRole.UserRole) is None: # PyQt6 Enum
-                    placeholders_to_remove.append(child)
-            for placeholder in placeholders_to_remove:
-                item.removeChild(placeholder)
+    def _refresh_tree_level(self, dir_path) -> bool:
+        """Re-lists dir_path and adds/removes only the nodes that changed. Returns True on changes."""
+        parent_node = self._watched_dirs.get(dir_path)
+        if parent_node is None:
+            return False # Removed from the tree meanwhile
+        if parent_node in self._pending_inserts:
+            # Compare against the complete level, not the part attached so far
+            self._insert_chunk(parent_node, len(self._pending_inserts[parent_node][0]))
 
-            # Create and start the worker to load content
-            logging.debug(f"Initiating DirectoryLoaderWorker for: {item_path}")
-            worker = DirectoryLoaderWorker(item, item_path)
+        self.listing_cache.invalidate(dir_path) # The change may fall within the same mtime tick
+        try:
+            entries = self._list_directory(dir_path)
+        except OSError:
+            # Deleted or no longer readable: the parent's own notification removes its node
+            self._unwatch_directory(dir_path)
+            return False
+
+        # Remove nodes (and their loaded descendants) that are no longer on disk
+        store = self.tree_model.store
+        listed_names = {entry.name for entry in entries}
+        removed = [child for child in store.children[parent_node]
+                   if not store.has(child, FLAG_MESSAGE) and store.names[child] not in listed_names]
+        for node in removed:
+            self._remove_tree_node(node)
+
+        # Insert new entries at their sorted position (both sides use the same order)
+        positions = {store.names[child]: row for row, child in enumerate(store.children[parent_node])
+                     if not store.has(child, FLAG_MESSAGE)}
+        insert_at = inserted = 0
+        for entry in entries:
+            if entry.name in positions:
+                insert_at = positions[entry.name] + inserted + 1
+                continue
+            node = store.add(parent_node, entry.name, entry.is_dir) # Renamed items arrive as new ones
+            self._filter_new_nodes([node])
+            self.tree_model.insert_child(parent_node, insert_at, node)
+            insert_at += 1
+            inserted += 1
+
+        if removed or inserted:
+            self._invalidate_preview(parent_node) # Only this directory and its ancestors re-render
+            self.tree_model.invalidate_totals(parent_node)
+            hot_log.debug("Cambios aplicados en %s: +%d -%d", dir_path, inserted, len(removed))
+        return bool(removed or inserted)
+
+
+    def _remove_tree_node(self, node: int):
+        """Detaches node from the model and marks it and its loaded descendants as removed."""
+        store = self.tree_model.store
+        self._cancel_loads_below(node)
+        for current in store.loaded_dirs(node):
+            self._unwatch_directory(store.path(current)) # Only loaded directories are watched
+            self._preview_cache.pop(current, None)
+        self.tree_model.remove_child(node)
+        pending = [node]
+        while pending:
+            current = pending.pop()
+            store.set_flag(current, FLAG_REMOVED)
+            if store.children[current]:
+                pending.extend(store.children[current])
+
+
+    # Handler for item expansion (double-click expands too) to trigger loading
+    def on_item_expanded_or_load(self, index: QModelIndex):
+        """Handles item expansion to load directory contents asynchronously."""
+        if not index.isValid(): return
+
+        store = self.tree_model.store
+        node = self.tree_model.node_from_index(index)
+
+        # Check if it's a directory not yet loaded
+        if store.has(node, FLAG_DIR) and not store.has(node, FLAG_LOADED):
+            node_path = store.path(node)
+            entries = self.listing_cache.peek(node_path, PREFETCH_FRESH_SECONDS)
+            if entries is not None and self.ignore_rules:
+                entries = self.ignore_rules.filter(node_path, entries)
+            if entries is not None and not self.loader_pool.is_pending(node):
+                # Listed moments ago (e.g. by the prefetcher): attach it without another round trip
+                self._populate_tree_level(node, node_path, entries)
+                self._update_preview()
+                return
+            # Queued ahead of earlier expansions; a repeated request only moves it forward
+            if self.loader_pool.request(node, node_path):
+                hot_log.debug("Carga en cola: %s", node_path)
+                self._update_status(STATUS_LOADING_DIRECTORY.format(os.path.basename(node_path)), COLOR_PRIMARY, log=False)
 
-            # Connect signals
-            worker.finished.connect(self._on_directory_load_finished)
-            worker.status_update.connect(self._update_status)
+        # If it's already loaded, the view shows the rows it already has.
 
-            # Keep a reference to the worker
-            self.loader_worker = worker
 
-            # Start the worker thread
-            self.loader_worker.start()
-            logging.debug(f"Started DirectoryLoaderWorker for: {item_path}")
+    def _on_prefetch_toggled(self, checked: bool):
+        """Starts or stops prefetching the directories around the visible ones."""
+        if not checked:
+            if self._prefetch_timer:
+                self._prefetch_timer.stop()
+            self.prefetcher.reset()
+            logging.info(f"Precarga detenida: {self.prefetcher.prefetched} listados adelantados")
+            return
+        if self._prefetch_timer is None:
+            self._prefetch_timer = QTimer(self)
+            self._prefetch_timer.setInterval(PREFETCH_TICK_MS)
+            self._prefetch_timer.timeout.connect(self._prefetch_tick)
+        self._request_prefetch()
 
-        # If it's already loaded, expansion/double-click default behavior takes over.
 
+    def _request_prefetch(self, *_):
+        """Marks the visible directories as changed and resumes prefetching (when enabled)."""
+        if self._prefetch_timer and self.prefetch_checkbox.isChecked():
+            self._prefetch_dirty = True
+            if not self._prefetch_timer.isActive():
+                self._prefetch_timer.start()
 
-    def _on_directory_load_finished(self, parent_item, loaded_items_data, error_message):
-        """Slot executed when DirectoryLoaderWorker finishes loading a directory."""
-        parent_path = parent_item.data(0, Qt.ItemDataRole.UserRole) if parent_item else "Root" # PyQt6 Enum
-        logging.debug(f"DirectoryLoaderWorker finished for item: {parent_item.text(0)} (Path: {parent_path}). Error: '{error_message}'")
+
+    def _prefetch_tick(self):
+        """One idle-time prefetch step; user loads and mappings go first."""
+        # The pool is created by the first expansion; until then no load is pending
+        if (self._loader_pool and self._loader_pool.pending_nodes()) or self.mapping_worker:
+            return
+        if self._prefetch_dirty:
+            self._prefetch_dirty = False
+            self.prefetcher.schedule(self._visible_unloaded_dirs())
+        if not self.prefetcher.step():
+            self._prefetch_timer.stop() # Restarted by the next scroll, expansion or load
+
+
+    def _visible_unloaded_dirs(self):
+        """Paths of the not yet loaded directories currently shown in the viewport, top to bottom."""
+        store = self.tree_model.store
+        paths = []
+        bottom = self.tree.viewport().height()
+        index = self.tree.indexAt(QPoint(0, 0))
+        while index.isValid() and self.tree.visualRect(index).top() < bottom:
+            node = self.tree_model.node_from_index(index)
+            if store.flags[node] & (FLAG_DIR | FLAG_LOADED) == FLAG_DIR:
+                paths.append(store.path(node))
+            index = self.tree.indexBelow(index)
+        return paths
+
+
+    def _on_item_collapsed(self, index: QModelIndex):
+        """Cancels the loads still pending inside a collapsed directory (and its own)."""
+        if index.isValid() and self._loader_pool and self._loader_pool.pending_nodes():
+            self._cancel_loads_below(self.tree_model.node_from_index(index))
+
+
+    def _cancel_loads_below(self, node: int):
+        """Cancels the pending loads of node and its descendants."""
+        if not self._loader_pool:
+            return
+        parents = self.tree_model.store.parents
+        cancelled = []
+        for pending in self._loader_pool.pending_nodes():
+            current = pending
+            while current != -1 and current != node:
+                current = parents[current]
+            if current == node:
+                cancelled.append(pending)
+        if cancelled:
+            self._loader_pool.cancel(cancelled)
+            hot_log.debug("Cargas canceladas: %d", len(cancelled))
+
+
+    def _on_directory_load_finished(self, parent_node: int, parent_path, loaded_items_data, error_message):
+        """Slot executed when the loader pool finishes loading a directory."""
+        hot_log.debug("Carga terminada para el nodo %d (Ruta: %s). Error: '%s'", parent_node, parent_path, error_message)
 
         try:
-            if error_message:
-                # Show error item in the tree
-                error_item = QTreeWidgetItem(parent_item)
-                error_item.setText(0, error_message)
-                error_item.setForeground(0, QColor(COLOR_ERROR))
-                # Mark parent as 'loaded' even on error to prevent retry attempts
-                if parent_path != "Root" and parent_path in self.tree_data:
-                    self.tree_data[parent_path]["loaded"] = True
+            store = self.tree_model.store
+            # The root may have changed or the node been removed while loading
+            if not store.is_alive(parent_node) or store.path(parent_node) != parent_path:
+                hot_log.debug("Discarding load result for a node no longer in the tree: %s", parent_path)
+            elif error_message:
+                # Show error row in the tree; the node counts as loaded to prevent retry attempts
+                self.tree_model.set_children(parent_node, [store.add_message(parent_node, error_message)])
+                self._invalidate_preview(parent_node)
                 self._update_status(f"Error al cargar {os.path.basename(str(parent_path))}: {error_message}", COLOR_ERROR)
 
             else:
-                # Populate the tree with loaded items
-                current_path = parent_item.data(0, Qt.ItemDataRole.UserRole) # PyQt6 Enum
-                if current_path:
-                     self._populate_tree_level(parent_item, current_path, loaded_items_data)
-                # 'loaded' flag for parent_item is updated inside _populate_tree_level
+                # Populate the tree with loaded items ('loaded' flag is set by the model)
+                instrumentation = self.instrumentation
+                start = time.perf_counter()
+                self._populate_tree_level(parent_node, parent_path, loaded_items_data)
+                if instrumentation:
+                    instrumentation.add("load.populate", time.perf_counter() - start)
 
                 # Update general status (optional, could be more specific)
-                base_name = os.path.basename(str(parent_path)) if parent_path else "Raíz"
-                self._update_status(f"Contenido de {base_name} cargado", COLOR_PRIMARY)
+                hot_log.info("Contenido cargado: %s", parent_path)
+                self._update_status(f"Contenido de {os.path.basename(parent_path)} cargado", COLOR_PRIMARY, log=False)
                 # Schedule status update back to "Ready" after a short delay
-                QTimer.singleShot(2000, lambda: self._update_status(STATUS_READY, COLOR_PRIMARY))
-
-            # Apply current filter to ensure new items are correctly shown/hidden
-            self._apply_filter(self.filter_input.text())
+                QTimer.singleShot(2000, lambda: self._update_status(STATUS_READY, COLOR_PRIMARY, log=False))
 
             # Update the preview, as the visible/selectable structure has changed
             self._update_preview()
@@ -812,114 +1565,63 @@ class EnhancedFolderMapper(QMainWindow):
             logging.exception(f"Critical error in _on_directory_load_finished for {parent_path}:")
             self._update_status(f"Error al procesar resultados de carga: {e}", COLOR_ERROR)
 
-        # Clean up worker reference
-        self.loader_worker = None
+        if self.scan_index:
+            self.scan_index.flush()
+
 
+    def _on_rows_inserted(self, parent: QModelIndex, first: int, last: int):
+        """Applies the filter state to rows the model has just exposed."""
+        store = self.tree_model.store
+        child_array = store.children[self.tree_model.node_from_index(parent)]
+        for row in range(first, last + 1):
+            if store.has(child_array[row], FLAG_HIDDEN):
+                self.tree.setRowHidden(row, parent, True)
 
-    def on_item_click(self, item: QTreeWidgetItem, column: int):
+
+    def on_item_click(self, index: QModelIndex):
         """Handles clicks on an item, especially the 'Include' column."""
-        if column == 2: # Click on the "Include" column
-            item_path = item.data(0, Qt.ItemDataRole.UserRole) # PyQt6 Enum
-            if item_path and item_path in self.tree_data:
-                current_state = self.tree_data[item_path].get("selected", True)
-                new_state = not current_state
-                # Update state in tree_data and visually (including children if directory)
-                self.toggle_item_selection(item, new_state, True) # Propagate to children
+        if index.column() == COLUMN_INCLUDE: # Click on the "Include" column
+            store = self.tree_model.store
+            node = self.tree_model.node_from_index(index)
+            if not store.has(node, FLAG_MESSAGE):
+                # Update state and display (including children if directory)
+                selected = self.tree_model.selection_state(node) != SEL_EXCLUDE
+                self.toggle_item_selection(node, not selected) # Applies to its descendants too
                 self._update_preview() # Update preview after selection change
 
 
-    def toggle_item_selection(self, item: QTreeWidgetItem, select: bool, propagate_to_children: bool):
-        """Changes the selection state of an item and optionally its children."""
-        item_path = item.data(0, Qt.ItemDataRole.UserRole) # PyQt6 Enum
-        if not item_path or item_path not in self.tree_data:
-            # Also ignore placeholders/error messages
+    def toggle_item_selection(self, node: int, select: bool):
+        """
+        Includes or excludes a node and all its descendants, loaded or not. A single
+        trie mark is set (O(depth)); excluded ancestors of an included node become partial.
+        """
+        if self.tree_model.store.has(node, FLAG_MESSAGE):
+            # Ignore error rows
             return
-
-        # Update state in the dictionary
-        self.tree_data[item_path]["selected"] = select
-        # Update visual style of the item
-        self._update_item_style(item, select)
-
-        # Propagate to children if it's a directory and requested
-        if propagate_to_children and os.path.isdir(item_path):
-            # Iterate over children ALREADY LOADED in the QTreeWidget
-            for i in range(item.childCount()):
-                child_item = item.child(i)
-                child_path = child_item.data(0, Qt.ItemDataRole.UserRole) # PyQt6 Enum
-                # If child has path (is real item) and in tree_data
-                if child_path and child_path in self.tree_data:
-                    # Check if child's current state differs before recursing to avoid redundant updates
-                    if self.tree_data[child_path].get("selected") != select:
-                        self.toggle_item_selection(child_item, select, True) # Recursive call
-
-        # Propagate change upwards to parent if deselecting
-        # If selecting, parent should also be selected
-        parent_item = item.parent()
-        if parent_item: # Check if it has a parent
-            parent_path = parent_item.data(0, Qt.ItemDataRole.UserRole) # PyQt6 Enum
-            if parent_path and parent_path in self.tree_data:
-                if select and not self.tree_data[parent_path].get("selected", True):
-                    # If selecting child, ensure parent is selected (don't propagate further up from here)
-                    self.toggle_item_selection(parent_item, True, False)
-                elif not select:
-                    # If deselecting, check if all siblings are also deselected to potentially deselect parent
-                    all_siblings_deselected = True
-                    for i in range(parent_item.childCount()):
-                        sibling_item = parent_item.child(i)
-                        sibling_path = sibling_item.data(0, Qt.ItemDataRole.UserRole) # PyQt6 Enum
-                        if sibling_path and sibling_path in self.tree_data:
-                             if self.tree_data[sibling_path].get("selected", True):
-                                 all_siblings_deselected = False
-                                 break
-                    if all_siblings_deselected and self.tree_data[parent_path].get("selected", True):
-                         # Only deselect parent if it was previously selected and all children are now deselected
-                         self.toggle_item_selection(parent_item, False, False) # Don't propagate further
-
-
-    def _update_item_style(self, item: QTreeWidgetItem, selected: bool):
-        """Updates the visual style of an item (text and icon) based on its selection state."""
-        if selected:
-            item.setText(2, "☑") # Checked box
-            item.setForeground(0, QColor(Qt.GlobalColor.black)) # Normal text color - PyQt6 Enum
-            # item.setBackground(0, QColor(Qt.transparent)) # Normal background
-        else:
-            item.setText(2, "☐") # Unchecked box
-            item.setForeground(0, QColor(Qt.GlobalColor.gray)) # Dimmed text color - PyQt6 Enum
-            # item.setBackground(0, QColor(COLOR_BACKGROUND_LIGHT)) # Slightly different background?
+        self.tree_model.selection.select(self.tree_model.store.name_chain(node), select)
+        # Blocks below node notice the new selection context; node and its ancestors contain it
+        self._invalidate_preview(node)
+        # Rows resolve their state at paint time: repainting the visible ones is enough
+        self.tree.viewport().update()
 
 
     def toggle_all(self, select: bool):
-        """Selects or deselects all currently loaded items in the tree."""
-        logging.debug(f"Toggle all selection to: {select}")
-        # Block signals temporarily to avoid excessive updates during batch change? Optional.
-        # self.tree.blockSignals(True)
-        iterator = QTreeWidgetItemIterator(self.tree)
-        items_to_process = []
-        while iterator.value():
-            items_to_process.append(iterator.value()) # Collect items first
-            iterator += 1
-
-        for item in items_to_process:
-            # Apply only to items with path (real data items)
-            item_path = item.data(0, Qt.ItemDataRole.UserRole) # PyQt6 Enum
-            if item_path and item_path in self.tree_data:
-                 # Only update if the state is different
-                 if self.tree_data[item_path].get("selected") != select:
-                    self.toggle_item_selection(item, select, False) # Don't propagate from here
-
-        # self.tree.blockSignals(False)
+        """Selects or deselects every item, loaded or not."""
+        logging.debug("Toggle all selection to: %s", select)
+        self.tree_model.selection.set_all(select)
+        self._preview_cache.clear() # Every selection context changed
+        self.tree.viewport().update()
         self._update_preview() # Update preview once at the end
 
 
     def _expand_all_nodes(self):
         """Expands all currently loaded nodes in the tree."""
         logging.debug("Expanding all nodes...")
-        # Load any unloaded first-level items if root exists
-        root_path = self.folder_path_display.toPlainText()
-        if root_path and root_path != "No seleccionada" and os.path.isdir(root_path):
-            for i in range(self.tree.topLevelItemCount()):
-                top_item = self.tree.topLevelItem(i)
-                self.on_item_expanded_or_load(top_item) # Ensure top levels are loaded/expanded
+        # Load any unloaded first-level items
+        store = self.tree_model.store
+        for node in store.children[ROOT_NODE][:store.fetched[ROOT_NODE]]:
+            if store.has(node, FLAG_DIR):
+                self.on_item_expanded_or_load(self.tree_model.index_for_node(node)) # Ensure top levels are loaded
 
         self.tree.expandAll()
         self._update_status("Vista expandida", COLOR_PRIMARY)
@@ -928,163 +1630,253 @@ class EnhancedFolderMapper(QMainWindow):
     def _collapse_all_nodes(self):
         """Collapses all nodes in the tree."""
         logging.debug("Collapsing all nodes...")
+        if self._loader_pool:
+            self._loader_pool.cancel_all() # collapseAll() does not emit collapsed per item
         self.tree.collapseAll()
         self._update_status("Vista colapsada", COLOR_PRIMARY)
 
 
     def _apply_filter(self, text: str):
-        """Applies a filter to the tree items based on text."""
+        """
+        Shows the loaded nodes whose name contains text, plus their ancestors.
+        Matches come from the name index; a refined query only re-checks the
+        previous matches, and only rows whose visibility changes reach the view.
+        """
         filter_text = text.lower().strip()
-        logging.debug(f"Applying filter: '{filter_text}'")
-
-        # Iterate through all items and hide/show based on filter
-        iterator = QTreeWidgetItemIterator(self.tree)
-        while iterator.value():
-            item = iterator.value()
-            item_path = item.data(0, Qt.ItemDataRole.UserRole) # PyQt6 Enum
-
-            # Skip placeholders or error messages (identified by lack of path)
-            if item_path is None:
-                item.setHidden(False) # Always show placeholders/errors? Maybe hide... depends. Let's hide if parent is hidden.
-                # Check parent visibility
-                parent = item.parent()
-                if parent and parent.isHidden():
-                    item.setHidden(True)
-                else:
-                     item.setHidden(False)
-
-                iterator += 1
-                continue
-
-            item_text = item.text(0).lower()
-            match = filter_text in item_text if filter_text else True
+        if filter_text == self._filter_text:
+            return
+        hot_log.debug("Applying filter: '%s'", filter_text)
+        store = self.tree_model.store
+
+        old_visible = self._visible_nodes
+        if filter_text:
+            refined = bool(self._filter_text) and self._filter_text in filter_text
+            self._filter_names = self.tree_model.name_index.matching_names(
+                filter_text, self._filter_names if refined else None)
+            visible = set()
+            for node in self.tree_model.name_index.nodes(self._filter_names):
+                # Add the match and its ancestors, stopping at the first one already added
+                while node != ROOT_NODE and node not in visible and not store.has(node, FLAG_REMOVED):
+                    visible.add(node)
+                    node = store.parents[node]
+        else:
+            self._filter_names = visible = None
+        self._filter_text = filter_text
+        self._visible_nodes = visible
+        self._preview_cache.clear() # Blocks were rendered for the previous filter
+
+        if old_visible is None or visible is None:
+            # Filter turned on or off: flags in bulk, then the exposed rows that changed
+            store.set_all_hidden(visible is not None)
+            for node in visible or ():
+                store.set_flag(node, FLAG_HIDDEN, False)
+            pending = [ROOT_NODE]
+            while pending:
+                parent_node = pending.pop()
+                parent_index = None
+                for child in store.children[parent_node][:store.fetched[parent_node]]:
+                    hidden = store.has(child, FLAG_HIDDEN)
+                    was_hidden = old_visible is not None and child not in old_visible and not store.has(child, FLAG_MESSAGE)
+                    if hidden != was_hidden:
+                        if parent_index is None:
+                            parent_index = self.tree_model.index_for_node(parent_node)
+                        self.tree.setRowHidden(store.rows[child], parent_index, hidden)
+                    if store.has(child, FLAG_LOADED):
+                        pending.append(child)
+        else:
+            # Query changed: only nodes entering or leaving the visible set change
+            for node in old_visible ^ visible:
+                self._set_node_hidden(node, node not in visible)
 
-            # Simple hide/show logic (more complex logic could show parents of matches)
-            item.setHidden(not match)
+        self._update_preview() # Update preview after filtering
 
-            iterator += 1
 
-        self._update_preview() # Update preview after filtering
+    def _filter_new_nodes(self, nodes):
+        """Indexes new (not yet attached) nodes and gives them the current filter state."""
+        store = self.tree_model.store
+        name_index = self.tree_model.name_index
+        matched_parents = set()
+        for node in nodes:
+            lower = name_index.add(node, store.names[node])
+            if self._visible_nodes is None:
+                continue
+            if self._filter_text in lower:
+                self._filter_names.add(lower) # Keeps the cached matches valid for refinements
+                self._visible_nodes.add(node)
+                matched_parents.add(store.parents[node])
+            else:
+                store.set_flag(node, FLAG_HIDDEN)
+        for node in matched_parents:
+            # A match keeps its ancestors visible
+            while node != ROOT_NODE and node not in self._visible_nodes:
+                self._visible_nodes.add(node)
+                self._set_node_hidden(node, False)
+                node = store.parents[node]
+
+
+    def _set_node_hidden(self, node, hidden):
+        """Updates the filter flag of node and, if the view already has its row, the row."""
+        store = self.tree_model.store
+        if store.has(node, FLAG_REMOVED):
+            return
+        store.set_flag(node, FLAG_HIDDEN, hidden)
+        if self.tree_model.is_exposed(node): # Rows not exposed yet get their state when inserted
+            self.tree.setRowHidden(store.rows[node], self.tree_model.index_for_node(store.parents[node]), hidden)
 
 
     def _update_preview(self):
         """Updates the preview area based on the current selection and filter."""
-        logging.debug("Actualizando vista previa...")
+        hot_log.debug("Actualizando vista previa...")
         root_path = self.folder_path_display.toPlainText()
         if not root_path or root_path == "No seleccionada" or not os.path.isdir(root_path):
             self.preview_text.setText("Seleccione una carpeta válida para ver la vista previa.")
             return
 
         try:
+            instrumentation = self.instrumentation
+            if instrumentation:
+                start, listed = time.perf_counter(), instrumentation.seconds("preview.list")
             # Generate preview structure respecting selection and filter
-            preview_content = self._generate_preview_structure(root_path)
+            preview_content = self._generate_preview_structure(ROOT_NODE)
+            if instrumentation:
+                rendered = time.perf_counter() # Rendering excludes the disk listings it made (preview.list)
+                instrumentation.add("preview.render",
+                                    rendered - start - (instrumentation.seconds("preview.list") - listed))
             self.preview_text.setPlainText(preview_content) # Use setPlainText for efficiency
+            if instrumentation:
+                instrumentation.add("preview.show", time.perf_counter() - rendered)
         except Exception as e:
             logging.error(f"Error generando vista previa: {e}")
             self.preview_text.setText(f"Error al generar vista previa:\n{e}")
 
 
-    def _generate_preview_structure(self, dir_path, prefix="", level=0, max_items_per_level=50):
-        """ Generates a preview string (limited depth/items) respecting selection/filter. """
-        output = ""
+    def _invalidate_preview(self, node: int):
+        """Drops the cached preview blocks of node and its ancestors (the ones that contain it)."""
+        store = self.tree_model.store
+        while True:
+            self._preview_cache.pop(node, None)
+            if node == ROOT_NODE:
+                break
+            node = store.parents[node]
+
+
+    def _generate_preview_structure(self, root_node: int, max_items_per_level=50):
+        """
+        Generates a preview string (limited depth/items) respecting selection/filter.
+
+        Each directory's rendered block (a nested list of lines) is cached with the
+        prefix and selection context it was rendered with, so only invalidated
+        directories are rendered again and every other block is reused as is.
+        """
+        filter_text = self._filter_text # Last applied (the input may be ahead while debouncing)
+        cache = self._preview_cache
+        dir_totals = self.tree_model.totals
+
+        def cached_block(node, context, prefix):
+            entry = cache.get(node)
+            if entry and entry[0] == prefix and entry[1] == context:
+                return entry[2]
+            return None
+
+        root_context = self.tree_model.selection.root_context()
+        if cached_block(root_node, root_context, "") is None:
+            # Frames: [node, context, prefix, children, next index, block]
+            stack = [[root_node, root_context, "",
+                      self._preview_children(root_node, root_context, filter_text, max_items_per_level), 0, []]]
+            while stack:
+                frame = stack[-1]
+                node, context, prefix, children, index, block = frame
+                if index >= len(children):
+                    stack.pop()
+                    cache[node] = (prefix, context, block)
+                    if stack:
+                        stack[-1][5].append(block)
+                    continue
+                frame[4] = index + 1
+                name, is_dir, child, child_context = children[index]
+                is_last = index == len(children) - 1
+                line = TREE_LAST if is_last else TREE_BRANCH
+                if is_dir is None: # Text marker ("..." or an error message)
+                    block.append(f"{prefix}{line}{name}\n")
+                    continue
+                totals = dir_totals.get(child) if is_dir else None
+                block.append(f"{prefix}{line}{'📁 ' if is_dir else '📄 '}{name}{f' [{format_totals(totals)}]' if totals else ''}\n")
+                # Only directories in the tree are expanded (unloaded ones show one listed level)
+                if is_dir and child is not None:
+                    child_prefix = prefix + (TREE_SPACE if is_last else TREE_PIPE)
+                    child_block = cached_block(child, child_context, child_prefix)
+                    if child_block is not None:
+                        block.append(child_block)
+                    else:
+                        stack.append([child, child_context, child_prefix,
+                                      self._preview_children(child, child_context, filter_text, max_items_per_level), 0, []])
+        return join_nested(cache[root_node][2])
+
+
+    def _preview_children(self, dir_node: int, context, filter_text, max_items_per_level):
+        """
+        Returns the selected and visible children of dir_node as (name, is_dir, node,
+        context) tuples, resolving selection one trie step down from the directory's
+        context; node is None for children listed from disk. Text markers ("...",
+        errors) use None as is_dir.
+        """
+        store = self.tree_model.store
+        child_state = self.tree_model.selection.child
         try:
-            # Check if item is selected and not filtered out
-            item_data = self.tree_data.get(dir_path)
-            if level > 0: # Don't check root itself for selection/filter for recursive call entry
-                 if not item_data or not item_data.get("selected", True):
-                     return "" # Item deselected
-
-                 item_widget = item_data.get("item")
-                 if item_widget and item_widget.isHidden():
-                     return "" # Item hidden by filter
-
-            items_to_process = []
-            # Get children from tree_data/widget if loaded, or listdir if not (for preview only)
-            parent_item = item_data.get("item") if item_data else None
-
-            children_paths = []
-            if parent_item and item_data and item_data.get("loaded"):
-                # Get loaded children from the widget
-                for i in range(parent_item.childCount()):
-                    child_item = parent_item.child(i)
-                    child_path = child_item.data(0, Qt.ItemDataRole.UserRole) # PyQt6 Enum
-                    if child_path: # Ignore placeholders/errors
-                        children_paths.append(child_path)
-            elif os.path.isdir(dir_path): # Only listdir if it's actually a directory
-                # List first few items from filesystem if not loaded (limit for preview)
-                try:
-                    dir_contents = os.listdir(dir_path)
-                    sorted_contents = sorted(dir_contents, key=lambda x: (not os.path.isdir(os.path.join(dir_path, x)), x.lower()))
-                    for name in sorted_contents[:max_items_per_level]:
-                        children_paths.append(os.path.join(dir_path, name))
-                    if len(sorted_contents) > max_items_per_level:
-                         children_paths.append("...") # Indicate more items exist
-
-                except PermissionError:
-                    output += f"{prefix}└── [Acceso denegado al listar]\n"
-                except Exception as e:
-                    output += f"{prefix}└── [Error al listar para preview: {e}]\n"
-
-            # Process the collected children paths
-            valid_children_count = 0
-            items_to_render = []
-            for i, child_path in enumerate(children_paths):
-                 if child_path == "...":
-                      items_to_render.append(("...", False, "..."))
-                      continue
-
-                 child_data = self.tree_data.get(child_path)
-                 selected = child_data.get("selected", True) if child_data else True # Default true if unknown
-
-                 # Check filter status from the widget if available, otherwise simple text check
-                 child_widget = child_data.get("item") if child_data else None
-                 is_hidden = child_widget.isHidden() if child_widget else False
-                 filter_text = self.filter_input.text().lower().strip()
-                 if not is_hidden and filter_text: # Double check text if widget wasn't available or somehow visible
-                     if filter_text not in os.path.basename(child_path).lower():
-                         is_hidden = True
-
-
-                 if selected and not is_hidden:
-                     is_dir = False
-                     try: is_dir = os.path.isdir(child_path)
-                     except: pass # Ignore errors just for preview type check
-                     items_to_render.append((os.path.basename(child_path), is_dir, child_path))
-                     valid_children_count += 1
-
-
-            # Render the filtered/selected children
-            for index, (name, is_dir, full_path) in enumerate(items_to_render):
-                is_last = index == len(items_to_render) - 1
-                line = "└── " if is_last else "├── "
-                next_prefix = "    " if is_last else "│   "
-
-                if full_path == "...":
-                     output += f"{prefix}{line}{name}\n"
-                else:
-                     output += f"{prefix}{line}{'📁 ' if is_dir else '📄 '}{name}\n"
-                     if is_dir:
-                         # Recursive call only for directories, limit depth implicitly via level check at start
-                         output += self._generate_preview_structure(full_path, prefix + next_prefix, level + 1, max_items_per_level)
+            if store.has(dir_node, FLAG_LOADED):
+                # Loaded children (error and filtered rows excluded)
+                items_to_render = []
+                for child in store.children[dir_node]:
+                    if store.flags[child] & (FLAG_HIDDEN | FLAG_MESSAGE):
+                        continue
+                    state, child_context = child_state(context, store.names[child])
+                    if state != SEL_EXCLUDE:
+                        items_to_render.append((store.names[child], store.has(child, FLAG_DIR), child, child_context))
+                return items_to_render
+
+            # List first few items from filesystem if not loaded (limit for preview)
+            # Only directories reach this point: files are never expanded
+            instrumentation = self.instrumentation
+            start = time.perf_counter()
+            try:
+                entries = self._list_directory(store.path(dir_node))
+            except PermissionError:
+                return [("[Acceso denegado al listar]", None, None, None)]
+            except Exception as e:
+                return [(f"[Error al listar para preview: {e}]", None, None, None)]
+            finally:
+                if instrumentation:
+                    instrumentation.add("preview.list", time.perf_counter() - start)
+
+            items_to_render = [(entry.name, entry.is_dir, None, None) for entry in entries[:max_items_per_level]
+                               if (not filter_text or filter_text in entry.name.lower())
+                               and child_state(context, entry.name)[0] != SEL_EXCLUDE]
+            if len(entries) > max_items_per_level:
+                items_to_render.append(("...", None, None, None)) # Indicate more items exist
+            return items_to_render
 
-        except PermissionError:
-            # This might catch permission error for the dir_path itself
-            output += f"{prefix}[Acceso denegado a: {os.path.basename(dir_path)}]\n"
         except Exception as e:
-             output += f"{prefix}[Error preview: {e}]\n"
-             logging.warning(f"Error generando sub-preview para {dir_path}: {e}")
+             hot_log.warning("Error generando sub-preview para nodo %d: %s", dir_node, e)
+             return [(f"[Error preview: {e}]", None, None, None)]
 
-        return output
 
-
-    def _update_status(self, message: str, color_hex: str):
-        """Updates the status label text and color, and logs the message."""
-        logging.info(message) # Log the message
+    def _update_status(self, message: str, color_hex: str, log=True):
+        """
+        Updates the status label text and color, and logs the message. Per-directory
+        messages pass log=False; their callers log them through hot_log by category.
+        """
+        if log:
+            logging.info(message)
         self.status_label.setText(message)
-        # Use style sheet for color
-        self.status_label.setStyleSheet(f"#StatusLabel {{ color: {color_hex}; padding: 5px; border-top: 1px solid {COLOR_BORDER}; }}")
-        # Force immediate UI update
-        QApplication.processEvents()
+        # Restyle only when the color changes (style sheets are re-parsed on every call)
+        if color_hex != self._status_color:
+            self._status_color = color_hex
+            self.status_label.setStyleSheet(f"#StatusLabel {{ color: {color_hex}; padding: 5px; border-top: 1px solid {COLOR_BORDER}; }}")
+
+
+    def _on_mapping_progress(self, snapshot: ProgressSnapshot):
+        """Shows throttled mapping progress (no logging or restyling per update)."""
+        self.status_label.setText(format_progress(snapshot))
 
 
     def start_mapping(self):
@@ -1101,24 +1893,76 @@ class EnhancedFolderMapper(QMainWindow):
         logging.info(f"Iniciando mapeo para: {root_path}")
         self._update_status("Iniciando mapeo...", COLOR_PRIMARY)
         self.generate_btn.setEnabled(False) # Disable button while running
-
-        # Pass a copy of relevant tree_data (paths and selection state) to the worker
-        mapping_data = {path: {"selected": data["selected"]}
-                        for path, data in self.tree_data.items()
-                        if data.get("item")} # Ensure item exists (is loaded)
-
-        self.mapping_worker = MappingWorker(root_path, mapping_data)
+        self.cancel_btn.setEnabled(True)
+
+        # Pass a snapshot of the selection trie (only the explicit marks) to the worker
+        selection = self.tree_model.selection.copy()
+
+        # Directories in the tree (loaded or not) whose totals the map reports back
+        store = self.tree_model.store
+        targets = {store.path(node): node for node in range(len(store))
+                   if store.flags[node] & FLAG_DIR and not store.flags[node] & FLAG_REMOVED}
+        self._totals_targets = (store, targets)
+
+        self.mapping_worker = MappingWorker(root_path, selection, self.workers_spin.value(), self._lister(),
+                                            record_totals=targets, fmt=self.format_combo.currentData(),
+                                            compression=self.compression_combo.currentData(),
+                                            rules=self.ignore_rules, instrumentation=self.instrumentation,
+                                            profile=self.profile_checkbox.isChecked())
         self.mapping_worker.finished.connect(self.on_mapping_finished)
+        self.mapping_worker.cancelled.connect(self.on_mapping_cancelled)
         self.mapping_worker.status_update.connect(self._update_status) # Connect mapper status updates
+        self.mapping_worker.progress.connect(self._on_mapping_progress)
         self.mapping_worker.start()
 
 
+    def _apply_map_totals(self):
+        """Shows the directory totals of the finished map in the tree column and the preview."""
+        store, targets = self._totals_targets
+        if store is not self.tree_model.store:
+            return # Another folder was opened while mapping
+        for path, totals in self.mapping_worker.mapper.totals.items():
+            if store.is_alive(targets[path]):
+                self.tree_model.totals[targets[path]] = totals
+        self._preview_cache.clear() # Directory lines now carry their totals
+        self.tree.viewport().update()
+        self._update_preview()
+
+
+    def cancel_mapping(self):
+        """Asks the running MappingWorker to stop (it finishes the entry in progress)."""
+        if self.mapping_worker and self.mapping_worker.isRunning():
+            self.mapping_worker.cancel(keep_partial=self.partial_checkbox.isChecked())
+            self.cancel_btn.setEnabled(False)
+            self._update_status("Cancelando mapeo...", COLOR_PRIMARY)
+
+
+    def on_mapping_cancelled(self, partial_path: str):
+        """Slot called when MappingWorker stops after a cancellation (status already reported)."""
+        self.generate_btn.setEnabled(True)
+        self.cancel_btn.setEnabled(False)
+        if self.scan_index:
+            self.scan_index.flush() # The listings made so far remain valid
+        self._keep_profile_report()
+        self.mapping_worker = None
+        self._totals_targets = None # Partial totals are not shown
+
+
     def on_mapping_finished(self, output_path_or_error: str, success: bool):
         """Slot called when MappingWorker finishes."""
         self.generate_btn.setEnabled(True) # Re-enable button
+        self.cancel_btn.setEnabled(False)
+        if self.scan_index:
+            self.scan_index.flush() # Persist the listings made during the mapping
+        cache_stats = self.listing_cache.stats()
+        logging.info("Caché de listados: %(hits)d aciertos, %(misses)d fallos, %(evictions)d desalojos, "
+                     "%(listings)d carpetas (%(entries)d elementos) en memoria", cache_stats,
+                     extra={"fields": {"event": "listing_cache", **cache_stats}})
+        self._keep_profile_report()
         if success:
             output_path = output_path_or_error
             logging.info(f"Mapeo completado exitosamente: {output_path}")
+            self._apply_map_totals()
             # Status already updated by worker's status_update signal
             reply = QMessageBox.information(self, "Mapeo Completado",
                                             f"Archivo de estructura generado en:\n{output_path}\n\n¿Abrir directorio contenedor?",
@@ -1134,6 +1978,14 @@ class EnhancedFolderMapper(QMainWindow):
             # Status already updated by worker's status_update signal
             QMessageBox.critical(self, "Error de Mapeo", f"Ocurrió un error durante el mapeo:\n{error_msg}")
         self.mapping_worker = None # Clean up worker reference
+        self._totals_targets = None
+
+
+    def _keep_profile_report(self):
+        """Keeps the profile of the finished map (if it was profiled) for the diagnostics panel."""
+        capture = self.mapping_worker.capture
+        if capture and capture.report is not None:
+            self._profile_report = capture.report
 
 
     def open_location(self, path):
@@ -1151,12 +2003,10 @@ class EnhancedFolderMapper(QMainWindow):
             if sys.platform == 'win32':
                 # Use os.startfile on Windows
                 os.startfile(abs_path)
-            elif sys.platform == 'darwin':
-                # Use 'open' command on macOS
-                subprocess.Popen(['open', abs_path])
             else:
-                # Use 'xdg-open' command on Linux/other Unix-like
-                subprocess.Popen(['xdg-open', abs_path])
+                import subprocess # Only needed here; kept out of startup
+                # Use 'open' command on macOS and 'xdg-open' on Linux/other Unix-like
+                subprocess.Popen(['open' if sys.platform == 'darwin' else 'xdg-open', abs_path])
         except Exception as e:
             logging.error(f"No se pudo abrir la ubicación '{path}': {e}")
             QMessageBox.warning(self, "Error", f"No se pudo abrir la ubicación:\n{e}")
@@ -1164,45 +2014,49 @@ class EnhancedFolderMapper(QMainWindow):
 
     def show_context_menu(self, position: QPoint):
         """Shows the context menu for a tree item."""
-        item = self.tree.itemAt(position)
-        if not item: return
+        index = self.tree.indexAt(position)
+        if not index.isValid(): return
 
-        item_path = item.data(0, Qt.ItemDataRole.UserRole) # PyQt6 Enum
-        if not item_path: # Don't show menu for placeholders or errors
+        store = self.tree_model.store
+        node = self.tree_model.node_from_index(index)
+        if store.has(node, FLAG_MESSAGE): # Don't show menu for error rows
             return
+        node_path = store.path(node)
 
         menu = QMenu(self) # Parent menu to self
 
         # --- Selection Action ---
-        is_selected = self.tree_data.get(item_path, {}).get("selected", True)
+        is_selected = self.tree_model.selection_state(node) != SEL_EXCLUDE
         toggle_action_text = "Deseleccionar (y descendientes)" if is_selected else "Seleccionar (y descendientes)"
         # Use QAction for better handling
         toggle_action = QAction(toggle_action_text, self)
-        toggle_action.triggered.connect(lambda: self.toggle_item_selection(item, not is_selected, True) or self._update_preview())
+        toggle_action.triggered.connect(lambda: self.toggle_item_selection(node, not is_selected) or self._update_preview())
         menu.addAction(toggle_action)
 
         menu.addSeparator()
 
         # --- Expand/Collapse Actions (if directory) ---
-        if os.path.isdir(item_path):
-            if not item.isExpanded():
+        name_index = self.tree_model.index_for_node(node)
+        node_is_dir = store.has(node, FLAG_DIR)
+        if node_is_dir:
+            if not self.tree.isExpanded(name_index):
                 expand_action = QAction("Expandir", self)
-                expand_action.triggered.connect(lambda: self.on_item_expanded_or_load(item)) # Use unified handler
+                expand_action.triggered.connect(lambda: self.tree.expand(name_index)) # Loading follows the expanded signal
                 menu.addAction(expand_action)
             else:
                 collapse_action = QAction("Colapsar", self)
-                collapse_action.triggered.connect(lambda: item.setExpanded(False))
+                collapse_action.triggered.connect(lambda: self.tree.collapse(name_index))
                 menu.addAction(collapse_action)
             menu.addSeparator()
 
         # --- Open Location Action ---
         open_action = QAction("Abrir ubicación", self)
-        dir_to_open = os.path.dirname(item_path) if not os.path.isdir(item_path) else item_path
+        dir_to_open = node_path if node_is_dir else os.path.dirname(node_path)
         open_action.triggered.connect(lambda: self.open_location(dir_to_open))
         menu.addAction(open_action)
 
         # Execute menu at global position
-        menu.exec(self.tree.mapToGlobal(position)) # Use exec() in PyQt6
+        menu.exec(self.tree.viewport().mapToGlobal(position)) # Use exec() in PyQt6
 
 
     # --- Drag and Drop Event Handlers ---
@@ -1216,7 +2070,7 @@ class EnhancedFolderMapper(QMainWindow):
                 path = urls[0].toLocalFile()
                 if os.path.isdir(path):
                     event.acceptProposedAction()
-                    logging.debug(f"Drag Enter accepted for folder: {path}")
+                    logging.debug("Drag Enter accepted for folder: %s", path)
                     return # Accepted, exit early
         # If conditions not met, ignore
         logging.debug("Drag Enter rejected (not a single folder)")
@@ -1251,15 +2105,23 @@ class EnhancedFolderMapper(QMainWindow):
         # Optional: Add confirmation dialog or cleanup here if needed
         logging.info("Folder Mapper application closing.")
         # Terminate worker threads gracefully if they are running
-        if self.loader_worker and self.loader_worker.isRunning():
-             logging.info("Terminating directory loader worker...")
-             self.loader_worker.quit() # Request termination
-             self.loader_worker.wait(1000) # Wait max 1 sec
+        logging.info("Stopping directory loader pool...")
+        if self._loader_pool:
+            self._loader_pool.shutdown(1000) # Queued loads are dropped; waits max 1 sec for running ones
+        if self._prefetcher:
+            self._prefetcher.close()
         if self.mapping_worker and self.mapping_worker.isRunning():
-             logging.info("Terminating mapping worker...")
-             self.mapping_worker.quit() # Request termination
-             self.mapping_worker.wait(1000) # Wait max 1 sec
+            # run() has no event loop (quit() would do nothing): ask the traversal itself to stop
+            logging.info("Cancelling mapping worker...")
+            self.mapping_worker.cancel(keep_partial=self.partial_checkbox.isChecked())
+            if not self.mapping_worker.wait(SHUTDOWN_WAIT_MS):
+                logging.warning("Mapping worker still busy (blocked listing a directory); closing anyway")
 
+        self._unwatch_all()
+        if self.mapping_worker and self.mapping_worker.isRunning():
+            logging.warning("Persistent index left open: the mapping worker may still be listing through it")
+        else:
+            self._close_scan_index()
         event.accept() # Accept the close event
 
 
@@ -1267,6 +2129,7 @@ class EnhancedFolderMapper(QMainWindow):
 # Point d'entrée principal de l'application / Main application entry point
 # ─────────────────────────────────────────────────────────────────────────────
 if __name__ == '__main__':
+    configure_logging()
     # Ensure QApplication instance exists before any widgets
     app = QApplication(sys.argv)
 
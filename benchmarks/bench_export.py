@@ -0,0 +1,76 @@
+"""
+Throughput of every output format and compression of StructureMapper.write().
+
+Usage: python benchmarks/bench_export.py [existing_root]
+Without arguments a synthetic tree is created in a temporary directory. The
+tree is listed once and then served from memory, so each run measures the
+traversal, formatting, encoding and compression only, not the disk listing.
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from folder_mapper_core import (MAP_COMPRESSIONS, MAP_FORMATS, StructureMapper, # noqa: E402
+                                available_compressions, scan_directory)
+from synthetic_tree import build_tree # noqa: E402
+
+RUNS = 3
+
+
+def preload(root):
+    """Lists the whole tree once; returns a lister serving those listings from memory."""
+    listings = {}
+    pending = [root]
+    while pending:
+        path = pending.pop()
+        try:
+            listings[path] = scan_directory(path)
+        except OSError:
+            continue
+        pending.extend(entry.path for entry in listings[path] if entry.is_dir)
+
+    def lister(path):
+        if path not in listings:
+            raise PermissionError(path)
+        return listings[path]
+    return lister, sum(len(entries) for entries in listings.values())
+
+
+def measure(root, lister, entries, output_dir, fmt, compression):
+    output_path = os.path.join(output_dir, "map" + MAP_FORMATS[fmt] + (MAP_COMPRESSIONS[compression] if compression else ""))
+    best = None
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        StructureMapper(root, lister=lister).write(output_path, fmt, compression)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    size = os.path.getsize(output_path)
+    label = fmt + (f"+{compression}" if compression else "")
+    print(f"  {label:<12} {best:6.2f}s  {entries / best:10,.0f} entries/s  "
+          f"{size / (1024 * 1024) / best:7.1f} MB/s  {size / (1024 * 1024):7.1f} MB")
+
+
+def run(root):
+    lister, entries = preload(root)
+    print(f"{entries} entries, best of {RUNS} runs")
+    with tempfile.TemporaryDirectory() as output_dir: # Outside root so the maps are not listed
+        for fmt in MAP_FORMATS:
+            for compression in [None] + available_compressions():
+                measure(root, lister, entries, output_dir, fmt, compression)
+
+
+def main():
+    if len(sys.argv) > 1:
+        run(sys.argv[1])
+        return
+    with tempfile.TemporaryDirectory() as root:
+        directories, files = build_tree(root, depth=4, dirs_per_level=5, files_per_dir=40, max_file_size=64)
+        print(f"Synthetic tree: {directories} directories, {files} files")
+        run(root)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Import time of the Qt-free core and the command line against the GUI module,
+each measured in fresh interpreters.
+
+Usage: python benchmarks/bench_import.py [runs]
+Reports the median wall time over an empty interpreter start and whether any
+PyQt6 module was loaded. The GUI module is skipped when PyQt6 is not installed.
+"""
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULES = ["folder_mapper_core", "folder_mapper_cli", "Folder_mapper"]
+CHECK_QT = "import sys; print(sum(name.startswith('PyQt6') for name in sys.modules))"
+
+
+def run_python(code, cwd):
+    """Runs code in a fresh interpreter; returns (seconds, stdout)."""
+    env = dict(os.environ, PYTHONPATH=PACKAGE_DIR, PYTHONDONTWRITEBYTECODE="1")
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, "-c", code], cwd=cwd, env=env,
+                            capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+    if result.returncode:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    return elapsed, result.stdout.strip()
+
+
+def measure(code, runs, cwd):
+    run_python(code, cwd) # Warm the OS file cache
+    return statistics.median(run_python(code, cwd)[0] for _ in range(runs))
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 15
+    # Run from a scratch directory so nothing the modules may write lands in the checkout
+    with tempfile.TemporaryDirectory() as cwd:
+        baseline = measure("pass", runs, cwd)
+        print(f"Interpreter start: {baseline * 1000:.1f} ms (median of {runs})")
+        for module in MODULES:
+            try:
+                elapsed = measure(f"import {module}", runs, cwd)
+                _, qt_modules = run_python(f"import {module}; {CHECK_QT}", cwd)
+            except RuntimeError as e:
+                print(f"  {module:<20} skipped ({e})")
+                continue
+            print(f"  {module:<20} +{(elapsed - baseline) * 1000:7.1f} ms  PyQt6 modules loaded: {qt_modules}")
+
+
+if __name__ == "__main__":
+    main()
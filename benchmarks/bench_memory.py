@@ -0,0 +1,75 @@
+"""
+Peak Python memory of map generation: the former join-based rendering, which
+held the whole map in memory, against the streaming StructureMapper writer.
+
+Usage: python benchmarks/bench_memory.py
+Peak memory of the streaming writer should stay flat as the tree grows.
+"""
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from folder_mapper_core import StructureMapper, format_size, scan_directory, write_lines # noqa: E402
+from synthetic_tree import build_tree # noqa: E402
+
+
+def legacy_render(dir_path, prefix=""):
+    """Join-based rendering used before streaming: every level joins its subtree again."""
+    entries = scan_directory(dir_path)
+    result = []
+    for index, entry in enumerate(entries):
+        is_last = index == len(entries) - 1
+        line = "└── " if is_last else "├── "
+        next_prefix = "    " if is_last else "│   "
+        if entry.is_dir:
+            child_entries = scan_directory(entry.path)
+            result.append(f"{prefix}{line}📁 {entry.name} ({len(child_entries)} items)")
+            sub_result = legacy_render(entry.path, prefix + next_prefix)
+            if sub_result:
+                result.append(sub_result)
+        else:
+            result.append(f"{prefix}{line}📄 {entry.name} ({format_size(entry.size)})")
+    return "\n".join(result)
+
+
+def legacy_map(root, output_path):
+    estructura = legacy_render(root)
+    with open(output_path, "w", encoding="utf-8") as f:
+        f.write(estructura)
+
+
+def streaming_map(root, output_path):
+    mapper = StructureMapper(root)
+    with open(output_path, "w", encoding="utf-8", buffering=1024 * 1024) as f:
+        write_lines(f, mapper.mapear_estructura(root))
+
+
+def measure(label, func, root, output_path):
+    tracemalloc.start()
+    start = time.perf_counter()
+    func(root, output_path)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"  {label:<10} peak={peak / (1024 * 1024):8.2f} MB  time={elapsed:.2f}s  "
+          f"output={os.path.getsize(output_path) / (1024 * 1024):.2f} MB")
+
+
+def main():
+    for dirs_per_level in (4, 8):
+        with tempfile.TemporaryDirectory() as work_dir:
+            root = os.path.join(work_dir, "tree")
+            directories, files = build_tree(root, depth=3, dirs_per_level=dirs_per_level,
+                                            files_per_dir=60, max_file_size=16)
+            output_path = os.path.join(work_dir, "map.txt")
+            print(f"Tree: {directories} directories, {files} files")
+            measure("legacy", legacy_map, root, output_path)
+            measure("streaming", streaming_map, root, output_path)
+
+
+if __name__ == "__main__":
+    main()
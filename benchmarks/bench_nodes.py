@@ -0,0 +1,111 @@
+"""
+Python memory per tree node: the former tree_data dict-of-dicts keyed by full
+path, the __slots__ node records that replaced it, and the compact NodeStore.
+
+Usage: python benchmarks/bench_nodes.py [nodes]
+The tree is built in memory (no disk access), 100 entries per directory.
+QTreeWidgetItem objects of the legacy layout live in C++ and are not counted.
+"""
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from folder_mapper_core import NodeStore, ROOT_NODE # noqa: E402
+
+ROOT = os.path.join(os.sep, "home", "user", "projects", "workspace")
+ENTRIES_PER_DIR = 100
+DIRS_PER_DIR = 10 # First entries of every directory are subdirectories
+
+
+def synthetic_entries(total):
+    """Yields (parent_key, name, is_dir) breadth-first until total nodes exist."""
+    produced = 0
+    queue = [None] # Keys of directories waiting for children; None is the root
+    next_key = 0
+    while produced < total:
+        parent = queue.pop(0)
+        for i in range(min(ENTRIES_PER_DIR, total - produced)):
+            is_dir = i < DIRS_PER_DIR
+            name = f"folder_{i:02d}" if is_dir else f"module_{i:03d}.py" # Fresh string per entry
+            yield parent, next_key, name, is_dir
+            if is_dir:
+                queue.append(next_key)
+            next_key += 1
+            produced += 1
+
+
+def build_legacy(total):
+    """{full_path: {"selected", "loaded", "is_dir", "item"}} as kept before the model view."""
+    tree_data = {}
+    paths = {None: ROOT}
+    for parent, key, name, is_dir in synthetic_entries(total):
+        path = os.path.join(paths[parent], name)
+        if is_dir:
+            paths[key] = path
+        tree_data[path] = {"selected": True, "loaded": False, "is_dir": is_dir, "item": None}
+    return tree_data
+
+
+class SlotNode:
+    """Per-node record with full path, as kept by the first model/view version."""
+    __slots__ = ("name", "path", "is_dir", "parent", "row", "children", "fetched",
+                 "loaded", "selected", "hidden")
+
+    def __init__(self, name, path, is_dir, parent):
+        self.name, self.path, self.is_dir, self.parent = name, path, is_dir, parent
+        self.row, self.children, self.fetched = 0, [], 0
+        self.loaded, self.selected, self.hidden = False, True, False
+
+
+def build_slots(total):
+    tree_data = {}
+    root = SlotNode("", ROOT, True, None)
+    nodes = {None: root}
+    for parent, key, name, is_dir in synthetic_entries(total):
+        parent_node = nodes[parent]
+        node = SlotNode(name, os.path.join(parent_node.path, name), is_dir, parent_node)
+        node.row = len(parent_node.children)
+        parent_node.children.append(node)
+        tree_data[node.path] = node
+        if is_dir:
+            nodes[key] = node
+    return tree_data
+
+
+def build_store(total):
+    store = NodeStore(ROOT)
+    nodes = {None: ROOT_NODE}
+    for parent, key, name, is_dir in synthetic_entries(total):
+        parent_node = nodes[parent]
+        node = store.add(parent_node, name, is_dir)
+        store.rows[node] = len(store.children[parent_node])
+        store.children[parent_node].append(node)
+        if is_dir:
+            nodes[key] = node
+    return store
+
+
+def measure(label, build, total):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = build(total)
+    elapsed = time.perf_counter() - start
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"  {label:<8} {current / (1024 * 1024):8.1f} MB  {current / total:6.1f} bytes/node  build={elapsed:.2f}s")
+    return result
+
+
+def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    print(f"Tree: {total} nodes, {ENTRIES_PER_DIR} entries per directory")
+    measure("legacy", build_legacy, total)
+    measure("slots", build_slots, total)
+    measure("store", build_store, total)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Compares filesystem calls per entry between the former listdir/isdir/getsize
+listing and the scandir-based scan_directory engine.
+
+Usage: python benchmarks/bench_scan.py [existing_root]
+Without arguments a synthetic tree is created in a temporary directory.
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from folder_mapper_core import scan_directory # noqa: E402
+from fs_counters import counting_fs_calls # noqa: E402
+from synthetic_tree import build_tree # noqa: E402
+
+
+def legacy_map(dir_path):
+    """Listing pattern used by mapear_estructura before scan_directory."""
+    entries = 0
+    contents = os.listdir(dir_path)
+    for name in sorted(contents, key=lambda x: (not os.path.isdir(os.path.join(dir_path, x)), x.lower())):
+        full_path = os.path.join(dir_path, name)
+        entries += 1
+        if os.path.isdir(full_path):
+            len(os.listdir(full_path)) # Item count
+            if os.path.isdir(full_path): # Check before recursing
+                entries += legacy_map(full_path)
+        else:
+            os.path.getsize(full_path)
+    return entries
+
+
+def scandir_map(dir_path, entries_list=None):
+    """Same traversal through scan_directory: one listing per directory, one stat per entry."""
+    entries = 0
+    for entry in entries_list if entries_list is not None else scan_directory(dir_path):
+        entries += 1
+        if entry.is_dir:
+            entries += scandir_map(entry.path, scan_directory(entry.path))
+    return entries
+
+
+def measure(label, func, root):
+    with counting_fs_calls() as counter:
+        start = time.perf_counter()
+        entries = func(root)
+        elapsed = time.perf_counter() - start
+    calls = counter["listing"] + counter["stat"]
+    print(f"{label:<10} entries={entries:<8} listings={counter['listing']:<7} stats={counter['stat']:<8} "
+          f"calls/entry={calls / max(entries, 1):.2f} time={elapsed:.3f}s")
+
+
+def main():
+    if len(sys.argv) > 1:
+        root = sys.argv[1]
+        measure("legacy", legacy_map, root)
+        measure("scandir", scandir_map, root)
+        return
+    with tempfile.TemporaryDirectory() as root:
+        directories, files = build_tree(root, depth=3, dirs_per_level=5, files_per_dir=40)
+        print(f"Synthetic tree: {directories} directories, {files} files")
+        measure("legacy", legacy_map, root)
+        measure("scandir", scandir_map, root)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Startup time of the desktop application: from a fresh interpreter to the first
+paint of the main window, cold (empty bytecode cache) and warm.
+
+Usage: python benchmarks/bench_startup.py [runs] [--profile]
+Each run starts a new interpreter with the offscreen Qt platform (override with
+QT_QPA_PLATFORM) and reports the median of every phase. Cold runs use a new,
+empty PYTHONPYCACHEPREFIX so every module is compiled again, as on the first
+launch after an install; the operating system file cache is not dropped.
+--profile prints the functions that took the most time up to the first paint.
+Skipped when PyQt6 is not installed.
+"""
+import importlib.util
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PHASES = ["qt_import", "app_import", "qapplication", "window", "first_paint"]
+PROFILE_LINES = 25
+
+# Runs in the child interpreter; prints the phase marks (seconds since its start) as JSON
+CHILD = r"""
+import sys, time, json
+start = time.perf_counter()
+profiler = None
+if "--profile" in sys.argv:
+    import cProfile
+    profiler = cProfile.Profile()
+    profiler.enable()
+marks = {}
+from PyQt6.QtCore import QEvent, QObject, QTimer
+from PyQt6.QtWidgets import QApplication
+marks["qt_import"] = time.perf_counter()
+import Folder_mapper
+marks["app_import"] = time.perf_counter()
+app = QApplication(sys.argv[:1])
+marks["qapplication"] = time.perf_counter()
+
+class FirstPaint(QObject):
+    def eventFilter(self, watched, event):
+        if event.type() == QEvent.Type.Paint and "first_paint" not in marks:
+            marks["first_paint"] = time.perf_counter()
+            QTimer.singleShot(0, app.quit)
+        return False
+
+first_paint = FirstPaint()
+app.installEventFilter(first_paint)
+window = Folder_mapper.EnhancedFolderMapper()
+marks["window"] = time.perf_counter()
+QTimer.singleShot(10000, app.quit) # Never hang if no paint event arrives
+app.exec()
+if profiler:
+    profiler.disable()
+print(json.dumps({phase: mark - start for phase, mark in marks.items()}))
+if profiler:
+    import pstats
+    pstats.Stats(profiler, stream=sys.stdout).sort_stats("cumulative").print_stats(%d)
+""" % PROFILE_LINES
+
+
+def run_child(cache_dir, cwd, profile=False):
+    """Starts the application once; returns (wall seconds, phase marks, extra output)."""
+    env = dict(os.environ, PYTHONPATH=PACKAGE_DIR, PYTHONPYCACHEPREFIX=cache_dir)
+    env.pop("PYTHONDONTWRITEBYTECODE", None) # Warm runs need the compiled bytecode
+    env.setdefault("QT_QPA_PLATFORM", "offscreen")
+    args = [sys.executable, "-c", CHILD] + (["--profile"] if profile else [])
+    start = time.perf_counter()
+    result = subprocess.run(args, cwd=cwd, env=env, capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+    if result.returncode:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    first_line, _, rest = result.stdout.partition("\n")
+    marks = json.loads(first_line)
+    if "first_paint" not in marks:
+        raise RuntimeError("the window was never painted")
+    return elapsed, marks, rest
+
+
+def report(label, samples):
+    """Prints the median wall time and the median of each phase mark."""
+    walls = [wall for wall, _ in samples]
+    print(f"{label}: {statistics.median(walls) * 1000:.0f} ms to exit (median of {len(samples)})")
+    previous = 0.0
+    for phase in PHASES:
+        mark = statistics.median(marks[phase] for _, marks in samples)
+        print(f"  {phase:<13} {mark * 1000:7.1f} ms  (+{(mark - previous) * 1000:6.1f})")
+        previous = mark
+
+
+def main():
+    args = [arg for arg in sys.argv[1:] if arg != "--profile"]
+    runs = int(args[0]) if args else 5
+    if importlib.util.find_spec("PyQt6") is None:
+        print("Skipped: PyQt6 is not installed")
+        return
+
+    # Scratch working directory: nothing the application may write lands in the checkout
+    with tempfile.TemporaryDirectory() as cwd:
+        cold = []
+        for _ in range(runs):
+            with tempfile.TemporaryDirectory() as cache_dir:
+                cold.append(run_child(cache_dir, cwd)[:2])
+        report("Cold start (empty bytecode cache)", cold)
+
+        with tempfile.TemporaryDirectory() as cache_dir:
+            run_child(cache_dir, cwd) # Fills the bytecode cache
+            warm = [run_child(cache_dir, cwd)[:2] for _ in range(runs)]
+            report("Warm start", warm)
+            if "--profile" in sys.argv:
+                print(f"\nTop {PROFILE_LINES} functions by cumulative time (warm start, up to the first paint):")
+                print(run_child(cache_dir, cwd, profile=True)[2])
+
+
+if __name__ == "__main__":
+    main()
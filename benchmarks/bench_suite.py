@@ -0,0 +1,326 @@
+"""
+Benchmark suite: wall time, filesystem calls and peak memory of the scanning,
+tree loading, filtering, preview and mapping paths over deterministic synthetic
+trees, saved as JSON so that runs (and releases) can be compared.
+
+Usage: python benchmarks/bench_suite.py [-o RESULTS.json] [--compare OLD.json]
+           [--shapes balanced,wide,deep] [--paths scan,load,filter,preview,map]
+           [--repeat N] [--trees DIR] [--quick]
+           [--depth D] [--fanout F] [--files N] [--sizes uniform|lognormal|empty]
+
+Shapes: "balanced" (depth levels of fanout subdirectories with files files each,
+sizes drawn from the chosen distribution), "wide" (a single directory with 500k
+files) and "deep" (1000 nested levels). --quick shrinks the last two to 50k
+files and 200 levels. Trees are generated once per --trees directory and reused
+by later runs with the same parameters (a temporary directory by default).
+
+Every (shape, path) case runs in a fresh interpreter: the median wall time of
+--repeat runs, then one run counting listings and stats made through the os
+module, one under tracemalloc for the peak Python memory, and the peak RSS of
+the process. load, filter and preview drive the application window with the
+offscreen Qt platform (override with QT_QPA_PLATFORM) and are skipped when
+PyQt6 is not installed. The exit status is 1 when any case fails or times out.
+"""
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PACKAGE_DIR)
+
+from synthetic_tree import SIZE_DISTRIBUTIONS, build_deep, build_tree, build_wide, long_path # noqa: E402
+
+SHAPES = ["balanced", "wide", "deep"]
+PATHS = ["scan", "load", "filter", "preview", "map"]
+QT_PATHS = {"load", "filter", "preview"}
+WIDE_FILES, WIDE_FILES_QUICK = 500_000, 50_000
+DEEP_LEVELS, DEEP_LEVELS_QUICK = 1000, 200
+FILTER_QUERIES = ["f", "fi", "file_0", "file_00001", "dir", ""] # Typed, refined, replaced and cleared
+CASE_TIMEOUT_SECONDS = 1800
+RESULTS_VERSION = 1
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Casos (se ejecutan en el intérprete hijo)
+# ─────────────────────────────────────────────────────────────────────────────
+
+def scan_case(root, work_dir):
+    """Lists every directory with scan_directory (the engine under every other path)."""
+    from folder_mapper_core import scan_directory
+
+    def run():
+        entries, pending = 0, [root]
+        while pending:
+            try:
+                listing = scan_directory(pending.pop())
+            except OSError:
+                continue
+            entries += len(listing)
+            pending.extend(entry.path for entry in listing if entry.is_dir)
+        return entries
+    return run
+
+
+def map_case(root, work_dir):
+    """Writes the text map of the whole tree with the default number of scan threads."""
+    from folder_mapper_core import DEFAULT_SCAN_WORKERS, StructureMapper
+    output_path = os.path.join(work_dir, "map.txt") # Outside the tree
+
+    def run():
+        mapper = StructureMapper(root, workers=DEFAULT_SCAN_WORKERS)
+        mapper.write(output_path)
+        return mapper.progress.entries
+    return run
+
+
+_qt_app = None # The window's widgets are deleted with the QApplication: keep it for the whole child
+
+
+def _open_window():
+    global _qt_app
+    from PyQt6.QtWidgets import QApplication
+    import Folder_mapper
+    _qt_app = QApplication.instance() or QApplication(sys.argv[:1])
+    return Folder_mapper, Folder_mapper.EnhancedFolderMapper()
+
+
+def _load_everything(app_module, window, root):
+    """Opens root and loads every directory, as if the user expanded them all; returns the node count."""
+    window.listing_cache.clear() # Every run lists from disk (the OS cache stays warm)
+    window.select_folder(root)
+    store = window.tree_model.store
+    pending = [app_module.ROOT_NODE]
+    while pending:
+        node = pending.pop()
+        if node in window._pending_inserts: # Attach the whole listing, not just the first screenful
+            window._insert_chunk(node, len(window._pending_inserts[node][0]))
+        for child in store.children[node]:
+            if store.has(child, app_module.FLAG_DIR):
+                window._populate_tree_level(child, store.path(child))
+                pending.append(child)
+    return len(store)
+
+
+def load_case(root, work_dir):
+    """Opens the root in the window and loads the whole tree into the model."""
+    app_module, window = _open_window()
+    return lambda: _load_everything(app_module, window, root)
+
+
+def filter_case(root, work_dir):
+    """Applies FILTER_QUERIES in turn to the fully loaded tree (the preview follows each one)."""
+    app_module, window = _open_window()
+    nodes = _load_everything(app_module, window, root)
+
+    def run():
+        for query in FILTER_QUERIES:
+            window._apply_filter(query)
+        return nodes
+    return run
+
+
+def preview_case(root, work_dir):
+    """Renders the preview of the fully loaded tree from an empty block cache."""
+    app_module, window = _open_window()
+    _load_everything(app_module, window, root)
+
+    def run():
+        window._preview_cache.clear()
+        return window._generate_preview_structure(app_module.ROOT_NODE).count("\n") + 1
+    return run
+
+
+CASES = {"scan": scan_case, "load": load_case, "filter": filter_case, "preview": preview_case, "map": map_case}
+
+
+def _peak_rss_mb():
+    """Peak resident memory of this process, or None where the resource module is missing."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024 # Bytes on macOS, KB elsewhere
+
+
+def run_child(path, root, work_dir, repeat):
+    """Measures one case and prints its result as JSON."""
+    from fs_counters import counting_fs_calls
+    run = CASES[path](root, work_dir)
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        entries = run()
+        runs.append(time.perf_counter() - start)
+    with counting_fs_calls() as counter:
+        run()
+    tracemalloc.start()
+    run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(json.dumps({"wall_s": statistics.median(runs), "runs_s": runs, "entries": entries,
+                      "fs_calls": {"listing": counter["listing"], "stat": counter["stat"]},
+                      "peak_python_mb": peak / (1024 * 1024), "peak_rss_mb": _peak_rss_mb()}))
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Árboles sintéticos y ejecución de la suite
+# ─────────────────────────────────────────────────────────────────────────────
+
+def shape_params(args):
+    """Builder and parameters of every shape for these arguments."""
+    return {
+        "balanced": (build_tree, {"depth": args.depth, "dirs_per_level": args.fanout, "files_per_dir": args.files,
+                                  "max_file_size": args.max_size, "size_distribution": args.sizes}),
+        "wide": (build_wide, {"files": WIDE_FILES_QUICK if args.quick else WIDE_FILES}),
+        "deep": (build_deep, {"levels": DEEP_LEVELS_QUICK if args.quick else DEEP_LEVELS}),
+    }
+
+
+def ensure_tree(trees_dir, shape, builder, params):
+    """Generates the tree of shape once per set of parameters; returns (root, description)."""
+    name = shape + "-" + "-".join(str(value) for value in params.values())
+    root = long_path(os.path.join(trees_dir, name)) # The deep tree outgrows MAX_PATH on Windows
+    manifest = root + ".json" # Next to the tree, so it is not part of it
+    if os.path.exists(manifest):
+        with open(manifest, encoding="utf-8") as f:
+            return root, json.load(f)
+    start = time.perf_counter()
+    directories, files = builder(root, **params)
+    description = {"params": params, "directories": directories, "files": files}
+    with open(manifest, "w", encoding="utf-8") as f:
+        json.dump(description, f)
+    print(f"Generated {shape}: {directories} directories, {files} files ({time.perf_counter() - start:.1f}s)")
+    return root, description
+
+
+def run_case(shape, path, root, work_dir, repeat):
+    """Runs one case in a fresh interpreter; returns its result record."""
+    record = {"shape": shape, "path": path}
+    env = dict(os.environ)
+    env.setdefault("QT_QPA_PLATFORM", "offscreen")
+    args = [sys.executable, os.path.abspath(__file__), "--child", path, root, work_dir, str(repeat)]
+    try:
+        result = subprocess.run(args, cwd=work_dir, env=env, capture_output=True, text=True,
+                                timeout=CASE_TIMEOUT_SECONDS)
+    except subprocess.TimeoutExpired:
+        return {**record, "status": "timeout"}
+    if result.returncode:
+        lines = result.stderr.strip().splitlines()
+        return {**record, "status": "error", "error": lines[-1] if lines else f"exit code {result.returncode}"}
+    return {**record, "status": "ok", **json.loads(result.stdout.strip().splitlines()[-1])}
+
+
+def format_result(record):
+    label = f"  {record['shape']:<9} {record['path']:<8}"
+    if record["status"] != "ok":
+        return f"{label} {record['status']}" + (f": {record.get('error')}" if record.get("error") else "")
+    rss = f"{record['peak_rss_mb']:8.1f}" if record["peak_rss_mb"] is not None else "       -"
+    return (f"{label} {record['wall_s']:9.3f}s  {record['entries']:>9} entries  "
+            f"listings={record['fs_calls']['listing']:<7} stats={record['fs_calls']['stat']:<8} "
+            f"python peak={record['peak_python_mb']:8.1f} MB  rss={rss} MB")
+
+
+def compare(results, old_path):
+    """Prints the wall time and peak memory of every case against a previous results file."""
+    with open(old_path, encoding="utf-8") as f:
+        old = {(record["shape"], record["path"]): record for record in json.load(f)["results"]
+               if record["status"] == "ok"}
+    print(f"\nAgainst {old_path} (ratio new/old; below 1 is faster or smaller):")
+    for record in results:
+        previous = old.get((record["shape"], record["path"]))
+        if record["status"] != "ok" or previous is None:
+            continue
+        time_ratio = record["wall_s"] / previous["wall_s"] if previous["wall_s"] else float("nan")
+        memory_ratio = (record["peak_python_mb"] / previous["peak_python_mb"]
+                        if previous["peak_python_mb"] else float("nan"))
+        print(f"  {record['shape']:<9} {record['path']:<8} time x{time_ratio:5.2f}  "
+              f"({previous['wall_s']:.3f}s -> {record['wall_s']:.3f}s)  python peak x{memory_ratio:5.2f}")
+
+
+def git_commit():
+    try:
+        result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=PACKAGE_DIR,
+                                capture_output=True, text=True)
+    except OSError:
+        return None
+    return result.stdout.strip() or None
+
+
+def parse_list(value, choices):
+    items = [item for item in value.split(",") if item]
+    unknown = set(items) - set(choices)
+    if unknown:
+        raise argparse.ArgumentTypeError(f"unknown: {', '.join(sorted(unknown))} (choose from {', '.join(choices)})")
+    return items
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Benchmark suite over synthetic trees (results as JSON).")
+    parser.add_argument("-o", "--output", help="Results file (default bench_suite-<date>.json in the current directory)")
+    parser.add_argument("--compare", metavar="OLD.json", help="Compare against a previous results file")
+    parser.add_argument("--shapes", type=lambda value: parse_list(value, SHAPES), default=SHAPES)
+    parser.add_argument("--paths", type=lambda value: parse_list(value, PATHS), default=PATHS)
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per case (the median is reported)")
+    parser.add_argument("--trees", help="Directory where the generated trees are kept and reused")
+    parser.add_argument("--quick", action="store_true", help=f"{WIDE_FILES_QUICK} files in 'wide', {DEEP_LEVELS_QUICK} levels in 'deep'")
+    parser.add_argument("--depth", type=int, default=4, help="Levels of the balanced tree")
+    parser.add_argument("--fanout", type=int, default=5, help="Subdirectories per directory of the balanced tree")
+    parser.add_argument("--files", type=int, default=40, help="Files per directory of the balanced tree")
+    parser.add_argument("--max-size", type=int, default=64 * 1024, help="Largest file of the balanced tree (bytes)")
+    parser.add_argument("--sizes", choices=SIZE_DISTRIBUTIONS, default="lognormal",
+                        help="File size distribution of the balanced tree")
+    return parser
+
+
+def main():
+    if sys.argv[1:2] == ["--child"]:
+        path, root, work_dir, repeat = sys.argv[2:6]
+        run_child(path, root, work_dir, int(repeat))
+        return
+    args = build_parser().parse_args()
+    has_qt = importlib.util.find_spec("PyQt6") is not None
+    output_path = args.output or f"bench_suite-{time.strftime('%Y%m%d-%H%M%S')}.json"
+
+    with tempfile.TemporaryDirectory() as scratch:
+        trees_dir = args.trees or os.path.join(scratch, "trees")
+        os.makedirs(trees_dir, exist_ok=True)
+        work_dir = os.path.join(scratch, "work") # Working directory of the cases and their output files
+        os.makedirs(work_dir)
+        params = shape_params(args)
+        shapes, results = {}, []
+        for shape in args.shapes:
+            builder, shape_args = params[shape]
+            root, shapes[shape] = ensure_tree(trees_dir, shape, builder, shape_args)
+            for path in args.paths:
+                if path in QT_PATHS and not has_qt:
+                    record = {"shape": shape, "path": path, "status": "skipped", "error": "PyQt6 is not installed"}
+                else:
+                    record = run_case(shape, path, root, work_dir, args.repeat)
+                results.append(record)
+                print(format_result(record), flush=True)
+
+    report = {"version": RESULTS_VERSION, "date": time.strftime("%Y-%m-%dT%H:%M:%S"), "commit": git_commit(),
+              "python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count(),
+              "repeat": args.repeat, "shapes": shapes, "results": results}
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results: {output_path}")
+    if args.compare:
+        compare(results, args.compare)
+    failed = [record for record in results if record["status"] in ("error", "timeout")]
+    if failed:
+        print(f"{len(failed)} case(s) failed; do not use these results as a baseline", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""Counts the filesystem calls (listings and stats) made through the os module, for the benchmarks."""
+import os
+from collections import Counter
+from contextlib import contextmanager
+
+
+class _CountingDirEntry:
+    """Wraps os.DirEntry to count the stat calls that reach the filesystem."""
+
+    def __init__(self, dir_entry, counter):
+        self._dir_entry = dir_entry
+        self._counter = counter
+        self.name = dir_entry.name
+        self.path = dir_entry.path
+
+    def stat(self, *, follow_symlinks=True):
+        self._counter["stat"] += 1
+        return self._dir_entry.stat(follow_symlinks=follow_symlinks)
+
+    def is_dir(self, *, follow_symlinks=True):
+        return self._dir_entry.is_dir(follow_symlinks=follow_symlinks)
+
+
+class _CountingScandir:
+    def __init__(self, path, counter):
+        self._iterator = _real_scandir(path)
+        self._counter = counter
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._iterator.close()
+
+    def __iter__(self):
+        for dir_entry in self._iterator:
+            yield _CountingDirEntry(dir_entry, self._counter)
+
+
+_real_scandir = os.scandir
+_real_listdir = os.listdir
+_real_stat = os.stat
+
+
+def install_counters(counter):
+    os.scandir = lambda path: (counter.update(["listing"]), _CountingScandir(path, counter))[1]
+    os.listdir = lambda path: (counter.update(["listing"]), _real_listdir(path))[1]
+    # os.path.isdir and os.path.getsize both go through os.stat
+    os.stat = lambda path, *a, **k: (counter.update(["stat"]), _real_stat(path, *a, **k))[1]
+
+
+def restore():
+    os.scandir, os.listdir, os.stat = _real_scandir, _real_listdir, _real_stat
+
+
+@contextmanager
+def counting_fs_calls():
+    """Counter of "listing" and "stat" calls made inside the block (from any thread)."""
+    counter = Counter()
+    install_counters(counter)
+    try:
+        yield counter
+    finally:
+        restore()
@@ -0,0 +1,81 @@
+"""Deterministic synthetic directory trees for the benchmarks."""
+import os
+import random
+
+SIZE_DISTRIBUTIONS = ("uniform", "lognormal", "empty")
+LOGNORMAL_SIGMA = 2.0 # Spread of the lognormal sizes: most files small, a few close to the maximum
+
+
+def _file_size(rng, distribution, max_file_size):
+    """Size of the next file: uniform in [0, max], lognormal (median max/64, capped at max) or 0."""
+    if distribution == "uniform":
+        return rng.randint(0, max_file_size)
+    if distribution == "lognormal":
+        median = max(max_file_size / 64, 1)
+        return min(int(rng.lognormvariate(0, LOGNORMAL_SIGMA) * median), max_file_size)
+    if distribution == "empty":
+        return 0
+    raise ValueError(f"Unknown size distribution: {distribution}")
+
+
+def _write_file(path, size):
+    with open(path, "wb") as f:
+        if size:
+            f.write(b"x" * size)
+
+
+def build_tree(root, depth=3, dirs_per_level=4, files_per_dir=20, max_file_size=4096, seed=0,
+               size_distribution="uniform"):
+    """Creates a tree under root and returns (directories, files) created."""
+    rng = random.Random(seed)
+    directories = files = 0
+    pending = [(root, 0)]
+    while pending:
+        dir_path, level = pending.pop()
+        os.makedirs(dir_path, exist_ok=True)
+        directories += 1
+        for i in range(files_per_dir):
+            _write_file(os.path.join(dir_path, f"file_{i:05d}.dat"), _file_size(rng, size_distribution, max_file_size))
+            files += 1
+        if level < depth:
+            for i in range(dirs_per_level):
+                pending.append((os.path.join(dir_path, f"dir_{i:03d}"), level + 1))
+    return directories, files
+
+
+def build_wide(root, files=500_000):
+    """One directory holding files empty files (the largest single listing). Returns (1, files)."""
+    os.makedirs(root, exist_ok=True)
+    for i in range(files):
+        _write_file(os.path.join(root, f"file_{i:07d}.dat"), 0)
+    return 1, files
+
+
+def long_path(path):
+    r"""
+    On Windows, the absolute path with the \\?\ prefix, which lifts the MAX_PATH
+    limit (260 characters) for it and every path joined to it. Unchanged elsewhere.
+    """
+    if os.name != "nt" or path.startswith("\\\\?\\"):
+        return path
+    path = os.path.abspath(path)
+    if path.startswith("\\\\"): # \\server\share -> \\?\UNC\server\share
+        return "\\\\?\\UNC\\" + path[2:]
+    return "\\\\?\\" + path
+
+
+def build_deep(root, levels=1000, files_per_level=1):
+    """
+    A chain of levels nested directories with files_per_level empty files in each.
+    Returns (directories, files). One-letter names keep the deepest path at about
+    two characters per level (some 2000 for 1000 levels): well past the Windows
+    MAX_PATH, so there the tree is created through long_path(root); list it through
+    long_path() too.
+    """
+    dir_path = long_path(root)
+    for level in range(levels + 1):
+        os.makedirs(dir_path, exist_ok=True)
+        for i in range(files_per_level):
+            _write_file(os.path.join(dir_path, f"f{i}"), 0)
+        dir_path = os.path.join(dir_path, "d")
+    return levels + 1, (levels + 1) * files_per_level
@@ -0,0 +1,196 @@
+"""
+Command line for Folder_mapper: writes a structure map without a display or Qt.
+
+    python -m folder_mapper_cli RAIZ [-o SALIDA] [-w HILOS] [-i RUTA] [-e RUTA] [-x PATRÓN] ...
+
+Include/exclude rules are paths relative to the root, applied in order (a later
+rule wins over an earlier one for its subtree), with the same semantics as the
+"Incluir" column of the application. "." stands for the root itself, so
+"-e . -i src" maps only src.
+
+Ignore patterns (-x, --ignore-file, --gitignore) follow the .gitignore syntax
+and are applied to every listing: an ignored directory is never listed.
+"""
+import argparse
+import contextlib
+import json
+import logging
+import os
+import sys
+import threading
+
+from folder_mapper_core import (DEFAULT_SCAN_WORKERS, MAX_SCAN_WORKERS, MAP_COMPRESSIONS, MAP_FORMAT_TEXT,
+                                MAP_FORMATS, IgnoreRules, Instrumentation, ProfileCapture, ScanIndex, SelectionTrie,
+                                available_compressions, StructureMapper, default_output_path, format_diagnostics,
+                                format_progress, parse_log_level, scan_directory, setup_logging)
+
+EXIT_OK = 0
+EXIT_ERROR = 1
+EXIT_CANCELLED = 130 # Interrumpido con Ctrl+C
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="python -m folder_mapper_cli",
+        description="Genera el mapa de estructura de una carpeta sin interfaz gráfica.")
+    parser.add_argument("root", help="Carpeta raíz a mapear")
+    parser.add_argument("-o", "--output",
+                        help="Archivo de salida ('-' para la salida estándar). "
+                             "Por defecto <raíz>/<nombre>-estructura.txt")
+    parser.add_argument("-f", "--format", choices=list(MAP_FORMATS), default=MAP_FORMAT_TEXT,
+                        help="Formato: mapa de texto (txt), un registro JSON por línea (ndjson), csv o json anidado. "
+                             "Por defecto txt")
+    parser.add_argument("-z", "--compress", choices=list(MAP_COMPRESSIONS),
+                        help="Comprimir la salida mientras se escribe (añade .gz/.zst al nombre por defecto)")
+    parser.add_argument("-w", "--workers", type=int, default=DEFAULT_SCAN_WORKERS,
+                        help=f"Hilos de escaneo (1 = secuencial, máximo {MAX_SCAN_WORKERS}; por defecto {DEFAULT_SCAN_WORKERS})")
+    parser.add_argument("-i", "--include", dest="rules", action="append",
+                        type=lambda path: (True, path), metavar="RUTA",
+                        help="Incluir RUTA (relativa a la raíz) y sus descendientes; repetible")
+    parser.add_argument("-e", "--exclude", dest="rules", action="append",
+                        type=lambda path: (False, path), metavar="RUTA",
+                        help="Excluir RUTA (relativa a la raíz) y sus descendientes; repetible")
+    parser.set_defaults(rules=[])
+    parser.add_argument("-x", "--ignore", action="append", default=[], metavar="PATRÓN",
+                        help="Ignorar lo que coincida con PATRÓN (sintaxis de .gitignore, '!' para volver a incluir); repetible")
+    parser.add_argument("--ignore-file", action="append", default=[], metavar="ARCHIVO",
+                        help="Leer patrones a ignorar de ARCHIVO (uno por línea, como un .gitignore); repetible")
+    parser.add_argument("--gitignore", action="store_true",
+                        help="Respetar los archivos .gitignore que haya en el árbol")
+    parser.add_argument("--index", action="store_true",
+                        help="Usar el índice persistente de escaneos (solo se vuelven a listar las carpetas modificadas)")
+    parser.add_argument("--discard-partial", action="store_true",
+                        help="Al interrumpir con Ctrl+C, eliminar el mapa parcial en lugar de conservarlo")
+    parser.add_argument("--progress", action="store_true", help="Mostrar el progreso en la salida de error")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Registrar también los mensajes informativos")
+    parser.add_argument("--log-level", metavar="NIVEL",
+                        help="Nivel del registro: DEBUG, INFO, WARNING o ERROR (por defecto WARNING, INFO con -v)")
+    parser.add_argument("--log-json", metavar="ARCHIVO",
+                        help="Escribir además un registro JSON (un evento por línea) para analizar el rendimiento")
+    parser.add_argument("--stats", action="store_true",
+                        help="Medir el tiempo de cada fase (listado, stat, orden, selección, formato, escritura) "
+                             "y mostrar las carpetas más lentas en la salida de error")
+    parser.add_argument("--stats-json", metavar="ARCHIVO", help="Guardar esas mediciones en ARCHIVO como JSON (implica --stats)")
+    parser.add_argument("--profile", action="store_true",
+                        help="Perfilar además con cProfile y tracemalloc (más lento; implica --stats)")
+    return parser
+
+
+def build_selection(root_path, rules):
+    """SelectionTrie for root_path with the (include, path) rules applied in order."""
+    selection = SelectionTrie(root_path)
+    for include, path in rules:
+        parts = selection.parts_of(os.path.join(root_path, path)) # Absolute paths are kept as given
+        if parts and parts[0] == os.pardir:
+            raise ValueError(f"La ruta '{path}' está fuera de la carpeta raíz")
+        selection.select(parts, include)
+    return selection
+
+
+def build_ignore_rules(root_path, patterns, pattern_files, use_gitignore):
+    """IgnoreRules for root_path, or None when no pattern applies. Files are read before the patterns."""
+    lines = []
+    for path in pattern_files:
+        with open(path, encoding="utf-8", errors="replace") as f:
+            lines.extend(f)
+    rules = IgnoreRules(root_path, lines + patterns, use_gitignore)
+    return rules if rules else None
+
+
+def report_diagnostics(instrumentation, capture, json_path):
+    """Prints the phase timings (and the profile) to stderr and saves them as JSON when asked."""
+    report = instrumentation.report()
+    profile = capture.report if capture else None
+    print("\n".join(format_diagnostics(report, profile)), file=sys.stderr)
+    if json_path:
+        try:
+            with open(json_path, "w", encoding="utf-8") as f:
+                json.dump({"instrumentation": report, "profile": profile}, f, indent=2)
+        except OSError as e:
+            logging.error("No se pudo guardar el diagnóstico en %s: %s", json_path, e)
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    setup_logging(parse_log_level(args.log_level, logging.INFO if args.verbose else logging.WARNING),
+                  json_file=args.log_json, fmt="%(levelname)s: %(message)s")
+
+    root_path = os.path.abspath(args.root)
+    if not os.path.isdir(root_path):
+        parser.error(f"'{args.root}' no es una carpeta")
+    if not 1 <= args.workers <= MAX_SCAN_WORKERS:
+        parser.error(f"--workers debe estar entre 1 y {MAX_SCAN_WORKERS}")
+    if args.compress and args.output == "-":
+        parser.error("--compress no se puede usar con la salida estándar (use una tubería a gzip/zstd)")
+    if args.compress and args.compress not in available_compressions():
+        parser.error(f"La compresión {args.compress} no está disponible (requiere Python 3.14 o el paquete 'zstandard')")
+    try:
+        selection = build_selection(root_path, args.rules)
+        ignore_rules = build_ignore_rules(root_path, args.ignore, args.ignore_file, args.gitignore)
+    except ValueError as e:
+        parser.error(str(e))
+    except OSError as e:
+        parser.error(f"No se pudo leer el archivo de patrones: {e}")
+
+    scan_index = ScanIndex(root_path) if args.index else None
+    on_progress = (lambda snapshot: print(format_progress(snapshot), file=sys.stderr)) if args.progress else None
+    instrumentation = Instrumentation() if args.stats or args.stats_json or args.profile else None
+    capture = ProfileCapture() if args.profile else None
+    mapper = StructureMapper(root_path, selection, args.workers,
+                             scan_index.scan if scan_index else scan_directory, on_progress, rules=ignore_rules,
+                             instrumentation=instrumentation)
+
+    # Map on a worker thread so Ctrl+C cancels cooperatively (and keeps a marked partial map)
+    outcome = {}
+    done = threading.Event() # Waited on instead of Thread.join(), which Ctrl+C can leave in a bad state
+
+    def run():
+        try:
+            with capture or contextlib.nullcontext(): # cProfile follows this thread, where the traversal runs
+                write_map()
+        except Exception as e:
+            outcome["error"] = e
+        finally:
+            done.set()
+
+    def write_map():
+        if args.output == "-":
+            mapper.write_to(sys.stdout, args.format)
+            if args.format == MAP_FORMAT_TEXT:
+                sys.stdout.write("\n") # The other formats end their last record with one
+            outcome["path"] = "-"
+        else:
+            output_path = (os.path.abspath(args.output) if args.output
+                           else default_output_path(root_path, args.format, args.compress))
+            outcome["path"] = mapper.write(output_path, args.format, args.compress)
+
+    threading.Thread(target=run, name="map").start()
+    try:
+        while not done.wait(0.2):
+            pass
+    except KeyboardInterrupt:
+        mapper.cancel(keep_partial=not args.discard_partial)
+        done.wait()
+    finally:
+        if scan_index:
+            scan_index.close()
+
+    if ignore_rules:
+        logging.info("Reglas de exclusión: %d elementos ignorados", ignore_rules.pruned)
+    if instrumentation:
+        report_diagnostics(instrumentation, capture, args.stats_json)
+    if "error" in outcome:
+        logging.error("Error durante el mapeo: %s", outcome["error"])
+        return EXIT_ERROR
+    if mapper.truncated:
+        kept = "" if args.discard_partial or outcome["path"] == "-" else f"; mapa parcial en {outcome['path']}"
+        print(f"Mapeo cancelado tras {mapper.progress.entries} elementos{kept}", file=sys.stderr)
+        return EXIT_CANCELLED
+    if outcome["path"] != "-":
+        print(outcome["path"])
+    return EXIT_OK
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,1927 @@
+"""
+Folder_mapper core: directory scanning, selection rules and map formatting.
+
+Pure Python (no Qt), shared by the desktop application (Folder_mapper.py) and
+the command line (folder_mapper_cli.py). Importing it has no side effects:
+logging is configured by the entry points. Modules needed only by optional
+features (the SQLite index, the worker pools) are imported on first use, so
+neither entry point pays for them at startup.
+"""
+import io
+import os
+import re
+import sys
+import stat
+import logging
+import threading
+import time
+from array import array
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import NamedTuple, Optional
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Constantes del núcleo
+# ─────────────────────────────────────────────────────────────────────────────
+
+# Recorrido paralelo
+DEFAULT_SCAN_WORKERS = 4 # Hilos de escaneo por defecto (1 = recorrido secuencial)
+MAX_SCAN_WORKERS = 64
+PREFETCH_DIRS_PER_WORKER = 64 # Listados adelantados (pendientes o sin consumir) por hilo
+
+# Escritura del mapa
+MAP_WRITE_BUFFER_SIZE = 1024 * 1024 # Búfer del archivo de salida (bytes)
+MAP_TRUNCATED_MARKER = "[MAPA INCOMPLETO: generación cancelada tras {entries} elementos]"
+TOTALS_FORMAT = "Σ {size} · {files} archivos · {dirs} carpetas"
+TOTALS_PARTIAL_SUFFIX = " (parcial)" # Carpetas abiertas cuando se canceló el mapeo
+
+# Formatos de salida
+MAP_FORMAT_TEXT = "txt"
+MAP_FORMATS = {MAP_FORMAT_TEXT: ".txt", "ndjson": ".ndjson", "csv": ".csv", "json": ".json"} # Formato -> extensión
+MAP_COMPRESSIONS = {"gzip": ".gz", "zstd": ".zst"} # Compresión -> extensión añadida
+RECORD_FIELDS = ("path", "kind", "size", "mtime", "depth", "error") # Campos de NDJSON y CSV
+GZIP_LEVEL = 6 # Equilibrio entre velocidad y tamaño (9 = máximo)
+ZSTD_LEVEL = 3
+
+# Reglas de exclusión
+GITIGNORE_FILE = ".gitignore" # Archivo de reglas leído en cada carpeta cuando se respetan los .gitignore
+IGNORE_CASE_INSENSITIVE = os.path.normcase("A") == "a" # Como el sistema de archivos (Windows)
+
+# Índice persistente de escaneos
+INDEX_DIR_NAME = "folder_mapper" # Subcarpeta dentro de la caché del usuario
+INDEX_COMMIT_EVERY = 500 # Listados nuevos antes de confirmar la transacción
+
+# Caché de listados en memoria
+LISTING_CACHE_MAX_ENTRIES = 500_000 # Elementos (de todos los listados) retenidos antes de desalojar los menos usados
+
+# Precarga especulativa
+PREFETCH_DEPTH = 2 # Niveles listados por adelantado desde las carpetas visibles
+PREFETCH_LISTINGS_PER_SECOND = 20 # Presupuesto de E/S de la precarga
+PREFETCH_CACHE_SHARE = 0.5 # Fracción de la caché de listados que la precarga puede llenar
+
+# Progreso
+PROGRESS_UPDATE_INTERVAL = 0.1 # Segundos entre actualizaciones de progreso (10 Hz)
+STATUS_PROGRESS = "Procesando: {entries} elementos · {rate}/s · {size} · {pending} carpetas pendientes · ETA {eta}"
+
+# Diagnóstico
+INSTRUMENT_SLOWEST_DIRS = 20 # Carpetas más lentas de listar que se conservan en el informe
+PROFILE_TOP_FUNCTIONS = 25 # Funciones (por tiempo acumulado) en el informe de cProfile
+PROFILE_TOP_ALLOCATIONS = 10 # Líneas con más memoria asignada en el informe de tracemalloc
+
+# Registro de eventos
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+LOG_LEVEL_ENV = "FOLDER_MAPPER_LOG_LEVEL" # Nivel del registro (DEBUG, INFO, WARNING, ERROR o un número)
+LOG_JSON_ENV = "FOLDER_MAPPER_LOG_JSON" # Ruta de un registro JSON adicional (un evento por línea)
+LOG_THROTTLE_SECONDS = 1.0 # Intervalo mínimo entre repeticiones de un mismo mensaje de ruta caliente
+
+
+# Función auxiliar para formatear el tamaño de archivo - No change needed
+def format_size(size_in_bytes):
+    """Convierte el tamaño en bytes a un formato legible (B, KB, MB, GB)."""
+    if size_in_bytes is None:
+        return "N/A"
+    if size_in_bytes < 1024:
+        return f"{size_in_bytes} B"
+    elif size_in_bytes < 1024 * 1024:
+        return f"{size_in_bytes / 1024:.2f} KB"
+    elif size_in_bytes < 1024 * 1024 * 1024:
+        return f"{size_in_bytes / (1024 * 1024):.2f} MB"
+    else:
+        return f"{size_in_bytes / (1024 * 1024 * 1024):.2f} GB"
+
+# Función auxiliar para escribir el mapa línea a línea sin construir el texto completo
+def write_lines(file_obj, lines):
+    """Writes an iterable of lines separated by newlines (no trailing newline), one at a time."""
+    separator = ""
+    for line in lines:
+        file_obj.write(separator)
+        file_obj.write(line)
+        separator = "\n"
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Registro de eventos (cola, niveles configurables y JSON opcional)
+# ─────────────────────────────────────────────────────────────────────────────
+
+def parse_log_level(value, default=logging.INFO):
+    """Level from a name ("debug", "INFO") or a number; default when value is empty or unknown."""
+    if not value:
+        return default
+    value = str(value).strip()
+    if value.isdigit():
+        return int(value)
+    level = logging.getLevelName(value.upper())
+    return level if isinstance(level, int) else default
+
+
+class JsonLogFormatter(logging.Formatter):
+    """
+    One JSON object per line, for performance analysis.
+
+    Besides time, level, thread and message, the keys of a record's `fields`
+    extra (logging.info(..., extra={"fields": {...}})) are written as they are.
+    """
+
+    def format(self, record):
+        import json
+        event = {"time": round(record.created, 6), "level": record.levelname, "thread": record.threadName,
+                 "message": record.getMessage()}
+        event.update(getattr(record, "fields", None) or {})
+        if record.exc_info:
+            event["exception"] = self.formatException(record.exc_info)
+        return json.dumps(event, ensure_ascii=False, default=str)
+
+
+def setup_logging(level=logging.INFO, log_file=None, json_file=None, console=True, fmt=LOG_FORMAT):
+    """
+    Routes every record through a queue to handlers run by a background thread.
+
+    The logging call only enqueues the record: file and console writes happen on
+    the listener thread, never on the GUI or scan threads. Replaces the handlers
+    of the root logger (stopping the listener of a previous call) and returns the
+    started QueueListener; stop_logging() runs at exit so queued records are written.
+    """
+    import atexit
+    import queue
+    from logging.handlers import QueueHandler, QueueListener
+    global _log_listener
+
+    stop_logging()
+    handlers = []
+    if log_file:
+        handlers.append(logging.FileHandler(log_file, encoding="utf-8", delay=True)) # Opened with the first record
+    if console:
+        handlers.append(logging.StreamHandler())
+    for handler in handlers:
+        handler.setFormatter(logging.Formatter(fmt))
+    if json_file:
+        json_handler = logging.FileHandler(json_file, encoding="utf-8", delay=True)
+        json_handler.setFormatter(JsonLogFormatter())
+        handlers.append(json_handler)
+
+    log_queue = queue.SimpleQueue()
+    listener = QueueListener(log_queue, *handlers)
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(QueueHandler(log_queue))
+    root.setLevel(level)
+    listener.start()
+    _log_listener = listener
+    atexit.unregister(stop_logging) # Registered once however many times logging is set up
+    atexit.register(stop_logging)
+    return listener
+
+
+def stop_logging():
+    """Reports the hot-path messages still pending, then stops the setup_logging() listener."""
+    global _log_listener
+    if _log_listener is None:
+        return
+    hot_log.flush()
+    _log_listener.stop() # Writes the records still queued
+    _log_listener = None
+
+
+_log_listener = None # QueueListener started by the last setup_logging() call
+
+
+class ThrottledLog:
+    """
+    Level-gated, rate-limited logging for hot paths (per item, per listing).
+
+    Arguments are %-style and only formatted when the record is emitted. Each
+    message template is emitted at most once per interval; the next one that is
+    emitted reports how many were dropped in between, and flush() reports those
+    no later record picked up. Usable from any thread (a race can at worst
+    miscount dropped messages).
+    """
+
+    def __init__(self, interval=LOG_THROTTLE_SECONDS, logger=None):
+        self.interval = interval
+        self.logger = logger or logging.getLogger()
+        self._last_emitted = {} # Message template -> monotonic time of its last record
+        self._dropped = {} # Message template -> records dropped since then
+        self._levels = {} # Message template -> level of its dropped records
+
+    def log(self, level, msg, *args, **kwargs):
+        if not self.logger.isEnabledFor(level):
+            return # Level off: nothing is formatted
+        now = time.monotonic()
+        last = self._last_emitted.get(msg)
+        if last is not None and now - last < self.interval:
+            self._dropped[msg] = self._dropped.get(msg, 0) + 1
+            self._levels[msg] = level
+            return
+        self._last_emitted[msg] = now
+        dropped = self._dropped.pop(msg, 0)
+        if dropped:
+            self.logger.log(level, msg + " (y %d mensajes similares omitidos)", *args, dropped, **kwargs)
+        else:
+            self.logger.log(level, msg, *args, **kwargs)
+
+    def flush(self):
+        """Logs the count of every message dropped since its last record (the arguments are gone)."""
+        dropped, self._dropped = self._dropped, {}
+        for msg, count in dropped.items():
+            self.logger.log(self._levels.get(msg, logging.INFO), "%d mensajes similares omitidos: %s", count, msg)
+
+    def debug(self, msg, *args, **kwargs):
+        self.log(logging.DEBUG, msg, *args, **kwargs)
+
+    def info(self, msg, *args, **kwargs):
+        self.log(logging.INFO, msg, *args, **kwargs)
+
+    def warning(self, msg, *args, **kwargs):
+        self.log(logging.WARNING, msg, *args, **kwargs)
+
+
+hot_log = ThrottledLog() # Shared by the hot paths of the core and the application
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Núcleo de recorrido iterativo (pila explícita)
+# ─────────────────────────────────────────────────────────────────────────────
+
+TREE_BRANCH = "├── "
+TREE_LAST = "└── "
+TREE_PIPE = "│   "
+TREE_SPACE = "    "
+
+
+def walk_tree(root_children, get_children):
+    """
+    Pre-order traversal with an explicit stack, safe for any depth.
+
+    Yields (node, prefix, is_last) for every node. get_children(node) is called
+    after the consumer resumes, so it may use whatever the consumer prepared while
+    handling the node; it returns the node's children (a list) or None.
+    """
+    stack = [[root_children, 0, ""]] # Frames: [children, next index, prefix]
+    while stack:
+        frame = stack[-1]
+        children, index, prefix = frame
+        if index >= len(children):
+            stack.pop()
+            continue
+        frame[1] = index + 1
+        node = children[index]
+        is_last = index == len(children) - 1
+        yield node, prefix, is_last
+
+        node_children = get_children(node)
+        if node_children:
+            stack.append([node_children, 0, prefix + (TREE_SPACE if is_last else TREE_PIPE)])
+
+
+def join_nested(parts):
+    """Joins a list of strings and nested lists of the same kind, in order, with a single join."""
+    pieces = []
+    stack = [iter(parts)]
+    while stack:
+        for part in stack[-1]:
+            if isinstance(part, str):
+                pieces.append(part)
+            else:
+                stack.append(iter(part))
+                break
+        else:
+            stack.pop()
+    return "".join(pieces)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Progreso de recorrido (contadores, velocidad y ETA)
+# ─────────────────────────────────────────────────────────────────────────────
+
+class ProgressSnapshot(NamedTuple):
+    """Immutable progress state, safe to send across threads."""
+    entries: int
+    bytes_seen: int
+    dirs_done: int
+    dirs_pending: int
+    elapsed: float
+    entries_per_second: float
+    eta_seconds: Optional[float] # None until a rate is known
+
+
+class ProgressTracker:
+    """
+    Counts traversal work and decides when a progress update is due, so the GUI
+    receives at most one update per interval instead of one per item.
+    The ETA extrapolates the directory rate over the directories already discovered.
+    """
+
+    def __init__(self, interval=PROGRESS_UPDATE_INTERVAL):
+        self.interval = interval
+        self.entries = 0
+        self.bytes_seen = 0
+        self.dirs_done = 0
+        self.dirs_pending = 0
+        self._start = time.monotonic()
+        self._next_update = self._start + interval
+
+    def directory_listed(self, subdirectories):
+        """A pending directory was listed and revealed subdirectories to visit."""
+        self.dirs_done += 1
+        self.dirs_pending = max(0, self.dirs_pending - 1) + subdirectories
+
+    def entry_seen(self, size=None):
+        self.entries += 1
+        if size:
+            self.bytes_seen += size
+
+    def due(self):
+        """True at most once per interval."""
+        now = time.monotonic()
+        if now < self._next_update:
+            return False
+        self._next_update = now + self.interval
+        return True
+
+    def snapshot(self):
+        elapsed = time.monotonic() - self._start
+        entries_per_second = self.entries / elapsed if elapsed > 0 else 0.0
+        eta_seconds = None
+        if self.dirs_done and elapsed > 0:
+            eta_seconds = self.dirs_pending * elapsed / self.dirs_done
+        return ProgressSnapshot(self.entries, self.bytes_seen, self.dirs_done, self.dirs_pending,
+                                elapsed, entries_per_second, eta_seconds)
+
+
+def format_duration(seconds):
+    """Formats seconds as m:ss or h:mm:ss ("--:--" when unknown)."""
+    if seconds is None:
+        return "--:--"
+    seconds = int(seconds)
+    hours, remainder = divmod(seconds, 3600)
+    minutes, seconds = divmod(remainder, 60)
+    if hours:
+        return f"{hours}:{minutes:02d}:{seconds:02d}"
+    return f"{minutes}:{seconds:02d}"
+
+
+def format_progress(snapshot):
+    """Status line for a ProgressSnapshot."""
+    return STATUS_PROGRESS.format(entries=f"{snapshot.entries:,}".replace(",", "."),
+                                  rate=f"{snapshot.entries_per_second:,.0f}".replace(",", "."),
+                                  size=format_size(snapshot.bytes_seen),
+                                  pending=f"{snapshot.dirs_pending:,}".replace(",", "."),
+                                  eta=format_duration(snapshot.eta_seconds))
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Motor de escaneo de directorios (os.scandir)
+# ─────────────────────────────────────────────────────────────────────────────
+
+KIND_DIR = "dir"
+KIND_FILE = "file"
+
+
+class ScanEntry(NamedTuple):
+    """One directory entry, built from a single stat call."""
+    name: str
+    path: str
+    kind: str                # KIND_DIR or KIND_FILE
+    size: Optional[int]      # Bytes for files, None for directories or unreadable entries
+    mtime: Optional[float]
+    inode: int
+
+    @property
+    def is_dir(self):
+        return self.kind == KIND_DIR
+
+
+def _entry_sort_key(entry):
+    """Directories first, then alphabetically (case-insensitive)."""
+    return (entry.kind != KIND_DIR, entry.name.lower())
+
+
+def _scan_entry(dir_entry):
+    """Builds a ScanEntry from an os.DirEntry using at most one stat call."""
+    try:
+        # Follows symlinks, matching the previous os.path.isdir/os.path.getsize behaviour
+        st = dir_entry.stat()
+    except OSError:
+        # Broken symlink or entry removed while listing: report it as a file without size
+        return ScanEntry(dir_entry.name, dir_entry.path, KIND_FILE, None, None, 0)
+
+    if stat.S_ISDIR(st.st_mode):
+        return ScanEntry(dir_entry.name, dir_entry.path, KIND_DIR, None, st.st_mtime, st.st_ino)
+    return ScanEntry(dir_entry.name, dir_entry.path, KIND_FILE, st.st_size, st.st_mtime, st.st_ino)
+
+
+def scan_directory(dir_path):
+    """
+    Lists dir_path with os.scandir and returns its entries sorted (directories first).
+    Raises PermissionError/OSError if the directory itself cannot be listed.
+    """
+    with os.scandir(dir_path) as iterator:
+        entries = [_scan_entry(dir_entry) for dir_entry in iterator]
+    entries.sort(key=_entry_sort_key)
+    return entries
+
+
+class ParallelScanner:
+    """
+    Scans directories ahead of a sequential consumer using a thread pool.
+
+    Each completed listing schedules its selected subdirectories, so sibling subtrees
+    are scanned concurrently while the consumer still formats lines in order. The
+    number of listings in flight or waiting to be consumed is bounded by max_pending.
+    """
+
+    def __init__(self, workers, is_selected, max_pending=None, lister=scan_directory):
+        from concurrent.futures import ThreadPoolExecutor
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="scan")
+        self._is_selected = is_selected
+        self._lister = lister
+        self._max_pending = max_pending or workers * PREFETCH_DIRS_PER_WORKER
+        self._futures = {} # path -> Future of lister(path)
+        self._lock = threading.Lock()
+
+    def _scan(self, dir_path):
+        entries = self._lister(dir_path) # Errors are re-raised to the consumer by Future.result()
+        self._schedule(entry.path for entry in entries
+                       if entry.is_dir and self._is_selected(entry.path))
+        return entries
+
+    def _schedule(self, paths):
+        with self._lock:
+            for path in paths:
+                if len(self._futures) >= self._max_pending:
+                    break
+                if path not in self._futures:
+                    self._futures[path] = self._executor.submit(self._scan, path)
+
+    def listing(self, dir_path):
+        """Returns the entries of dir_path, waiting for its prefetch or scanning it in place."""
+        with self._lock:
+            future = self._futures.pop(dir_path, None)
+        if future is None:
+            return self._scan(dir_path)
+        return future.result()
+
+    def close(self):
+        """Drops pending prefetches and releases the worker threads."""
+        with self._lock:
+            self._futures.clear()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Instrumentación por fases (tiempos, contadores y carpetas más lentas)
+# ─────────────────────────────────────────────────────────────────────────────
+
+class Instrumentation:
+    """
+    Wall time and call count per phase of the mapper, the tree loader and the
+    preview, plus the slowest directory listings. Thread-safe.
+
+    Phases are dotted names ("scan.stat", "map.write", "load.populate", ...).
+    Call sites check for an instance once per directory or per batch (never per
+    entry unless listing through scan()), so leaving it off costs nothing.
+    Listings made through scan() are split into reading the directory, the stat
+    calls and the sort, and each one competes for the slowest list.
+    """
+
+    def __init__(self, slowest=INSTRUMENT_SLOWEST_DIRS):
+        self.slowest_size = slowest
+        self.started = time.perf_counter()
+        self._phases = {} # Phase -> [seconds, count]
+        self._slowest = [] # Min-heap of (seconds, path, entries, read, stat, sort)
+        self._lock = threading.Lock()
+
+    def add(self, phase, seconds, count=1):
+        with self._lock:
+            totals = self._phases.get(phase)
+            if totals is None:
+                self._phases[phase] = [seconds, count]
+            else:
+                totals[0] += seconds
+                totals[1] += count
+
+    def seconds(self, *phases):
+        """Accumulated seconds of phases (to make a phase exclusive of those nested in it)."""
+        with self._lock:
+            return sum(self._phases[phase][0] for phase in phases if phase in self._phases)
+
+    def scan(self, dir_path):
+        """scan_directory() timing the directory reads, the stat calls and the sort separately."""
+        import heapq
+        perf_counter = time.perf_counter
+        start = perf_counter()
+        stat_seconds = 0.0
+        entries = []
+        with os.scandir(dir_path) as iterator:
+            for dir_entry in iterator:
+                before = perf_counter()
+                entries.append(_scan_entry(dir_entry))
+                stat_seconds += perf_counter() - before
+        read_end = perf_counter()
+        entries.sort(key=_entry_sort_key)
+        sort_seconds = perf_counter() - read_end
+        read_seconds = read_end - start - stat_seconds
+        total = read_end - start + sort_seconds
+        with self._lock:
+            for phase, seconds, count in (("scan.read", read_seconds, 1), ("scan.stat", stat_seconds, len(entries)),
+                                          ("scan.sort", sort_seconds, 1)):
+                totals = self._phases.setdefault(phase, [0.0, 0])
+                totals[0] += seconds
+                totals[1] += count
+            record = (total, dir_path, len(entries), read_seconds, stat_seconds, sort_seconds)
+            if len(self._slowest) < self.slowest_size:
+                heapq.heappush(self._slowest, record)
+            elif total > self._slowest[0][0]:
+                heapq.heapreplace(self._slowest, record)
+        return entries
+
+    def reset(self):
+        with self._lock:
+            self._phases.clear()
+            self._slowest.clear()
+            self.started = time.perf_counter()
+
+    def report(self):
+        """JSON-ready dict: phases (slowest first) and the slowest directories."""
+        with self._lock:
+            phases = sorted(self._phases.items(), key=lambda item: item[1][0], reverse=True)
+            slowest = sorted(self._slowest, reverse=True)
+            elapsed = time.perf_counter() - self.started
+        return {
+            "elapsed_s": elapsed,
+            "phases": [{"phase": phase, "seconds": seconds, "count": count,
+                        "mean_ms": seconds * 1000 / count if count else 0.0}
+                       for phase, (seconds, count) in phases],
+            "slowest_dirs": [{"path": path, "seconds": total, "entries": entries, "read_s": read,
+                              "stat_s": stat_seconds, "sort_s": sort_seconds}
+                             for total, path, entries, read, stat_seconds, sort_seconds in slowest],
+        }
+
+
+class ProfileCapture:
+    """
+    Optional cProfile and tracemalloc capture around a block (with ProfileCapture() as capture:).
+    cProfile sees only the thread that enters the block; tracemalloc the whole process.
+    The result is in report once the block ends.
+    """
+
+    def __init__(self, cpu=True, memory=True, top_functions=PROFILE_TOP_FUNCTIONS,
+                 top_allocations=PROFILE_TOP_ALLOCATIONS):
+        self.cpu = cpu
+        self.memory = memory
+        self.top_functions = top_functions
+        self.top_allocations = top_allocations
+        self.report = None
+        self._profiler = None
+        self._started_tracing = False
+
+    def __enter__(self):
+        if self.memory:
+            import tracemalloc
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._started_tracing = True
+            tracemalloc.reset_peak()
+        if self.cpu:
+            import cProfile
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        return self
+
+    def __exit__(self, *exc):
+        report = {}
+        if self._profiler:
+            self._profiler.disable()
+            import pstats
+            stats = pstats.Stats(self._profiler).stats # (file, line, function) -> (primitive calls, calls, tt, ct, callers)
+            top = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)[:self.top_functions]
+            report["functions"] = [{"function": f"{os.path.basename(file)}:{line}({function})", "calls": calls,
+                                    "total_s": own, "cumulative_s": cumulative}
+                                   for (file, line, function), (_, calls, own, cumulative, _) in top]
+            self._profiler = None
+        if self.memory:
+            import tracemalloc
+            current, peak = tracemalloc.get_traced_memory()
+            statistics = tracemalloc.take_snapshot().statistics("lineno")[:self.top_allocations]
+            report["memory"] = {"current_mb": current / (1024 * 1024), "peak_mb": peak / (1024 * 1024),
+                                "top": [{"site": f"{os.path.basename(stat.traceback[0].filename)}:{stat.traceback[0].lineno}",
+                                         "size_kb": stat.size / 1024, "count": stat.count} for stat in statistics]}
+            if self._started_tracing:
+                tracemalloc.stop()
+                self._started_tracing = False
+        self.report = report
+        return False
+
+
+def format_diagnostics(report, profile=None):
+    """Text lines of an Instrumentation report (and a ProfileCapture report) for the CLI and the panel."""
+    lines = [f"Tiempo medido: {format_duration(report['elapsed_s'])} ({report['elapsed_s']:.3f} s)", "",
+             f"{'Fase':<18}{'Tiempo (s)':>12}{'Llamadas':>12}{'Media (ms)':>12}"]
+    for phase in report["phases"]:
+        lines.append(f"{phase['phase']:<18}{phase['seconds']:>12.3f}{phase['count']:>12}{phase['mean_ms']:>12.3f}")
+    if report["slowest_dirs"]:
+        lines += ["", f"Carpetas más lentas de listar ({len(report['slowest_dirs'])}):",
+                  f"{'Total (ms)':>11}{'Lectura':>9}{'Stat':>9}{'Orden':>9}{'Elementos':>11}  Ruta"]
+        for folder in report["slowest_dirs"]:
+            lines.append(f"{folder['seconds'] * 1000:>11.1f}{folder['read_s'] * 1000:>9.1f}{folder['stat_s'] * 1000:>9.1f}"
+                         f"{folder['sort_s'] * 1000:>9.1f}{folder['entries']:>11}  {folder['path']}")
+    if profile and profile.get("functions"):
+        lines += ["", "cProfile (tiempo acumulado):", f"{'Acumulado (s)':>14}{'Propio (s)':>12}{'Llamadas':>10}  Función"]
+        for function in profile["functions"]:
+            lines.append(f"{function['cumulative_s']:>14.3f}{function['total_s']:>12.3f}{function['calls']:>10}  {function['function']}")
+    if profile and profile.get("memory"):
+        memory = profile["memory"]
+        lines += ["", f"tracemalloc: pico {memory['peak_mb']:.1f} MB, al final {memory['current_mb']:.1f} MB"]
+        for allocation in memory["top"]:
+            lines.append(f"{allocation['size_kb']:>12.1f} KB {allocation['count']:>9} bloques  {allocation['site']}")
+    return lines
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Índice persistente de escaneos (SQLite, un archivo por carpeta raíz)
+# ─────────────────────────────────────────────────────────────────────────────
+
+def get_index_dir():
+    """Per-user cache directory for scan indexes (no Qt needed)."""
+    if sys.platform == 'win32':
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, INDEX_DIR_NAME, "index")
+
+
+class ScanIndex:
+    """
+    Persistent listing index for one root folder.
+
+    Each directory listing is stored with the directory's mtime and inode. scan()
+    returns the stored listing while both still match (one stat per directory) and
+    re-lists the directory otherwise. Sizes of files inside an unchanged directory
+    are therefore as fresh as its last re-listing.
+    Safe to share between the GUI and worker threads.
+    """
+
+    def __init__(self, root_path, index_path=None):
+        import hashlib, sqlite3
+        self.root_path = os.path.abspath(root_path)
+        if index_path is None:
+            digest = hashlib.sha1(os.path.normcase(self.root_path).encode("utf-8")).hexdigest()
+            index_dir = get_index_dir()
+            os.makedirs(index_dir, exist_ok=True)
+            index_path = os.path.join(index_dir, f"{digest}.sqlite")
+        self.index_path = index_path
+        self.hits = 0
+        self.misses = 0
+        self._uncommitted = 0
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(index_path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute("CREATE TABLE IF NOT EXISTS listings ("
+                                 "path TEXT PRIMARY KEY, mtime_ns INTEGER, inode INTEGER, entries TEXT)")
+        self._connection.commit()
+
+    def scan(self, dir_path):
+        """Same contract as scan_directory(), served from the index when still valid."""
+        import json # Cached in sys.modules after ScanIndex is first used
+        st = os.stat(dir_path) # Raises like scan_directory for missing/denied directories
+        with self._lock:
+            row = self._connection.execute("SELECT mtime_ns, inode, entries FROM listings WHERE path = ?",
+                                           (dir_path,)).fetchone()
+            valid = row is not None and row[0] == st.st_mtime_ns and row[1] == st.st_ino
+            if valid:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if valid:
+            return [ScanEntry(name, os.path.join(dir_path, name), kind, size, mtime, inode)
+                    for name, kind, size, mtime, inode in json.loads(row[2])]
+
+        entries = scan_directory(dir_path)
+        encoded = json.dumps([(e.name, e.kind, e.size, e.mtime, e.inode) for e in entries],
+                             ensure_ascii=False, separators=(",", ":"))
+        with self._lock:
+            self._connection.execute("INSERT OR REPLACE INTO listings VALUES (?, ?, ?, ?)",
+                                     (dir_path, st.st_mtime_ns, st.st_ino, encoded))
+            self._uncommitted += 1
+            if self._uncommitted >= INDEX_COMMIT_EVERY:
+                self._connection.commit()
+                self._uncommitted = 0
+        return entries
+
+    def flush(self):
+        """Commits listings stored since the last commit."""
+        with self._lock:
+            if self._uncommitted:
+                self._connection.commit()
+                self._uncommitted = 0
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            self._connection.close()
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Caché de listados en memoria (LRU, validada por mtime)
+# ─────────────────────────────────────────────────────────────────────────────
+
+class ListingCache:
+    """
+    In-process LRU cache of directory listings shared by the tree, the preview and
+    the workers.
+
+    Listings are kept with the directory's mtime and inode and served while both
+    still match (one stat per call). The total number of cached entries is bounded
+    by max_entries; the least recently used listings are evicted first. Misses are
+    listed through lister (scan_directory or ScanIndex.scan). Thread-safe.
+    """
+
+    def __init__(self, lister=scan_directory, max_entries=LISTING_CACHE_MAX_ENTRIES):
+        self.lister = lister
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._listings = OrderedDict() # path -> (mtime_ns, inode, entries, validated at), oldest first
+        self.size = 0 # Entries held by all cached listings
+        self._lock = threading.Lock()
+
+    def scan(self, dir_path):
+        """Same contract as scan_directory(); the returned list must not be modified."""
+        st = os.stat(dir_path) # Raises like scan_directory for missing/denied directories
+        with self._lock:
+            cached = self._listings.get(dir_path)
+            if cached and cached[0] == st.st_mtime_ns and cached[1] == st.st_ino:
+                self._listings[dir_path] = cached[:3] + (time.monotonic(),)
+                self._listings.move_to_end(dir_path)
+                self.hits += 1
+                return cached[2]
+            self.misses += 1
+
+        entries = self.lister(dir_path) # Listed outside the lock so workers scan concurrently
+        with self._lock:
+            self._discard(dir_path)
+            if len(entries) <= self.max_entries:
+                self._listings[dir_path] = (st.st_mtime_ns, st.st_ino, entries, time.monotonic())
+                self.size += len(entries)
+                while self.size > self.max_entries:
+                    _, cached = self._listings.popitem(last=False)
+                    self.size -= len(cached[2])
+                    self.evictions += 1
+        return entries
+
+    def peek(self, dir_path, max_age):
+        """Returns the listing of dir_path validated less than max_age seconds ago, without a stat, or None."""
+        with self._lock:
+            cached = self._listings.get(dir_path)
+            if cached is None or time.monotonic() - cached[3] > max_age:
+                return None
+            self._listings.move_to_end(dir_path)
+            self.hits += 1
+            return cached[2]
+
+    def __contains__(self, dir_path):
+        """True while a listing of dir_path is held (whether or not it is still current)."""
+        with self._lock:
+            return dir_path in self._listings
+
+    def invalidate(self, dir_path):
+        """Forgets dir_path (e.g. after a change notification within the same mtime tick)."""
+        with self._lock:
+            self._discard(dir_path)
+
+    def clear(self):
+        with self._lock:
+            self._listings.clear()
+            self.size = 0
+
+    def _discard(self, dir_path):
+        cached = self._listings.pop(dir_path, None)
+        if cached:
+            self.size -= len(cached[2])
+
+    def stats(self):
+        """Counters for logs and diagnostics."""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                    "listings": len(self._listings), "entries": self.size}
+
+
+class DirectoryPrefetcher:
+    """
+    Lists the directories the user is likely to expand into a ListingCache ahead of time.
+
+    schedule() queues the currently visible directories; each prefetched listing
+    queues its subdirectories until depth levels below them. step() is driven from
+    the GUI's idle time and keeps one listing in flight at most, starts no more than
+    listings_per_second, and stops once the listings it added itself fill cache_share
+    of the cache (listings made by the tree or the mapper do not count).
+    Listings go through lister (cache.scan by default, or a filtered view of it).
+    """
+
+    def __init__(self, cache, depth=PREFETCH_DEPTH, listings_per_second=PREFETCH_LISTINGS_PER_SECOND,
+                 cache_share=PREFETCH_CACHE_SHARE, lister=None):
+        self.cache = cache
+        self.lister = lister or cache.scan
+        self.depth = depth
+        self.listings_per_second = listings_per_second
+        self.cache_share = cache_share
+        self.prefetched = 0
+        self._added = {} # Path -> entries of the listings this prefetcher brought into the cache
+        self._added_entries = 0
+        self._queue = deque() # (path, level); level 1 = a visible directory
+        self._seen = set() # Paths queued or listed since the last reset()
+        self._future = None # Listing in flight
+        self._future_level = 0
+        self._next_start = 0.0
+        self._executor = None # Created on the first listing
+
+    def schedule(self, paths):
+        """Queues paths (visible directories) ahead of the deeper levels still pending."""
+        fresh = [path for path in paths if path not in self._seen]
+        self._seen.update(fresh)
+        self._queue.extendleft((path, 1) for path in reversed(fresh))
+
+    def step(self) -> bool:
+        """Advances the prefetch by at most one listing. Returns False when there is nothing left to do."""
+        if self._future is not None:
+            if not self._future.done():
+                return True
+            (entries, added), level = self._future.result(), self._future_level
+            self._future = None
+            if added:
+                self._added_entries += len(entries) - self._added.get(added, 0)
+                self._added[added] = len(entries)
+            if level < self.depth:
+                for entry in entries:
+                    if entry.is_dir and entry.path not in self._seen:
+                        self._seen.add(entry.path)
+                        self._queue.append((entry.path, level + 1))
+
+        if not self._queue or self._budget_spent():
+            return False # Done, or the memory budget is spent
+        now = time.monotonic()
+        if now < self._next_start:
+            return True # I/O budget: wait for the next slot
+        self._next_start = now + 1.0 / self.listings_per_second
+        path, self._future_level = self._queue.popleft()
+        if self._executor is None:
+            from concurrent.futures import ThreadPoolExecutor
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prefetch")
+        self._future = self._executor.submit(self._list, path)
+        self.prefetched += 1
+        return True
+
+    def _budget_spent(self):
+        budget = self.cache.max_entries * self.cache_share
+        if self._added_entries < budget:
+            return False
+        # Recount only the listings still held: the cache may have evicted or dropped some since
+        self._added = {path: count for path, count in self._added.items() if path in self.cache}
+        self._added_entries = sum(self._added.values())
+        return self._added_entries >= budget
+
+    def _list(self, dir_path):
+        """(entries, dir_path when this call brought the listing into the cache, else None)."""
+        added = None if dir_path in self.cache else dir_path
+        try:
+            return self.lister(dir_path), added
+        except OSError:
+            return [], None # Unreadable directories are reported when actually expanded
+
+    def reset(self):
+        """Forgets the pending work (e.g. for a new root); a listing in flight is ignored."""
+        self._queue.clear()
+        self._seen.clear()
+        self._future = None
+
+    def close(self):
+        self.reset()
+        if self._executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Selección (trie de marcas explícitas con herencia)
+# ─────────────────────────────────────────────────────────────────────────────
+
+SEL_INCLUDE = 1
+SEL_EXCLUDE = 2
+SEL_PARTIAL = 3 # Included itself; its children inherit the exclusion
+SELECTION_GLYPHS = {SEL_INCLUDE: "☑", SEL_EXCLUDE: "☐", SEL_PARTIAL: "◩"}
+
+
+class _TrieNode:
+    __slots__ = ("mark", "children")
+
+    def __init__(self):
+        self.mark = None # SEL_* or None (inherits from the nearest marked ancestor)
+        self.children = {} # Path component -> _TrieNode
+
+
+class SelectionTrie:
+    """
+    Tri-state selection of the paths below root_path.
+
+    Only explicit marks are stored, keyed by path components; every other path
+    inherits from its nearest marked ancestor (everything is included by default).
+    Marking a path drops the marks below it, so toggling a directory and all its
+    descendants costs O(depth) whatever the size of the subtree.
+    """
+
+    def __init__(self, root_path=None):
+        self.root_path = root_path
+        self._root = _TrieNode()
+
+    def parts_of(self, path):
+        """Path components of path relative to the root."""
+        relative = os.path.relpath(path, self.root_path)
+        return [] if relative == os.curdir else relative.split(os.sep)
+
+    # --- Top-down resolution (one step per path component) ---
+    def root_context(self):
+        """Context for resolving the children of the root."""
+        return self._root, SEL_EXCLUDE if self._root.mark == SEL_EXCLUDE else SEL_INCLUDE
+
+    @staticmethod
+    def child(context, name):
+        """Returns (state, context for its children) of the child name."""
+        trie_node, inherited = context
+        trie_node = trie_node.children.get(name) if trie_node else None
+        mark = trie_node.mark if trie_node else None
+        if mark is None:
+            return inherited, (trie_node, inherited)
+        return mark, (trie_node, SEL_EXCLUDE if mark == SEL_PARTIAL else mark)
+
+    def state(self, parts):
+        state, context = SEL_INCLUDE, self.root_context()
+        for name in parts:
+            state, context = self.child(context, name)
+        return state
+
+    def is_selected(self, path):
+        return self.state(self.parts_of(path)) != SEL_EXCLUDE
+
+    # --- Changes ---
+    def select(self, parts, include):
+        """
+        Includes or excludes parts and all its descendants. Excluded ancestors of an
+        included path become partial: included themselves, other children unchanged.
+        """
+        if not parts:
+            self.set_all(include)
+            return
+        trie_node, inherited = self.root_context()
+        for name in parts[:-1]:
+            trie_node = trie_node.children.setdefault(name, _TrieNode())
+            state = trie_node.mark or inherited
+            if include and state == SEL_EXCLUDE:
+                trie_node.mark = state = SEL_PARTIAL
+                trie_node.children = {} # Its other children stay excluded through inheritance
+            inherited = SEL_EXCLUDE if state == SEL_PARTIAL else state
+        trie_node = trie_node.children.setdefault(parts[-1], _TrieNode())
+        trie_node.mark = SEL_INCLUDE if include else SEL_EXCLUDE
+        trie_node.children = {} # Marks below are superseded by this one
+
+    def set_all(self, include):
+        """Replaces every mark with a single one on the root."""
+        self._root = _TrieNode()
+        self._root.mark = SEL_INCLUDE if include else SEL_EXCLUDE
+
+    def copy(self):
+        """Independent snapshot (only the marked paths are copied)."""
+        clone = SelectionTrie(self.root_path)
+        pending = [(self._root, clone._root)]
+        while pending:
+            source, target = pending.pop()
+            target.mark = source.mark
+            for name, source_child in source.children.items():
+                target.children[name] = _TrieNode()
+                pending.append((source_child, target.children[name]))
+        return clone
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Almacén compacto de nodos del árbol (sin Qt; lo usa el modelo de la interfaz)
+# ─────────────────────────────────────────────────────────────────────────────
+
+ROOT_NODE = 0
+
+# Bits of NodeStore.flags
+FLAG_DIR = 1
+FLAG_LOADED = 2
+FLAG_HIDDEN = 4 # Hidden by the filter
+FLAG_MESSAGE = 8 # Message row (load error); has no path
+FLAG_REMOVED = 16 # Detached by watch mode; ids are never reused
+
+# Byte translation tables for toggling FLAG_HIDDEN on the whole store at once
+_HIDE_ALL = bytes(flags if flags & FLAG_MESSAGE else flags | FLAG_HIDDEN for flags in range(256))
+_SHOW_ALL = bytes(flags & ~FLAG_HIDDEN for flags in range(256))
+
+
+class NodeStore:
+    """
+    Compact storage for the tree nodes of one root folder.
+
+    A node is an integer id indexing parallel arrays: parent id, row inside the
+    parent, number of children exposed to the view, flag bits and an interned
+    name. Directories keep their child ids in an array('i'). Full paths are not
+    stored; path() rebuilds them from the parent chain when needed. Selection is
+    not stored per node: it lives in the model's SelectionTrie.
+    """
+
+    def __init__(self, root_path=None):
+        self.root_path = root_path
+        self.parents = array("i", [-1])
+        self.rows = array("i", [0])
+        self.fetched = array("i", [0]) # Children already exposed to the view
+        self.flags = bytearray([FLAG_DIR])
+        self.names = [os.path.basename(root_path or "")]
+        self.children = [array("i")] # Child ids for directories, None for files and messages
+
+    def __len__(self):
+        return len(self.flags)
+
+    def add(self, parent, name, is_dir):
+        """Creates an unattached node under parent and returns its id."""
+        return self._append(parent, sys.intern(name), FLAG_DIR if is_dir else 0, array("i") if is_dir else None)
+
+    def add_message(self, parent, text):
+        """Creates an unattached message row (e.g. an access error) under parent."""
+        return self._append(parent, text, FLAG_MESSAGE, None)
+
+    def _append(self, parent, name, flags, children):
+        self.parents.append(parent)
+        self.rows.append(0)
+        self.fetched.append(0)
+        self.flags.append(flags)
+        self.names.append(name)
+        self.children.append(children)
+        return len(self.flags) - 1
+
+    def has(self, node, flag):
+        return bool(self.flags[node] & flag)
+
+    def set_flag(self, node, flag, on=True):
+        if on:
+            self.flags[node] |= flag
+        else:
+            self.flags[node] &= ~flag & 0xFF
+
+    def set_all_hidden(self, hidden):
+        """Sets or clears FLAG_HIDDEN on every node but message rows, in one pass."""
+        self.flags = bytearray(self.flags.translate(_HIDE_ALL if hidden else _SHOW_ALL))
+
+    def is_alive(self, node):
+        return 0 <= node < len(self.flags) and not self.flags[node] & FLAG_REMOVED
+
+    def name_chain(self, node):
+        """Names from the first level down to node (its path components)."""
+        parts = []
+        while node != ROOT_NODE:
+            parts.append(self.names[node])
+            node = self.parents[node]
+        parts.reverse()
+        return parts
+
+    def path(self, node):
+        """Rebuilds the full path of node (None for message rows)."""
+        if self.flags[node] & FLAG_MESSAGE:
+            return None
+        return os.path.join(self.root_path, *self.name_chain(node))
+
+    def loaded_dirs(self, node=ROOT_NODE):
+        """
+        Yields node and every loaded directory below it (explicit stack). node itself
+        is always yielded, even a file or an unloaded directory (nothing below it).
+        """
+        pending = [node]
+        while pending:
+            current = pending.pop()
+            yield current
+            children = self.children[current]
+            if children:
+                pending.extend(child for child in children if self.flags[child] & FLAG_LOADED)
+
+
+class NameIndex:
+    """
+    Lowercase name index for the filter.
+
+    Each distinct lowercase name is stored once with the ids of the nodes that
+    carry it, and every trigram of a name points to the names containing it, so
+    a query only verifies the names sharing its rarest trigram.
+    """
+
+    def __init__(self):
+        self._nodes = {} # Lowercase name -> array('i') of node ids
+        self._trigrams = {} # Trigram -> set of lowercase names
+
+    def add(self, node, name):
+        """Indexes node under name and returns the lowercase name."""
+        lower = sys.intern(name.lower())
+        nodes = self._nodes.get(lower)
+        if nodes is None:
+            self._nodes[lower] = array("i", [node])
+            for i in range(len(lower) - 2):
+                self._trigrams.setdefault(lower[i:i + 3], set()).add(lower)
+        else:
+            nodes.append(node)
+        return lower
+
+    def matching_names(self, text, candidates=None):
+        """
+        Lowercase names containing text. candidates narrows the search to a previous
+        result (valid when text refines the query that produced it).
+        """
+        if candidates is None:
+            if len(text) >= 3:
+                postings = [self._trigrams.get(text[i:i + 3]) for i in range(len(text) - 2)]
+                if not all(postings):
+                    return set()
+                candidates = min(postings, key=len)
+            else:
+                candidates = self._nodes
+        return {name for name in candidates if text in name}
+
+    def nodes(self, names):
+        """Ids of the nodes carrying any of names (removed nodes included)."""
+        for name in names:
+            yield from self._nodes[name]
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Reglas de exclusión por patrones (estilo .gitignore, compiladas)
+# ─────────────────────────────────────────────────────────────────────────────
+
+def _glob_segment_regex(segment):
+    """Regex source of one path component of a gitignore pattern (*, ? and [...] stay within it)."""
+    parts = []
+    i = 0
+    while i < len(segment):
+        char = segment[i]
+        i += 1
+        if char == "*":
+            parts.append("[^/]*")
+        elif char == "?":
+            parts.append("[^/]")
+        elif char == "\\" and i < len(segment):
+            parts.append(re.escape(segment[i]))
+            i += 1
+        elif char == "[":
+            start = i + 1 if segment[i:i + 1] in ("!", "^") else i
+            end = segment.find("]", start + 1) # A "]" first in the class is part of it
+            if end < 0:
+                parts.append("\\[")
+                continue
+            content = segment[start:end].replace("\\", "\\\\").replace("[", "\\[")
+            parts.append(("[^/" if start > i else "[") + content + "]")
+            i = end + 1
+        else:
+            parts.append(re.escape(char))
+    return "".join(parts)
+
+
+def _parse_ignore_line(line):
+    """(pattern, negated, directories only) of one gitignore line, or None for blank lines and comments."""
+    line = line.rstrip("\r\n")
+    stripped = line.rstrip(" ")
+    if stripped.endswith("\\") and stripped != line:
+        stripped += " " # Escaped trailing space
+    line = stripped
+    if not line or line.startswith("#"):
+        return None
+    negated = line.startswith("!")
+    if negated:
+        line = line[1:]
+    dir_only = line.endswith("/")
+    line = line.rstrip("/")
+    return (line, negated, dir_only) if line else None
+
+
+def _path_pattern_regex(pattern, dir_only):
+    """
+    Regex source of a pattern containing "/", matching a path relative to the rule's
+    directory ("/"-separated, directories with a trailing "/").
+    """
+    segments = pattern.lstrip("/").split("/")
+    body = []
+    for position, segment in enumerate(segments):
+        last = position == len(segments) - 1
+        if segment == "**":
+            body.append(".+" if last else "(?:.*/)?") # Trailing /** matches the content, not the directory
+        else:
+            body.append(_glob_segment_regex(segment) + ("" if last else "/"))
+    return "".join(body) + ("/" if dir_only else "/?")
+
+
+_GLOB_CHARS = re.compile(r"[*?\[\\]")
+
+
+class _PatternSet:
+    """
+    The patterns of one rule source, compiled once. Patterns without "/" match the
+    entry name at any depth: plain names and "*.<extension>" patterns (the usual
+    node_modules, *.pyc) are dictionary lookups, other globs one alternation.
+    Patterns with "/" match the path relative to the source's directory, in a
+    second alternation. Alternatives are in reverse order, so the group that
+    matches is the last matching rule; as in gitignore, the last match wins.
+    """
+    __slots__ = ("_literals", "_suffixes", "_names", "_name_rules", "_paths", "_path_rules", "_negated")
+
+    def __init__(self, lines):
+        self._literals = {} # Name ("/"-terminated for directories) -> last rule
+        self._suffixes = {} # Suffix from a "." ("/"-terminated for directories) -> last rule
+        self._negated = [] # Per rule
+        names, paths = [], []
+        for line in lines:
+            parsed = _parse_ignore_line(line)
+            if parsed is None:
+                continue
+            pattern, negated, dir_only = parsed
+            rule = len(self._negated)
+            self._negated.append(negated)
+            if "/" in pattern:
+                paths.append((rule, _path_pattern_regex(pattern, dir_only)))
+            elif not _GLOB_CHARS.search(pattern):
+                self._add_key(self._literals, pattern, dir_only, rule)
+            elif pattern.startswith("*.") and not _GLOB_CHARS.search(pattern, 1):
+                self._add_key(self._suffixes, pattern[1:], dir_only, rule)
+            else:
+                names.append((rule, _glob_segment_regex(pattern) + ("/" if dir_only else "/?")))
+        self._names, self._name_rules = self._compile(names)
+        self._paths, self._path_rules = self._compile(paths)
+
+    @staticmethod
+    def _add_key(table, text, dir_only, rule):
+        text = text.lower() if IGNORE_CASE_INSENSITIVE else text
+        table[text + "/"] = rule
+        if not dir_only:
+            table[text] = rule
+
+    @staticmethod
+    def _compile(rules):
+        if not rules:
+            return None, ()
+        rules.reverse()
+        flags = re.DOTALL | (re.IGNORECASE if IGNORE_CASE_INSENSITIVE else 0)
+        regex = re.compile("|".join(f"({source})" for _, source in rules), flags)
+        return regex, tuple(rule for rule, _ in rules)
+
+    def __bool__(self):
+        return bool(self._negated)
+
+    def match(self, name, prefix):
+        """
+        Verdict of the last rule matching name (with a trailing "/" for directories) in
+        the directory whose path relative to the rules is prefix: True when ignored,
+        False when re-included with "!", None when no rule matches.
+        """
+        key = name.lower() if IGNORE_CASE_INSENSITIVE else name
+        rule = self._literals.get(key, -1) if self._literals else -1
+        if self._suffixes:
+            dot = key.find(".")
+            while dot >= 0: # Every suffix starting at a "." (x.tar.gz: .tar.gz, .gz)
+                found = self._suffixes.get(key[dot:], -1)
+                if found > rule:
+                    rule = found
+                dot = key.find(".", dot + 1)
+        if self._names:
+            found = self._names.fullmatch(name)
+            if found and self._name_rules[found.lastindex - 1] > rule:
+                rule = self._name_rules[found.lastindex - 1]
+        if self._paths:
+            found = self._paths.fullmatch(prefix + name)
+            if found and self._path_rules[found.lastindex - 1] > rule:
+                rule = self._path_rules[found.lastindex - 1]
+        return None if rule < 0 else not self._negated[rule]
+
+
+class IgnoreRules:
+    """
+    Gitignore-style exclusion rules for the paths below root_path, applied to each
+    listing before it is used, so an excluded directory is never listed nor walked.
+
+    patterns (relative to the root, one gitignore line each) are compiled once;
+    with use_gitignore, the .gitignore file of every listed directory is compiled
+    too (again only when its mtime changes) and applies to that directory's
+    subtree. The patterns given here take precedence over the .gitignore files,
+    and a deeper .gitignore over a shallower one. Listings must be filtered top
+    down (a directory after its parent), as every traversal does. Thread-safe.
+    """
+
+    def __init__(self, root_path, patterns=(), use_gitignore=False):
+        self.root_path = root_path
+        self.patterns = [line for line in patterns if _parse_ignore_line(line)]
+        self.use_gitignore = use_gitignore
+        self.pruned = 0 # Entries removed from listings (approximate when used from several threads)
+        self._patterns = _PatternSet(self.patterns)
+        self._gitignores = {} # Directory path -> (.gitignore mtime, _PatternSet), only where one exists
+        self._lock = threading.Lock()
+
+    def __bool__(self):
+        """False when there is nothing to apply (the listings can be used as they are)."""
+        return bool(self._patterns) or self.use_gitignore
+
+    @staticmethod
+    def _prefix(base, dir_path):
+        """Path of dir_path relative to base, "/"-separated and ending with "/" ("" for base itself)."""
+        relative = os.path.relpath(dir_path, base)
+        return "" if relative == os.curdir else relative.replace(os.sep, "/") + "/"
+
+    def _load_gitignore(self, dir_path, entries):
+        """Updates the compiled .gitignore of dir_path from its listing."""
+        entry = next((entry for entry in entries if entry.name == GITIGNORE_FILE and not entry.is_dir), None)
+        if entry is None:
+            if dir_path in self._gitignores:
+                with self._lock:
+                    self._gitignores.pop(dir_path, None)
+            return
+        cached = self._gitignores.get(dir_path)
+        if cached and cached[0] == entry.mtime:
+            return
+        try:
+            with open(entry.path, encoding="utf-8", errors="replace") as f:
+                patterns = _PatternSet(f)
+        except OSError as e:
+            hot_log.warning("No se pudo leer %s: %s", entry.path, e)
+            patterns = _PatternSet(())
+        with self._lock:
+            self._gitignores[dir_path] = (entry.mtime, patterns)
+
+    def _scopes(self, dir_path):
+        """(patterns, prefix of dir_path) for every rule source that applies in dir_path, by precedence."""
+        scopes = [(self._patterns, self._prefix(self.root_path, dir_path))] if self._patterns else []
+        if self._gitignores:
+            path = dir_path
+            while True:
+                cached = self._gitignores.get(path)
+                if cached and cached[1]:
+                    scopes.append((cached[1], self._prefix(path, dir_path)))
+                parent = os.path.dirname(path)
+                if path == self.root_path or parent == path or len(parent) < len(self.root_path):
+                    break
+                path = parent
+        return scopes
+
+    def filter(self, dir_path, entries):
+        """Returns the entries of dir_path that no rule excludes (entries itself when none is)."""
+        if self.use_gitignore:
+            self._load_gitignore(dir_path, entries)
+        scopes = self._scopes(dir_path)
+        if not scopes:
+            return entries
+        kept = []
+        for entry in entries:
+            name = entry.name + "/" if entry.is_dir else entry.name
+            for patterns, prefix in scopes:
+                verdict = patterns.match(name, prefix)
+                if verdict is not None:
+                    break
+            if not verdict:
+                kept.append(entry)
+        if len(kept) == len(entries):
+            return entries
+        self.pruned += len(entries) - len(kept)
+        return kept
+
+    def wrap(self, lister):
+        """Lister with the same contract as lister whose listings are filtered by these rules."""
+        def filtered_lister(dir_path):
+            return self.filter(dir_path, lister(dir_path))
+        return filtered_lister
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Generación del mapa (recorrido con selección, progreso y cancelación)
+# ─────────────────────────────────────────────────────────────────────────────
+
+def default_output_path(root_path, fmt=MAP_FORMAT_TEXT, compression=None):
+    """<root>/<root name>-estructura.<ext>[.gz|.zst], where the application saves maps."""
+    suffix = MAP_FORMATS[fmt] + (MAP_COMPRESSIONS[compression] if compression else "")
+    return os.path.join(root_path, f"{os.path.basename(root_path)}-estructura{suffix}")
+
+
+def _zstd_module():
+    """compression.zstd (Python 3.14+) or the zstandard package; None when neither is available."""
+    try:
+        from compression import zstd
+        return zstd
+    except ImportError:
+        pass
+    try:
+        import zstandard
+        return zstandard
+    except ImportError:
+        return None
+
+
+def available_compressions():
+    """Compressions usable in this interpreter (gzip always; zstd when a module provides it)."""
+    return [name for name in MAP_COMPRESSIONS if name != "zstd" or _zstd_module() is not None]
+
+
+def open_compressed(path, compression):
+    """Opens path for writing binary data compressed in-stream with gzip or zstd."""
+    if compression == "gzip":
+        import gzip
+        return gzip.open(path, "wb", compresslevel=GZIP_LEVEL)
+    zstd = _zstd_module()
+    if zstd is None:
+        raise RuntimeError("La compresión zstd requiere Python 3.14 o el paquete 'zstandard'")
+    if zstd.__name__ == "zstandard":
+        return zstd.ZstdCompressor(level=ZSTD_LEVEL).stream_writer(open(path, "wb"))
+    return zstd.open(path, "wb", level=ZSTD_LEVEL)
+
+
+class DirectoryTotals(NamedTuple):
+    """Recursive totals of the mapped (selected) content of a directory."""
+    bytes: int
+    files: int
+    dirs: int
+
+
+def format_totals(totals, partial=False):
+    """Σ size · files · directories, as shown in the map, the preview and the tree."""
+    text = TOTALS_FORMAT.format(size=format_size(totals.bytes), files=totals.files, dirs=totals.dirs)
+    return text + TOTALS_PARTIAL_SUFFIX if partial else text
+
+
+class _TimedWriter(io.RawIOBase):
+    """Binary sink forwarding every write to raw and timing it as "map.write" (buffer it in front)."""
+
+    def __init__(self, raw, instrumentation):
+        super().__init__()
+        self._raw = raw
+        self._instrumentation = instrumentation
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        start = time.perf_counter()
+        written = self._raw.write(data)
+        self._instrumentation.add("map.write", time.perf_counter() - start)
+        return len(data) if written is None else written
+
+
+class StructureMapper:
+    """
+    Writes the structure map of root_path, respecting a SelectionTrie.
+
+    Listings go through lister (scan_directory or an index/cache with the same
+    contract), filtered by rules (IgnoreRules) when given, and prefetched by a
+    ParallelScanner when workers > 1; lines are always produced in order.
+    on_progress, when given, receives a ProgressSnapshot at most once per
+    PROGRESS_UPDATE_INTERVAL from the traversing thread. cancel() may be called
+    from any thread; the traversal stops after the current entry.
+
+    Recursive totals (bytes, files, directories) are added up post-order in the
+    same traversal: each directory's totals follow its subtree on a closing line
+    and the root's close the map, so every format is written as a plain stream.
+
+    With an Instrumentation, the time spent waiting for listings (map.list),
+    applying the selection (map.select), reporting progress (map.progress) and
+    writing the file (map.write) is recorded, and the rest of the traversal as
+    map.format; scan_directory is replaced by its instrumented Instrumentation.scan.
+    """
+
+    def __init__(self, root_path, selection=None, workers=1, lister=scan_directory, on_progress=None,
+                 record_totals=None, rules=None, instrumentation=None):
+        self.root_path = root_path
+        self.selection = selection or SelectionTrie(root_path) # Snapshot; everything selected by default
+        self.rules = rules
+        self.instrumentation = instrumentation
+        if instrumentation and lister is scan_directory:
+            lister = instrumentation.scan
+        # Excluded directories are dropped from their parent's listing: never listed, prefetched nor counted
+        self.lister = rules.wrap(lister) if rules else lister
+        self.workers = max(1, workers) # 1 = recorrido secuencial
+        self.on_progress = on_progress
+        self.progress = ProgressTracker()
+        self.keep_partial = True # On cancel: keep the lines written so far, with a truncation marker
+        self.truncated = False # The traversal stopped before the end
+        self.record_totals = record_totals # Directory paths whose totals are kept in totals (any container)
+        self.totals = {} # Path -> DirectoryTotals, for the completed directories in record_totals
+        self.root_totals = None # DirectoryTotals of the root once the traversal ends (partial if truncated)
+        self._scanner = None # ParallelScanner while writing with several workers
+        self._contexts = {} # Selection context of each selected directory waiting to be listed
+        self._cancel_requested = threading.Event()
+
+    def cancel(self, keep_partial=True):
+        """Asks the traversal to stop after the current entry. Safe to call from any thread."""
+        self.keep_partial = keep_partial
+        self._cancel_requested.set()
+
+    def _is_selected(self, path):
+        """Resolves path against the selection trie (used by the prefetching threads)."""
+        return self.selection.is_selected(path)
+
+    def _list_directory(self, dir_path):
+        """Lists dir_path, through the parallel scanner when enabled."""
+        instrumentation = self.instrumentation
+        start = time.perf_counter() if instrumentation else 0.0
+        try:
+            if self._scanner:
+                return self._scanner.listing(dir_path)
+            return self.lister(dir_path)
+        finally:
+            if instrumentation:
+                instrumentation.add("map.list", time.perf_counter() - start)
+
+    def write(self, output_path=None, fmt=MAP_FORMAT_TEXT, compression=None):
+        """
+        Writes the map to output_path (default_output_path() when None) and returns
+        the path. fmt is a key of MAP_FORMATS and compression None or a key of
+        MAP_COMPRESSIONS; every format is streamed while traversing. If cancelled,
+        the partial map is kept with a truncation marker or removed, as requested
+        by cancel(); check truncated afterwards.
+        """
+        if fmt not in MAP_FORMATS or (compression and compression not in MAP_COMPRESSIONS):
+            raise ValueError(f"Formato de salida no válido: {fmt}" + (f" + {compression}" if compression else ""))
+        output_path = output_path or default_output_path(self.root_path, fmt, compression)
+        self._start_scanner()
+        try:
+            # List the root before creating the output file so a new map does not include itself
+            root_entries = self._list_root()
+            # Stream to the file (through the compressor) while traversing
+            if compression:
+                output = open_compressed(output_path, compression)
+            else:
+                output = open(output_path, "wb", buffering=MAP_WRITE_BUFFER_SIZE)
+            with output:
+                sink = output
+                if self.instrumentation:
+                    sink = io.BufferedWriter(_TimedWriter(output, self.instrumentation), MAP_WRITE_BUFFER_SIZE)
+                # The text map uses the platform's line endings; the data formats define their own
+                text = io.TextIOWrapper(sink, encoding="utf-8", newline=None if fmt == MAP_FORMAT_TEXT else "")
+                try:
+                    if fmt == MAP_FORMAT_TEXT:
+                        self._write_map(text, root_entries)
+                    else:
+                        self._export(fmt, text, root_entries)
+                finally:
+                    text.flush()
+                    text.detach() # output is closed by the with block
+                    if sink is not output:
+                        sink.detach()
+        finally:
+            self._stop_scanner()
+
+        if self.truncated and not self.keep_partial:
+            try:
+                os.remove(output_path)
+            except OSError as e:
+                logging.warning(f"No se pudo eliminar el mapa parcial {output_path}: {e}")
+        return output_path
+
+    def write_to(self, file_obj, fmt=MAP_FORMAT_TEXT):
+        """Streams the map to an already open text file (e.g. sys.stdout)."""
+        if fmt not in MAP_FORMATS:
+            raise ValueError(f"Formato de salida no válido: {fmt}")
+        self._start_scanner()
+        try:
+            root_entries = self._list_root()
+            if fmt == MAP_FORMAT_TEXT:
+                self._write_map(file_obj, root_entries)
+            else:
+                self._export(fmt, file_obj, root_entries)
+        finally:
+            self._stop_scanner()
+
+    def _export(self, fmt, file_obj, root_entries):
+        """Streams the records of the map with the exporter registered for fmt."""
+        with self._measure_format():
+            MAP_EXPORTERS[fmt](self, file_obj, root_entries)
+        if self.on_progress:
+            self.on_progress(self.progress.snapshot()) # Final counters
+
+    @contextmanager
+    def _measure_format(self):
+        """Records the traversal time not spent in the other map phases as map.format."""
+        instrumentation = self.instrumentation
+        if not instrumentation:
+            yield
+            return
+        nested = ("map.list", "map.select", "map.progress", "map.write")
+        start, nested_before = time.perf_counter(), instrumentation.seconds(*nested)
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            instrumentation.add("map.format", elapsed - (instrumentation.seconds(*nested) - nested_before))
+
+    def _start_scanner(self):
+        if self.workers > 1:
+            self._scanner = ParallelScanner(self.workers, self._is_selected, lister=self.lister)
+
+    def _stop_scanner(self):
+        if self._scanner:
+            self._scanner.close()
+            self._scanner = None
+
+    def _list_root(self):
+        try:
+            return self._list_directory(self.root_path)
+        except OSError:
+            return None # mapear_estructura lists again and reports the error line
+
+    def _write_map(self, file_obj, root_entries):
+        """Writes the header and the lines of the map (in order, even when prefetched in parallel)."""
+        file_obj.write(f"ESTRUCTURA DE CARPETAS\n{'='*25}\n")
+        file_obj.write(f"Ruta: {self.root_path}\n")
+        file_obj.write(f"Fecha: {time.strftime('%d/%m/%Y %H:%M:%S')}\n\n")
+        with self._measure_format():
+            write_lines(file_obj, self.mapear_estructura(self.root_path, entries=root_entries))
+        if self.root_totals is not None:
+            file_obj.write(f"\n\nTotal: {format_totals(self.root_totals, self.truncated)}")
+        if self.truncated and self.keep_partial:
+            file_obj.write("\n\n" + MAP_TRUNCATED_MARKER.format(entries=self.progress.entries))
+        if self.on_progress:
+            self.on_progress(self.progress.snapshot()) # Final counters
+
+    def _report_progress(self):
+        """Sends a snapshot to on_progress (a queued signal in the application)."""
+        if not self.instrumentation:
+            self.on_progress(self.progress.snapshot())
+            return
+        start = time.perf_counter()
+        self.on_progress(self.progress.snapshot())
+        self.instrumentation.add("map.progress", time.perf_counter() - start)
+
+    def _selected_children(self, dir_path, entries=None, context=None):
+        """
+        Returns the selected entries of dir_path, or a one-item list with the error text
+        to show in its place when it cannot be listed. context is the selection context
+        of dir_path (the root's when None).
+        """
+        if entries is None:
+            try:
+                entries = self._list_directory(dir_path)
+            except PermissionError:
+                hot_log.warning("Permiso denegado para listar contenido en: %s", dir_path)
+                self.progress.directory_listed(0)
+                return ["[Acceso denegado]"]
+            except Exception as e:
+                hot_log.warning("Error al listar contenido de %s: %s", dir_path, e)
+                self.progress.directory_listed(0)
+                return [f"[Error al listar: {str(e)}]"]
+
+        # Resolve each entry one step down the trie from its directory's context
+        start = time.perf_counter()
+        if context is None:
+            context = self.selection.root_context()
+        items = [] # Already sorted
+        for entry in entries:
+            state, child_context = self.selection.child(context, entry.name)
+            if state != SEL_EXCLUDE:
+                items.append(entry)
+                if entry.is_dir:
+                    self._contexts[entry.path] = child_context
+        self.progress.directory_listed(sum(1 for entry in items if entry.is_dir))
+        if self.instrumentation:
+            self.instrumentation.add("map.select", time.perf_counter() - start)
+        return items
+
+    def mapear_estructura(self, dir_path, entries=None):
+        """
+        Generator yielding the lines of the directory structure respecting selections.
+        entries may carry the already scanned content of dir_path to avoid listing it twice.
+        Iterative (explicit stack): only the listings along the current branch are kept in memory.
+
+        Totals are accumulated for the open directories (the current branch). When a
+        directory with content closes, a line with its totals follows its subtree,
+        indented like its children; the root's are left in root_totals.
+        """
+        listed_children = {} # Children of the directory whose line was just yielded
+
+        def get_children(node):
+            if isinstance(node, str) or not node.is_dir:
+                return None
+            return listed_children.pop(node.path, None)
+
+        record_totals = self.record_totals
+        # Open directories, root first: [path, prefix of its children, bytes, files, dirs]
+        open_dirs = [[dir_path, "", 0, 0, 0]]
+
+        def close_dirs(depth, partial=False):
+            """Closes the open directories deeper than depth, adding each one to its parent; returns their totals lines."""
+            lines = []
+            while len(open_dirs) > depth:
+                path, child_prefix, size, files, dirs = open_dirs.pop()
+                totals = DirectoryTotals(size, files, dirs)
+                if open_dirs:
+                    parent = open_dirs[-1]
+                    parent[2] += size
+                    parent[3] += files
+                    parent[4] += dirs + 1
+                    if files or dirs: # Empty (or unreadable) directories get no totals line
+                        lines.append(f"{child_prefix}[{format_totals(totals, partial)}]")
+                else:
+                    self.root_totals = totals
+                if record_totals is not None and not partial and path in record_totals:
+                    self.totals[path] = totals
+            return lines
+
+        progress = self.progress
+        on_progress = self.on_progress
+        cancel_requested = self._cancel_requested
+        progress.dirs_pending += 1 # The root itself
+        try:
+            for node, prefix, is_last in walk_tree(self._selected_children(dir_path, entries), get_children):
+                if cancel_requested.is_set(): # Checked once per entry: stops within one listing
+                    self.truncated = True
+                    yield from close_dirs(0, partial=True)
+                    return
+                yield from close_dirs(len(prefix) // len(TREE_PIPE) + 1) # Subtrees left behind are complete
+                line = TREE_LAST if is_last else TREE_BRANCH
+                if on_progress and progress.due(): # Throttled: at most one update per interval
+                    self._report_progress()
+
+                if isinstance(node, str): # Error text standing in for a directory's content
+                    yield f"{prefix}{line}{node}"
+                    continue
+
+                if node.is_dir:
+                    # A single listing serves both the item count and the children
+                    context = self._contexts.pop(node.path)
+                    try:
+                        child_entries = self._list_directory(node.path)
+                        details = f" ({len(child_entries)} items)"
+                        listed_children[node.path] = self._selected_children(node.path, child_entries, context)
+                    except PermissionError:
+                        details = " [Acceso denegado]"
+                        listed_children[node.path] = ["[Acceso denegado]"]
+                        progress.directory_listed(0)
+                    except Exception as e:
+                        hot_log.warning("Could not list items in %s: %s", node.path, e)
+                        details = f" [Error al contar: {str(e)}]"
+                        listed_children[node.path] = [f"[Error al listar: {str(e)}]"]
+                        progress.directory_listed(0)
+                    progress.entry_seen(node.size)
+                    yield f"{prefix}{line}📁 {node.name}{details}"
+                    open_dirs.append([node.path, prefix + (TREE_SPACE if is_last else TREE_PIPE), 0, 0, 0])
+                    continue
+
+                if node.size is not None:
+                    # Size comes from the stat made while scanning
+                    details = f" ({format_size(node.size)})"
+                    open_dirs[-1][2] += node.size
+                else:
+                    details = " [Error al obtener tamaño]"
+                open_dirs[-1][3] += 1
+                progress.entry_seen(node.size)
+                yield f"{prefix}{line}📄 {node.name}{details}" # Add details to line
+            yield from close_dirs(0)
+        except Exception as e:
+            logging.exception("Error inesperado en mapear_estructura para %s:", dir_path)
+            yield from close_dirs(0, partial=True)
+            yield f"└── [Error: {str(e)}]"
+
+    def iter_records(self, dir_path, entries=None):
+        """
+        Generator of (entry, depth, error) for the selected content of dir_path, in map
+        order, with the selection, prefetching, progress and cancellation of
+        mapear_estructura; the output formats other than text are built on it. When
+        a directory cannot be listed, its content is one record with error set and
+        entry being that directory (depth is the level of the missing content).
+        The totals of the selected content are left in root_totals, as by mapear_estructura.
+        """
+        listed_children = {} # Children of the directory just yielded
+        parents = [ScanEntry(os.path.basename(dir_path), dir_path, KIND_DIR, None, None, 0)] # Directory per depth
+
+        def get_children(node):
+            if isinstance(node, str) or not node.is_dir:
+                return None
+            return listed_children.pop(node.path, None)
+
+        progress = self.progress
+        on_progress = self.on_progress
+        cancel_requested = self._cancel_requested
+        progress.dirs_pending += 1 # The root itself
+        size = files = dirs = 0
+        try:
+            for node, prefix, _ in walk_tree(self._selected_children(dir_path, entries), get_children):
+                if cancel_requested.is_set(): # Checked once per entry: stops within one listing
+                    self.truncated = True
+                    return
+                if on_progress and progress.due(): # Throttled: at most one update per interval
+                    self._report_progress()
+                depth = len(prefix) // len(TREE_PIPE)
+
+                if isinstance(node, str): # Error text standing in for a directory's content
+                    yield parents[depth], depth, node
+                    continue
+                if node.is_dir:
+                    context = self._contexts.pop(node.path)
+                    try:
+                        child_entries = self._list_directory(node.path)
+                        listed_children[node.path] = self._selected_children(node.path, child_entries, context)
+                    except PermissionError:
+                        listed_children[node.path] = ["[Acceso denegado]"]
+                        progress.directory_listed(0)
+                    except Exception as e:
+                        hot_log.warning("Could not list items in %s: %s", node.path, e)
+                        listed_children[node.path] = [f"[Error al listar: {str(e)}]"]
+                        progress.directory_listed(0)
+                    del parents[depth + 1:]
+                    parents.append(node)
+                    dirs += 1
+                else:
+                    files += 1
+                    size += node.size or 0
+                progress.entry_seen(node.size)
+                yield node, depth, None
+        finally:
+            self.root_totals = DirectoryTotals(size, files, dirs) # Partial if the traversal stopped early
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Exportación en formatos de datos (NDJSON, CSV y JSON anidado, en flujo)
+# ─────────────────────────────────────────────────────────────────────────────
+
+def _relative_path(root_path, path):
+    """path relative to root_path with "/" separators ("" for the root)."""
+    relative = path[len(root_path):].lstrip(os.sep)
+    return relative.replace(os.sep, "/") if os.sep != "/" else relative
+
+
+def _json_encoder():
+    import json
+    return json.JSONEncoder(ensure_ascii=False, separators=(",", ":")).encode
+
+
+def export_ndjson(mapper, file_obj, root_entries=None):
+    """One JSON object per line with RECORD_FIELDS; a final {"kind": "truncated"} when cancelled."""
+    encode = _json_encoder()
+    root_path = mapper.root_path
+    write = file_obj.write
+    for entry, depth, error in mapper.iter_records(root_path, root_entries):
+        if error:
+            record = {"path": _relative_path(root_path, entry.path), "kind": "error", "size": None, "mtime": None,
+                      "depth": depth, "error": error}
+        else:
+            record = {"path": _relative_path(root_path, entry.path), "kind": entry.kind, "size": entry.size,
+                      "mtime": entry.mtime, "depth": depth}
+        write(encode(record))
+        write("\n")
+    if mapper.truncated and mapper.keep_partial:
+        write(encode({"kind": "truncated", "entries": mapper.progress.entries}) + "\n")
+
+
+def export_csv(mapper, file_obj, root_entries=None):
+    """CSV with a RECORD_FIELDS header row; empty cells stand for missing values."""
+    import csv
+    root_path = mapper.root_path
+    writer = csv.writer(file_obj, lineterminator="\n")
+    writer.writerow(RECORD_FIELDS)
+    for entry, depth, error in mapper.iter_records(root_path, root_entries):
+        if error:
+            writer.writerow((_relative_path(root_path, entry.path), "error", None, None, depth, error))
+        else:
+            writer.writerow((_relative_path(root_path, entry.path), entry.kind, entry.size, entry.mtime, depth, None))
+    if mapper.truncated and mapper.keep_partial:
+        writer.writerow(("", "truncated", None, None, None, MAP_TRUNCATED_MARKER.format(entries=mapper.progress.entries)))
+
+
+def export_json(mapper, file_obj, root_entries=None):
+    """
+    One nested JSON document: {"root", "generated", "children": [...], "truncated"}.
+    Directories carry their own "children" array; objects are closed as the
+    traversal leaves each directory, so nothing is accumulated in memory.
+    """
+    encode = _json_encoder()
+    write = file_obj.write
+    write(f'{{"root":{encode(mapper.root_path)},"generated":{encode(time.strftime("%Y-%m-%dT%H:%M:%S"))},"children":[')
+    open_dirs = 0 # Directory objects whose "children" array is still open
+    first = True # The next item is the first of its array
+    for entry, depth, error in mapper.iter_records(mapper.root_path, root_entries):
+        if open_dirs > depth:
+            write("]}" * (open_dirs - depth))
+            open_dirs = depth
+            first = False
+        write("\n" if first else ",\n")
+        if error:
+            write(f'{{"kind":"error","error":{encode(error)}}}')
+            first = False
+        elif entry.is_dir:
+            write(f'{{"name":{encode(entry.name)},"kind":"dir","mtime":{encode(entry.mtime)},"children":[')
+            open_dirs += 1
+            first = True
+        else:
+            write(f'{{"name":{encode(entry.name)},"kind":"file","size":{encode(entry.size)},'
+                  f'"mtime":{encode(entry.mtime)}}}')
+            first = False
+    write("]}" * open_dirs)
+    write(f'\n],"truncated":{encode(mapper.truncated)}')
+    if mapper.truncated:
+        write(f',"entries":{mapper.progress.entries}')
+    write("}\n")
+
+
+# Exporter per format (besides the text map): exporter(mapper, text file, root entries or None)
+MAP_EXPORTERS = {"ndjson": export_ndjson, "csv": export_csv, "json": export_json}
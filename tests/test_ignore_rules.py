@@ -0,0 +1,92 @@
+"""Gitignore-style exclusion rules: pattern syntax and precedence between rule sources."""
+import os
+
+from folder_mapper_core import GITIGNORE_FILE, IgnoreRules, _PatternSet, scan_directory
+
+
+def make_tree(root, *paths):
+    """Creates the files of paths ("/"-separated; a trailing "/" makes an empty directory)."""
+    for relative in paths:
+        path = root.joinpath(*relative.rstrip("/").split("/"))
+        if relative.endswith("/"):
+            path.mkdir(parents=True, exist_ok=True)
+        else:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text("x", encoding="utf-8")
+
+
+def kept(root, patterns=(), use_gitignore=False):
+    """Relative paths left by the rules ("/"-terminated for directories), listing top down."""
+    lister = IgnoreRules(str(root), patterns, use_gitignore).wrap(scan_directory)
+    found, pending = [], [str(root)]
+    while pending:
+        for entry in lister(pending.pop()):
+            relative = os.path.relpath(entry.path, root).replace(os.sep, "/")
+            found.append(relative + "/" if entry.is_dir else relative)
+            if entry.is_dir:
+                pending.append(entry.path)
+    return sorted(found)
+
+
+def test_anchored_pattern_matches_only_at_the_root(tmp_path):
+    make_tree(tmp_path, "build/out.o", "src/build/out.o")
+    assert kept(tmp_path, ["/build"]) == ["src/", "src/build/", "src/build/out.o"]
+    assert kept(tmp_path, ["build"]) == ["src/"]
+
+
+def test_pattern_with_a_slash_is_relative_to_the_root(tmp_path):
+    make_tree(tmp_path, "docs/api/index.html", "src/docs/api/index.html")
+    assert kept(tmp_path, ["docs/api"]) == ["docs/", "src/", "src/docs/", "src/docs/api/", "src/docs/api/index.html"]
+
+
+def test_double_star_patterns(tmp_path):
+    make_tree(tmp_path, "a/b/x", "a/m/b/x", "a/m/n/b/x", "a/c/x", "deep/er/foo/x", "foo", "logs/today.log")
+    assert kept(tmp_path, ["a/**/b"]) == [
+        "a/", "a/c/", "a/c/x", "a/m/", "a/m/n/", "deep/", "deep/er/", "deep/er/foo/", "deep/er/foo/x", "foo",
+        "logs/", "logs/today.log"]
+    assert kept(tmp_path, ["**/foo"]) == [
+        "a/", "a/b/", "a/b/x", "a/c/", "a/c/x", "a/m/", "a/m/b/", "a/m/b/x", "a/m/n/", "a/m/n/b/", "a/m/n/b/x",
+        "deep/", "deep/er/", "logs/", "logs/today.log"]
+    # A trailing /** matches what is inside the directory, not the directory itself
+    assert "logs/" in kept(tmp_path, ["logs/**"])
+    assert "logs/today.log" not in kept(tmp_path, ["logs/**"])
+
+
+def test_directory_only_pattern_keeps_files_of_that_name(tmp_path):
+    make_tree(tmp_path, "out/bin", "src/out")
+    assert kept(tmp_path, ["out/"]) == ["src/", "src/out"]
+    assert kept(tmp_path, ["out"]) == ["src/"]
+
+
+def test_negation_last_matching_rule_wins(tmp_path):
+    make_tree(tmp_path, "debug.log", "keep.log", "notes.txt")
+    assert kept(tmp_path, ["*.log", "!keep.log"]) == ["keep.log", "notes.txt"]
+    assert kept(tmp_path, ["!keep.log", "*.log"]) == ["notes.txt"]
+
+
+def test_pattern_set_match_verdicts():
+    patterns = _PatternSet(["# comment", "", "*.pyc", "!keep.pyc", "cache/", "/top"])
+    assert patterns.match("mod.pyc", "src/") is True
+    assert patterns.match("keep.pyc", "src/") is False
+    assert patterns.match("mod.py", "src/") is None
+    assert patterns.match("cache/", "src/") is True
+    assert patterns.match("cache", "src/") is None
+    assert patterns.match("top", "") is True
+    assert patterns.match("top", "src/") is None
+    assert not _PatternSet(["# only a comment", ""])
+
+
+def test_user_patterns_take_precedence_over_gitignore(tmp_path):
+    make_tree(tmp_path, "a.tmp", "b.tmp", "c.txt")
+    (tmp_path / GITIGNORE_FILE).write_text("*.tmp\n", encoding="utf-8")
+    assert kept(tmp_path, use_gitignore=True) == [GITIGNORE_FILE, "c.txt"]
+    assert kept(tmp_path, ["!a.tmp"], use_gitignore=True) == [GITIGNORE_FILE, "a.tmp", "c.txt"]
+    assert kept(tmp_path, ["!a.tmp"]) == [GITIGNORE_FILE, "a.tmp", "b.tmp", "c.txt"] # .gitignore not read
+
+
+def test_deeper_gitignore_takes_precedence_over_shallower(tmp_path):
+    make_tree(tmp_path, "x.tmp", "sub/x.tmp", "sub/y.tmp", "sub/inner/x.tmp", "other/x.tmp")
+    (tmp_path / GITIGNORE_FILE).write_text("*.tmp\n", encoding="utf-8")
+    (tmp_path / "sub" / GITIGNORE_FILE).write_text("!x.tmp\n", encoding="utf-8")
+    assert kept(tmp_path, use_gitignore=True) == [
+        GITIGNORE_FILE, "other/", "sub/", f"sub/{GITIGNORE_FILE}", "sub/inner/", "sub/inner/x.tmp", "sub/x.tmp"]
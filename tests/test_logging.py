@@ -0,0 +1,50 @@
+"""Queued logging setup and the hot-path throttle."""
+import logging
+import threading
+
+from folder_mapper_core import ThrottledLog, setup_logging, stop_logging
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+def test_flush_reports_dropped_messages():
+    logger = logging.getLogger("test_throttled_log")
+    logger.setLevel(logging.DEBUG)
+    logger.propagate = False
+    handler = ListHandler()
+    logger.addHandler(handler)
+    throttled = ThrottledLog(interval=3600, logger=logger)
+    for i in range(4):
+        throttled.warning("Permiso denegado: %s", f"dir_{i}")
+
+    throttled.flush()
+    throttled.flush() # Nothing left to report
+    assert handler.messages == ["Permiso denegado: dir_0", "3 mensajes similares omitidos: Permiso denegado: %s"]
+
+
+def test_setup_logging_twice_keeps_one_listener(tmp_path):
+    root = logging.getLogger()
+    saved_handlers, saved_level = root.handlers[:], root.level
+    try:
+        before = threading.active_count()
+        setup_logging(log_file=str(tmp_path / "first.log"), console=False)
+        setup_logging(log_file=str(tmp_path / "second.log"), console=False)
+        assert threading.active_count() == before + 1
+        logging.info("segundo")
+        stop_logging()
+        assert threading.active_count() == before
+        assert "segundo" in (tmp_path / "second.log").read_text(encoding="utf-8")
+    finally:
+        stop_logging()
+        for handler in root.handlers[:]:
+            root.removeHandler(handler)
+        for handler in saved_handlers:
+            root.addHandler(handler)
+        root.setLevel(saved_level)
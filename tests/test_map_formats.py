@@ -0,0 +1,59 @@
+"""Every output format writes its map and leaves the root totals, in the core and the application."""
+import gzip
+import os
+
+import pytest
+
+from folder_mapper_core import MAP_FORMATS, DirectoryTotals, StructureMapper, default_output_path
+
+TREE_TOTALS = DirectoryTotals(3 + 5 + 7, 3, 2)
+
+
+def build_tree(root):
+    for relative, content in (("a.txt", "xxx"), ("src/b.py", "xxxxx"), ("src/lib/c.py", "xxxxxxx")):
+        path = root / relative
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(content, encoding="utf-8")
+
+
+@pytest.mark.parametrize("fmt", list(MAP_FORMATS))
+@pytest.mark.parametrize("workers", [1, 4])
+def test_write_leaves_root_totals(tmp_path, fmt, workers):
+    build_tree(tmp_path)
+    mapper = StructureMapper(str(tmp_path), workers=workers)
+    output_path = mapper.write(str(tmp_path.parent / f"map-{fmt}-{workers}{MAP_FORMATS[fmt]}"), fmt)
+    assert os.path.getsize(output_path) > 0
+    assert mapper.root_totals == TREE_TOTALS
+    assert not mapper.truncated
+
+
+def test_compressed_export_leaves_root_totals(tmp_path):
+    build_tree(tmp_path)
+    mapper = StructureMapper(str(tmp_path))
+    output_path = mapper.write(str(tmp_path.parent / "map.ndjson.gz"), "ndjson", "gzip")
+    with gzip.open(output_path, "rt", encoding="utf-8") as f:
+        assert len(f.read().splitlines()) == 5
+    assert mapper.root_totals == TREE_TOTALS
+
+
+@pytest.fixture
+def qt_app():
+    pytest.importorskip("PyQt6")
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PyQt6.QtWidgets import QApplication
+    return QApplication.instance() or QApplication([])
+
+
+@pytest.mark.parametrize("fmt", list(MAP_FORMATS))
+def test_mapping_worker_writes_every_format(qt_app, tmp_path, fmt):
+    import Folder_mapper
+
+    build_tree(tmp_path)
+    worker = Folder_mapper.MappingWorker(str(tmp_path), fmt=fmt)
+    results = []
+    worker.finished.connect(lambda path, success: results.append((path, success)))
+    worker.run() # On this thread: the signals are delivered directly
+    expected_path = default_output_path(str(tmp_path), fmt)
+    assert results == [(expected_path, True)]
+    assert os.path.getsize(expected_path) > 0
+    assert worker.mapper.root_totals == TREE_TOTALS
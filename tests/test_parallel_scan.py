@@ -0,0 +1,50 @@
+"""Parallel scanning writes the same map as the sequential traversal."""
+import io
+import os
+
+import pytest
+
+from folder_mapper_core import SelectionTrie, StructureMapper
+
+
+def build_tree(root, depth=3, fanout=4, files=5):
+    pending = [(str(root), 0)]
+    while pending:
+        dir_path, level = pending.pop()
+        os.makedirs(dir_path, exist_ok=True)
+        for i in range(files):
+            with open(os.path.join(dir_path, f"file_{i}.txt"), "w", encoding="utf-8") as f:
+                f.write("x" * (i * 7 + level))
+        if level < depth:
+            pending.extend((os.path.join(dir_path, f"dir_{i}"), level + 1) for i in range(fanout))
+
+
+def map_text(root, workers, selection=None, fmt="txt"):
+    output = io.StringIO()
+    StructureMapper(str(root), selection, workers).write_to(output, fmt)
+    return [line for line in output.getvalue().splitlines() if not line.startswith("Fecha:")]
+
+
+@pytest.mark.parametrize("workers", [2, 8])
+def test_parallel_map_matches_sequential(tmp_path, workers):
+    build_tree(tmp_path)
+    sequential = map_text(tmp_path, 1)
+    assert len(sequential) > 400
+    assert map_text(tmp_path, workers) == sequential
+
+
+@pytest.mark.parametrize("fmt", ["ndjson", "csv", "json"])
+def test_parallel_export_matches_sequential(tmp_path, fmt):
+    build_tree(tmp_path, depth=2)
+    assert map_text(tmp_path, 4, fmt=fmt) == map_text(tmp_path, 1, fmt=fmt)
+
+
+def test_parallel_map_matches_sequential_with_selection(tmp_path):
+    build_tree(tmp_path)
+    selection = SelectionTrie(str(tmp_path))
+    selection.select(["dir_1"], False)
+    selection.select(["dir_1", "dir_2"], True)
+    selection.select(["dir_3", "dir_0", "file_1.txt"], False)
+    sequential = map_text(tmp_path, 1, selection)
+    assert map_text(tmp_path, 8, selection) == sequential
+    assert len(sequential) < len(map_text(tmp_path, 1))
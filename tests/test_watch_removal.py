@@ -0,0 +1,61 @@
+"""Watch mode: removing files and unloaded directories from the tree."""
+import os
+import shutil
+
+import pytest
+
+from folder_mapper_core import FLAG_LOADED, FLAG_REMOVED, ROOT_NODE, NodeStore
+
+
+def test_loaded_dirs_of_file_and_unloaded_directory(tmp_path):
+    store = NodeStore(str(tmp_path))
+    file_node = store.add(ROOT_NODE, "a.txt", False)
+    unloaded = store.add(ROOT_NODE, "pending", True)
+    loaded = store.add(ROOT_NODE, "src", True)
+    inner = store.add(loaded, "lib", True)
+    store.children[ROOT_NODE].extend([file_node, unloaded, loaded])
+    store.children[loaded].append(inner)
+    store.set_flag(loaded, FLAG_LOADED)
+
+    assert list(store.loaded_dirs(file_node)) == [file_node]
+    assert list(store.loaded_dirs(unloaded)) == [unloaded]
+    assert list(store.loaded_dirs(loaded)) == [loaded] # lib was never loaded
+
+
+@pytest.fixture
+def window(tmp_path):
+    pytest.importorskip("PyQt6")
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PyQt6.QtWidgets import QApplication
+    import Folder_mapper
+
+    app = QApplication.instance() or QApplication([])
+    mapper = Folder_mapper.EnhancedFolderMapper()
+    mapper.watch_checkbox.setChecked(True)
+    yield mapper
+    mapper.close()
+    app.processEvents()
+
+
+def test_watch_removes_file_and_unloaded_directory(window, tmp_path):
+    for name in ("keep.txt", "gone.txt"):
+        (tmp_path / name).write_text("x")
+    (tmp_path / "unloaded" / "inner").mkdir(parents=True)
+    (tmp_path / "loaded" / "inner").mkdir(parents=True)
+    root = str(tmp_path)
+    window.select_folder(root)
+    store = window.tree_model.store
+    nodes = {store.names[node]: node for node in store.children[ROOT_NODE]}
+    loaded_path = os.path.join(root, "loaded")
+    window._populate_tree_level(nodes["loaded"], loaded_path)
+    assert loaded_path in window._watched_dirs
+
+    (tmp_path / "gone.txt").unlink()
+    shutil.rmtree(tmp_path / "unloaded")
+    shutil.rmtree(tmp_path / "loaded")
+    assert window._refresh_tree_level(root)
+
+    assert sorted(store.names[node] for node in store.children[ROOT_NODE]) == ["keep.txt"]
+    for name in ("gone.txt", "unloaded", "loaded"):
+        assert store.has(nodes[name], FLAG_REMOVED)
+    assert loaded_path not in window._watched_dirs